@@ -1,6 +1,7 @@
 import os
 import time
 import json
+import functools
 from dotenv import load_dotenv
 
 # reduction algorithms
@@ -9,17 +10,29 @@ from sklearn.manifold import TSNE, SpectralEmbedding, Isomap, MDS
 from umap import UMAP
 
 # clustering algorithm
-from sklearn.cluster import DBSCAN, AffinityPropagation, KMeans, AgglomerativeClustering, SpectralClustering, OPTICS, Birch
+from sklearn.cluster import DBSCAN, AffinityPropagation, KMeans, SpectralClustering, OPTICS, Birch
 from sklearn.mixture import GaussianMixture
-from sklearn.metrics import silhouette_samples, calinski_harabasz_score, davies_bouldin_score
 
 # scheduler
 from celery import Celery
-from celery.signals import worker_process_init, worker_process_shutdown
+from celery.signals import worker_process_init, worker_process_shutdown, before_task_publish, task_prerun, task_postrun, task_revoked
 from celery_app import celeryconfig
 
 import utils.constants as constants
 from utils.storage import Storage
+from utils.storage_cache import cache_from_env
+from utils.embeddings import EmbeddingsCache, load_embeddings
+from utils.knn_graph import load_knn_graph, to_sparse_graph
+from utils.linkage import load_linkage, count_clusters, cut_linkage
+from utils.scoring import score_clusters
+from utils.optics import reachability_plot, encode_reachability, decode_reachability, extract_clusters
+from utils.shared_embeddings import SharedEmbeddings
+from utils.manifest import register_results
+from utils.demo import add_requested, get_user_demo_dir
+from utils.bundle import pack_bundle
+from utils.result_id import new_result_id
+from utils.progress import StageReporter
+from utils import task_registry
 
 # logging
 import logging
@@ -77,10 +90,23 @@ if not logger.handlers:
 celery = Celery()
 celery.config_from_object(celeryconfig)
 
+PROGRESS = 'PROGRESS'
+
 load_dotenv()
 load_dotenv(os.getenv('ENVIRONMENT_FILE'))
 
-storage = Storage(host=os.getenv('HOST'), storage_type=os.getenv('STORAGE_TYPE'))
+storage = Storage(host=os.getenv('HOST'), storage_type=os.getenv('STORAGE_TYPE'), cache=cache_from_env())
+
+# with shared memory enabled, worker processes map the same embeddings pages instead of holding a copy each
+shared_embeddings = None
+if os.getenv('EMBEDDINGS_SHARED_MEMORY', 'False').lower() == 'true':
+    shared_embeddings = SharedEmbeddings(directory=os.getenv('EMBEDDINGS_SHARED_MEMORY_DIR', '/dev/shm'))
+
+embeddings_cache = EmbeddingsCache(
+    max_bytes=int(os.getenv('EMBEDDINGS_CACHE_MAX_BYTES', 2 * 1024 ** 3)),
+    max_shared_bytes=int(os.getenv('EMBEDDINGS_SHARED_CACHE_MAX_BYTES', 16 * 1024 ** 3)),
+    on_evict=shared_embeddings.release if shared_embeddings is not None else None
+)
 
 
 @worker_process_init.connect
@@ -91,45 +117,173 @@ def init_worker(**kwargs):
     )
     logger.info(message='Storage client connected to nextcloud', action='storage_client_connected', status='SUCCESS', resource='lse-service', userid="celery")
 
+    if shared_embeddings is not None:
+        shared_embeddings.sweep()
+
 
 @worker_process_shutdown.connect
 def shutdown_worker(**kwargs):
+    if shared_embeddings is not None:
+        shared_embeddings.close()
+
     storage.disconnect()
     logger.info(message='Storage client disconnected to nextcloud', action='storage_client_disconnected', status='SUCCESS', resource='lse-service', userid="celery")
 
 
-@celery.task(name="reduction")
-def reduction(algorithm, components, params, experiment_id, user_id):
-    total_time = time.time()
-    if experiment_id.startswith('demo'):
-        experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        embeddings_path = os.path.join(
-            experiment_dir, constants.EMBEDDINGS_FILENAME)
+# keep the task registry up to date: tasks are registered by the publishing process and
+# updated by the worker running them
+
+@before_task_publish.connect
+def register_published_task(sender=None, headers=None, body=None, **kwargs):
+    if sender not in task_registry.TASK_NAMES:
+        return
+
+    # message protocol 2 carries (args, kwargs, embed), protocol 1 a dict
+    if isinstance(body, (tuple, list)):
+        task_id, task_kwargs = headers['id'], body[1]
     else:
-        user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
-        embeddings_path = os.path.join(
-            user_dir, experiment_id, constants.EMBEDDINGS_FILENAME)
+        task_id, task_kwargs = body['id'], body['kwargs']
 
-    embeddings = json.loads(storage.get_file(embeddings_path))
+    task_registry.register_task(task_id, sender, task_kwargs['user_id'], task_kwargs['experiment_id'])
 
-    start_time = time.time()
 
-    # calculate reduction
+@task_prerun.connect
+def start_registered_task(task_id=None, task=None, **kwargs):
+    if task.name in task_registry.TASK_NAMES:
+        task_registry.update_task(task_id, state='STARTED', started=time.time())
+
+
+@task_postrun.connect
+def finish_registered_task(task_id=None, task=None, retval=None, state=None, **kwargs):
+    if task.name in task_registry.TASK_NAMES:
+        result_id = retval['result_id'] if state == 'SUCCESS' else None
+        task_registry.unregister_task(task_id, state=state, result_id=result_id, finished=time.time())
+
+
+def stage_reporter(task):
+    # stages go to the result backend, read by GET /tasks/{task_id}, and to the task events stream
+    def report(meta):
+        if task.request.id is None:
+            return
+
+        task.update_state(state=PROGRESS, meta=meta)
+        task_registry.update_task(task.request.id, stage=meta['stage'], progress=meta['progress'])
+
+    return StageReporter(report)
+
+
+@task_revoked.connect
+def revoke_registered_task(request=None, **kwargs):
+    task_registry.unregister_task(request.id, state='REVOKED', finished=time.time())
+
+
+def raise_first_error(results):
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+
+
+def publish_result(results_dir, result_id, staging_id, files):
+    # upload every file in parallel into a staging dir, hidden from listings, then publish the
+    # result with a single move so readers never see it half written
+    staging_dir = os.path.join(results_dir, constants.STAGING_DIR_PREFIX + staging_id)
+    result_dir = os.path.join(results_dir, result_id)
+
+    try:
+        storage.mkdir(staging_dir)
+        raise_first_error(storage.put_many([(os.path.join(staging_dir, file_name), file_data) for file_name, file_data in files]))
+        storage.move(staging_dir, result_dir)
+
+    except Exception:
+        try:
+            storage.delete(staging_dir)
+        except Exception as exception:
+            logger.warning(message='Staging dir cleanup failed: {}'.format(exception), action='publish_result', status='FAILED', resource='lse-service', userid='celery', path=staging_dir)
+        raise
+
+    return result_dir
+
+
+def register(results_dir, results, experiment_id, user_id, results_type):
+    register_results(storage, results_dir, results)
+
+    # shared demo results are listed for the users who requested them
+    if experiment_id.startswith('demo'):
+        try:
+            add_requested(storage, experiment_id, user_id, results_type, list(results))
+        except Exception as exception:
+            logger.error(message='Requested results not recorded: {}'.format(exception), action='register', status='FAILED', resource='lse-service', userid=user_id, path=results_dir)
+
+
+def get_source_dirs(results_dir, experiment_id, user_id):
+    # where results read by other tasks are looked up, as routers find them
+    if experiment_id.startswith('demo'):
+        return [results_dir, os.path.join(get_user_demo_dir(experiment_id, user_id), os.path.basename(results_dir))]
+
+    return [results_dir]
+
+
+def read_source(source_dirs, result_id, file_name):
+    # the file of the first dir holding the result
+    for source_dir in source_dirs[:-1]:
+        file_path = os.path.join(source_dir, result_id, file_name)
+        if storage.file_exist(file_path, cache=False):
+            return storage.get_file(file_path)
+
+    return storage.get_file(os.path.join(source_dirs[-1], result_id, file_name))
+
+
+def get_experiment_dir(experiment_id, user_id):
+    if experiment_id.startswith('demo'):
+        return os.path.join(constants.DEMO_DIR, experiment_id)
+
+    user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
+    return os.path.join(user_dir, experiment_id)
+
+
+def remember(warm, key, compute):
+    # warm keeps what the next points of a sweep can reuse, keyed by the params it depends on
+    if key not in warm:
+        warm[key] = compute()
+    return warm[key]
+
+
+def compute_reduction(algorithm, components, params, embeddings, experiment_dir, random_state, stage, warm=None):
+    # the reduction and the criteria of the fitted estimator, if it has any
+    warm = {} if warm is None else warm
+    criteria = {}
+
+    # neighbours graph shared by the estimators of the experiment, None to let them search
+
+    knn = None
+    if algorithm in ('umap', 'isomap'):
+        # Isomap counts neighbours without the sample itself
+        n_neighbors = params['neighbors'] + (algorithm == 'isomap')
+        knn = remember(warm, ('knn', params['metric'], n_neighbors), lambda: load_knn_graph(
+            storage, experiment_dir, embeddings, params['metric'], n_neighbors, random_state, on_stage=stage))
+
+    stage('fitting')
 
     if algorithm == 'pca':
-        reduction = PCA(
-            n_components=components
-        ).fit_transform(embeddings)
+        estimator = PCA(
+            n_components=components,
+            random_state=random_state
+        )
+        reduction = estimator.fit_transform(embeddings)
+        criteria['explained_variance'] = float(estimator.explained_variance_ratio_.sum())
 
     elif algorithm == 'tsne':
-        reduction = TSNE(
+        estimator = TSNE(
             n_components=components,
             perplexity=params['perplexity'],
             n_iter=params['iterations'],
             learning_rate=params['learning_rate'],
             metric=params['metric'],
-            init=params['init']
-        ).fit_transform(embeddings)
+            init=params['init'],
+            random_state=random_state
+        )
+        reduction = estimator.fit_transform(embeddings)
+        criteria['kl_divergence'] = float(estimator.kl_divergence_)
 
     elif algorithm == 'umap':
         reduction = UMAP(
@@ -137,54 +291,54 @@ def reduction(algorithm, components, params, experiment_id, user_id):
             n_neighbors=params['neighbors'],
             min_dist=params['min_distance'],
             metric=params['metric'],
-            densmap=params['densmap']
+            densmap=params['densmap'],
+            precomputed_knn=knn + (None,) if knn is not None else (None, None, None),
+            random_state=random_state
         ).fit_transform(embeddings)
 
     elif algorithm == 'truncated_svd':
-        reduction = TruncatedSVD(
+        estimator = TruncatedSVD(
             n_components=components,
-        ).fit_transform(embeddings)
+            random_state=random_state
+        )
+        reduction = estimator.fit_transform(embeddings)
+        criteria['explained_variance'] = float(estimator.explained_variance_ratio_.sum())
 
     elif algorithm == 'spectral_embedding':
+        # its n_samples / 10 neighbours exceed what the graph cache stores once it would be used
         reduction = SpectralEmbedding(
             n_components=components,
-            affinity=params['affinity']
+            affinity=params['affinity'],
+            random_state=random_state
         ).fit_transform(embeddings)
 
     elif algorithm == 'isomap':
-        reduction = Isomap(
+        estimator = Isomap(
             n_components=components,
             n_neighbors=params['neighbors'],
-            metric=params['metric']
-        ).fit_transform(embeddings)
+            metric='precomputed' if knn is not None else params['metric']
+        )
+        reduction = estimator.fit_transform(to_sparse_graph(*knn) if knn is not None else embeddings)
+        criteria['reconstruction_error'] = float(estimator.reconstruction_error())
 
     elif algorithm == 'mds':
-        reduction = MDS(
-            n_components=components
-        ).fit_transform(embeddings)
-
-    end_time = time.time()
-
-    # setup result
-
-    result_id = str(int(time.time()))
-    if experiment_id.startswith('demo'):
-        user_demo_dir = 'data-{}'.format(user_id)
-        result_dir = os.path.join(
-            experiment_dir, user_demo_dir, constants.REDUCTION_DIR, result_id)
-    else:
-        result_dir = os.path.join(
-            user_dir, experiment_id, constants.REDUCTION_DIR, result_id)
-
-    storage.mkdir(result_dir)
+        estimator = MDS(
+            n_components=components,
+            random_state=random_state
+        )
+        reduction = estimator.fit_transform(embeddings)
+        criteria['stress'] = float(estimator.stress_)
 
-    # save reduction
+    return reduction, criteria
 
-    reduction_file = os.path.join(result_dir, constants.REDUCTION_FILENAME)
 
-    storage.put_file(reduction_file, json.dumps(reduction.tolist()))
+def run_reduction(task, stage, algorithm, components, params, embeddings, experiment_dir, results_dir, random_state, key, warm=None, sweep_id=None):
+    # computes and publishes one reduction, returns its id, metadata, criteria and fitting time
+    start_time = time.time()
+    reduction, criteria = compute_reduction(algorithm, components, params, embeddings, experiment_dir, random_state, stage, warm)
+    end_time = time.time()
 
-    # save metadata
+    result_id = new_result_id()
 
     metadata = {
         'algorithm': algorithm,
@@ -192,35 +346,124 @@ def reduction(algorithm, components, params, experiment_id, user_id):
         'params': params,
         'start_datetime': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start_time)),
         'end_datetime': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(end_time)),
-        'seconds_elapsed': int(end_time - start_time)
+        'seconds_elapsed': int(end_time - start_time),
+        'random_state': random_state,
+        'key': key
     }
+    if sweep_id is not None:
+        metadata['sweep'] = sweep_id
+
+    # save reduction and metadata
+
+    stage('uploading')
+    publish_result(results_dir, result_id, task.request.id or result_id, [
+        (constants.REDUCTION_FILENAME, json.dumps(reduction.tolist())),
+        (constants.METADATA_FILENAME, json.dumps(metadata))
+    ])
+
+    return result_id, metadata, criteria, end_time - start_time
 
-    metadata_path = os.path.join(result_dir, constants.METADATA_FILENAME)
-    storage.put_file(metadata_path, json.dumps(metadata))
+
+@celery.task(name="reduction", bind=True)
+def reduction(self, algorithm, components, params, experiment_id, user_id, random_state=None, key=None):
+    total_time = time.time()
+    stage = stage_reporter(self)
+    experiment_dir = get_experiment_dir(experiment_id, user_id)
+
+    # demo results are shared by every user
+    results_dir = os.path.join(experiment_dir, constants.REDUCTION_DIR)
+
+    embeddings = load_embeddings(storage, experiment_dir, cache=embeddings_cache, shared=shared_embeddings, on_stage=stage)
+
+    result_id, metadata, _, seconds = run_reduction(self, stage, algorithm, components, params, embeddings, experiment_dir, results_dir, random_state, key)
+
+    # register result
+
+    stage('registering')
+    register(results_dir, {result_id: metadata}, experiment_id, user_id, constants.REDUCTION_DIR)
 
     elapsed = time.time() - total_time
-    logger.info(message='Reduction completed and uploaded', action='reduction_completed', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
-    logger.accounting(message='Computed reduction task', action='Reduction', value=(end_time - start_time)*1000, measure="time", resource='lse', userid=user_id)
-    return result_id
+    logger.info(message='Reduction completed and uploaded', action='reduction_completed', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed, **embeddings_cache.stats())
+    logger.accounting(message='Computed reduction task', action='Reduction', value=seconds*1000, measure="time", resource='lse', userid=user_id)
+    return {'result_id': result_id, 'stages': stage.finish()}
 
 
-@celery.task(name="cluster")
-def cluster(algorithm, params, experiment_id, user_id):
+@celery.task(name="reduction_sweep", bind=True)
+def reduction_sweep(self, algorithm, points, experiment_id, user_id, random_state=None, keys=None):
+    # one reduction per point {"components", "params"} of the grid, on a single embeddings load
     total_time = time.time()
-    if experiment_id.startswith('demo'):
-        experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        embeddings_path = os.path.join(
-            experiment_dir, constants.EMBEDDINGS_FILENAME)
-    else:
-        user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
-        embeddings_path = os.path.join(
-            user_dir, experiment_id, constants.EMBEDDINGS_FILENAME)
+    stage = stage_reporter(self)
+    experiment_dir = get_experiment_dir(experiment_id, user_id)
+    results_dir = os.path.join(experiment_dir, constants.REDUCTION_DIR)
+
+    embeddings = load_embeddings(storage, experiment_dir, cache=embeddings_cache, shared=shared_embeddings, on_stage=stage)
+
+    sweep_id = new_result_id()
+    warm = {}
+    results = {}
+    summary = []
+    seconds = 0
+
+    for index, point in enumerate(points):
+        point_stage = functools.partial(stage, done=index, total=len(points))
+        key = keys[index] if keys else None
+
+        result_id, metadata, criteria, point_seconds = run_reduction(
+            self, point_stage, algorithm, point['components'], point['params'], embeddings,
+            experiment_dir, results_dir, random_state, key, warm=warm, sweep_id=sweep_id
+        )
+
+        # registered as soon as published, so a sweep cancelled later still lists it
+        point_stage('registering')
+        register(results_dir, {result_id: metadata}, experiment_id, user_id, constants.REDUCTION_DIR)
+
+        results[result_id] = metadata
+        seconds += point_seconds
+        summary.append({
+            'result_id': result_id,
+            'components': point['components'],
+            'params': point['params'],
+            'seconds_elapsed': metadata['seconds_elapsed'],
+            'scores': criteria
+        })
+
+    # summary of the sweep
+
+    stage('registering')
+    storage.put_file(os.path.join(results_dir, constants.SWEEP_FILENAME.format(sweep_id)), json.dumps({
+        'algorithm': algorithm,
+        'random_state': random_state,
+        'points': summary
+    }))
 
-    embeddings = json.loads(storage.get_file(embeddings_path))
+    elapsed = time.time() - total_time
+    logger.info(message='Reduction sweep of {} points completed and uploaded'.format(len(points)), action='reduction_sweep_completed', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed, **embeddings_cache.stats())
+    logger.accounting(message='Computed reduction sweep task', action='Reduction', value=seconds*1000, measure="time", resource='lse', userid=user_id)
+    return {'result_id': sweep_id, 'result_ids': list(results), 'stages': stage.finish()}
 
-    start_time = time.time()
 
-    # calculate clusters
+def compute_clusters(algorithm, params, embeddings, experiment_dir, random_state, stage, warm=None, source_dirs=()):
+    # the groups, the encoded reachability plot of OPTICS results and the criteria of the
+    # fitted estimator, if it has any. source_dirs are the clusters dirs extractions read from
+    warm = {} if warm is None else warm
+    reachability = None
+    criteria = {}
+
+    # neighbours graph shared by the estimators of the experiment, None to let them search
+
+    knn = None
+    if algorithm == 'spectral_clustering' and params['affinity'] == 'nearest_neighbors':
+        knn = remember(warm, ('knn', 'euclidean', params['n_neighbors']), lambda: load_knn_graph(
+            storage, experiment_dir, embeddings, 'euclidean', params['n_neighbors'], random_state, on_stage=stage))
+
+    # merge tree of the experiment, every threshold is a cut of it
+
+    tree = None
+    if algorithm == 'agglomerative_clustering':
+        tree = remember(warm, ('linkage', params['affinity'], params['linkage']), lambda: load_linkage(
+            storage, experiment_dir, embeddings, params['affinity'], params['linkage'], on_stage=stage))
+
+    stage('fitting')
 
     if algorithm == 'dbscan':
         clusters = DBSCAN(
@@ -230,111 +473,227 @@ def cluster(algorithm, params, experiment_id, user_id):
         ).fit_predict(embeddings)
 
     elif algorithm == 'affinity_propagation':
-        clusters = AffinityPropagation().fit_predict(embeddings)
+        clusters = AffinityPropagation(
+            random_state=random_state
+        ).fit_predict(embeddings)
 
     elif algorithm == 'kmeans':
-        clusters = KMeans(
-            n_clusters=params['n_clusters']
-        ).fit_predict(embeddings)
+        estimator = KMeans(
+            n_clusters=params['n_clusters'],
+            random_state=random_state
+        )
+        clusters = estimator.fit_predict(embeddings)
+        criteria['inertia'] = float(estimator.inertia_)
 
     elif algorithm == 'agglomerative_clustering':
-        clusters = AgglomerativeClustering(
-            n_clusters=None,
-            distance_threshold=params['distance_threshold'],
-            affinity=params['affinity'],
-            linkage=params['linkage']
-        ).fit_predict(embeddings)
+        children, distances, _ = tree
+        clusters = cut_linkage(
+            children,
+            params.get('n_clusters') or count_clusters(distances, params['distance_threshold'])
+        )
 
     elif algorithm == 'spectral_clustering':
         clusters = SpectralClustering(
             n_clusters=params['n_clusters'],
-            affinity=params['affinity'],
-            n_neighbors=params['neighbors']
-        ).fit_predict(embeddings)
+            affinity='precomputed_nearest_neighbors' if knn is not None else params['affinity'],
+            n_neighbors=params['n_neighbors'],
+            random_state=random_state
+        ).fit_predict(to_sparse_graph(*knn) if knn is not None else embeddings)
 
     elif algorithm == 'optics':
         if params['min_cluster_size'] == 0:
             params['min_cluster_size'] = None
 
-        clusters = OPTICS(
-            min_samples=params['min_samples'],
-            metric=params['metric'],
-            cluster_method=params['cluster_method'],
+        # the reachability plot only depends on min_samples and metric, other points extract from it
+        plot = warm.get(('optics', params['min_samples'], params['metric']))
+
+        if plot is None:
+            optics = OPTICS(
+                min_samples=params['min_samples'],
+                metric=params['metric'],
+                cluster_method=params['cluster_method'],
+                min_cluster_size=params['min_cluster_size']
+            ).fit(embeddings)
+
+            clusters = optics.labels_
+            plot = warm[('optics', params['min_samples'], params['metric'])] = reachability_plot(optics)
+        else:
+            clusters = extract_clusters(plot, params['cluster_method'], min_cluster_size=params['min_cluster_size'])
+
+        reachability = encode_reachability(plot)
+
+    elif algorithm == 'optics_extract':
+        if params['min_cluster_size'] == 0:
+            params['min_cluster_size'] = None
+
+        # the reachability plot of an OPTICS result, kept with this result too
+        reachability = remember(warm, ('reachability', params['cluster_id']), lambda: read_source(
+            source_dirs, params['cluster_id'], constants.REACHABILITY_FILENAME))
+
+        clusters = extract_clusters(
+            decode_reachability(reachability),
+            params['cluster_method'],
+            eps=params['eps'],
+            xi=params['xi'],
             min_cluster_size=params['min_cluster_size']
-        ).fit_predict(embeddings)
+        )
 
     elif algorithm == 'gaussian_mixture':
-        clusters = GaussianMixture(
+        estimator = GaussianMixture(
             n_components=params['n_components'],
             init_params=params['init_params'],
-        ).fit_predict(embeddings)
+            random_state=random_state
+        )
+        clusters = estimator.fit_predict(embeddings)
+        criteria['bic'] = float(estimator.bic(embeddings))
+        criteria['aic'] = float(estimator.aic(embeddings))
 
     elif algorithm == 'birch':
         if params['n_clusters'] == 0:
             params['n_clusters'] = None
 
-        clusters = Birch(
-            n_clusters=params['n_clusters'],
-            threshold=params['threshold']
-        ).fit_predict(embeddings)
+        # the CF tree only depends on threshold, other points only redo the global clustering
+        birch = warm.get(('birch', params['threshold']))
 
-    # calculate silhouettes
+        if birch is None:
+            birch = warm[('birch', params['threshold'])] = Birch(
+                n_clusters=params['n_clusters'],
+                threshold=params['threshold']
+            ).fit(embeddings)
+        else:
+            birch.set_params(n_clusters=params['n_clusters']).partial_fit()
 
-    silhouettes = []
-    if 2 <= len(set(clusters)) < len(embeddings):
-        silhouettes = silhouette_samples(embeddings, clusters)
-        silhouettes = silhouettes.tolist()
+        clusters = birch.predict(embeddings)
 
-    # calculate scores
+    return clusters, reachability, criteria
 
-    scores = {}
-    if 2 <= len(set(clusters)) < len(embeddings):
-        scores = {
-            'calinski_harabasz_score': calinski_harabasz_score(embeddings, clusters),
-            'davies_bouldin_score': davies_bouldin_score(embeddings, clusters)
-        }
 
+def run_clusters(task, stage, algorithm, params, embeddings, experiment_dir, results_dir, random_state, key, scoring=None, warm=None, sweep_id=None, source_dirs=()):
+    # computes, scores and publishes one clustering, returns its id, metadata, scores with the
+    # criteria of the estimator, and fitting time
+    start_time = time.time()
+    clusters, reachability, criteria = compute_clusters(algorithm, params, embeddings, experiment_dir, random_state, stage, warm, source_dirs)
+
+    stage('scoring')
+    scoring, silhouettes, cluster_silhouettes, scores = score_clusters(embeddings, clusters, scoring, random_state)
     end_time = time.time()
 
-    # setup result
+    result_id = new_result_id()
 
-    result_id = str(int(time.time()))
-    if experiment_id.startswith('demo'):
-        user_demo_dir = 'data-{}'.format(user_id)
-        result_dir = os.path.join(
-            experiment_dir, user_demo_dir, constants.CLUSTER_DIR, result_id)
-    else:
-        result_dir = os.path.join(
-            user_dir, experiment_id, constants.CLUSTER_DIR, result_id)
+    metadata = {
+        'algorithm': algorithm,
+        'params': params,
+        'start_datetime': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start_time)),
+        'end_datetime': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start_time)),
+        'seconds_elapsed': int(end_time - start_time),
+        'random_state': random_state,
+        'key': key,
+        'scoring': scoring
+    }
+    if sweep_id is not None:
+        metadata['sweep'] = sweep_id
 
-    storage.mkdir(result_dir)
+    # save clustering, every part goes in a single bundle upload
 
-    # save clustering
+    bundle = pack_bundle([
+        ('metadata', json.dumps(metadata)),
+        ('groups', json.dumps(clusters.tolist())),
+        ('scores', json.dumps(scores)),
+        ('silhouettes', json.dumps(silhouettes)),
+        ('cluster_silhouettes', json.dumps(cluster_silhouettes))
+    ])
 
-    cluster_file = os.path.join(result_dir, constants.CLUSTER_FILENAME)
-    storage.put_file(cluster_file, json.dumps(clusters.tolist()))
+    files = [(constants.CLUSTER_BUNDLE_FILENAME, bundle)]
+    if reachability is not None:
+        files.append((constants.REACHABILITY_FILENAME, reachability))
 
-    silhouette_file = os.path.join(result_dir, constants.SILHOUETTE_FILENAME)
-    storage.put_file(silhouette_file, json.dumps(silhouettes))
+    stage('uploading')
+    publish_result(results_dir, result_id, task.request.id or result_id, files)
 
-    scores_file = os.path.join(result_dir, constants.SCORES_FILENAME)
-    storage.put_file(scores_file, json.dumps(scores))
+    groups = set(clusters.tolist())
+    summary = dict(scores, n_clusters=len(groups - {-1}), noise=int((clusters == -1).sum()), **criteria)
 
-    # save metadata
+    return result_id, metadata, summary, end_time - start_time
 
-    metadata = {
-        'algorithm': algorithm,
-        'params': params,
-        'start_datetime': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start_time)),
-        'end_datetime': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start_time)),
-        'seconds_elapsed': int(end_time - start_time)
-    }
 
-    metadata_path = os.path.join(result_dir, constants.METADATA_FILENAME)
-    storage.put_file(metadata_path, json.dumps(metadata))
+@celery.task(name="cluster", bind=True)
+def cluster(self, algorithm, params, experiment_id, user_id, random_state=None, key=None, scoring=None):
+    total_time = time.time()
+    stage = stage_reporter(self)
+    experiment_dir = get_experiment_dir(experiment_id, user_id)
+
+    # demo results are shared by every user
+    results_dir = os.path.join(experiment_dir, constants.CLUSTER_DIR)
+
+    embeddings = load_embeddings(storage, experiment_dir, cache=embeddings_cache, shared=shared_embeddings, on_stage=stage)
+
+    result_id, metadata, _, seconds = run_clusters(
+        self, stage, algorithm, params, embeddings, experiment_dir, results_dir, random_state, key, scoring,
+        source_dirs=get_source_dirs(results_dir, experiment_id, user_id)
+    )
+
+    # register result
+
+    stage('registering')
+    register(results_dir, {result_id: metadata}, experiment_id, user_id, constants.CLUSTER_DIR)
+
+    elapsed = time.time() - total_time
+    logger.info(message='Clustering completed and uploaded', action='clustering_completed', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed, **embeddings_cache.stats())
+    logger.accounting(message='Computed cluster task', action='Clustering', value=seconds*1000, measure="time", resource='lse', userid=user_id)
+
+    return {'result_id': result_id, 'stages': stage.finish()}
+
+
+@celery.task(name="cluster_sweep", bind=True)
+def cluster_sweep(self, algorithm, points, experiment_id, user_id, random_state=None, keys=None, scoring=None):
+    # one clustering per point {"params"} of the grid, on a single embeddings load
+    total_time = time.time()
+    stage = stage_reporter(self)
+    experiment_dir = get_experiment_dir(experiment_id, user_id)
+    results_dir = os.path.join(experiment_dir, constants.CLUSTER_DIR)
+
+    embeddings = load_embeddings(storage, experiment_dir, cache=embeddings_cache, shared=shared_embeddings, on_stage=stage)
+
+    sweep_id = new_result_id()
+    warm = {}
+    results = {}
+    summary = []
+    seconds = 0
+    source_dirs = get_source_dirs(results_dir, experiment_id, user_id)
+
+    for index, point in enumerate(points):
+        point_stage = functools.partial(stage, done=index, total=len(points))
+        key = keys[index] if keys else None
+
+        result_id, metadata, scores, point_seconds = run_clusters(
+            self, point_stage, algorithm, point['params'], embeddings,
+            experiment_dir, results_dir, random_state, key, scoring, warm=warm, sweep_id=sweep_id, source_dirs=source_dirs
+        )
+
+        # registered as soon as published, so a sweep cancelled later still lists it
+        point_stage('registering')
+        register(results_dir, {result_id: metadata}, experiment_id, user_id, constants.CLUSTER_DIR)
+
+        results[result_id] = metadata
+        seconds += point_seconds
+        summary.append({
+            'result_id': result_id,
+            'params': point['params'],
+            'seconds_elapsed': metadata['seconds_elapsed'],
+            'scores': scores
+        })
+
+    # summary of the sweep
+
+    stage('registering')
+    storage.put_file(os.path.join(results_dir, constants.SWEEP_FILENAME.format(sweep_id)), json.dumps({
+        'algorithm': algorithm,
+        'random_state': random_state,
+        'points': summary
+    }))
 
     elapsed = time.time() - total_time
-    logger.info(message='Clustering completed and uploaded', action='clustering_completed', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
-    logger.accounting(message='Computed cluster task', action='Clustering', value=(end_time - start_time)*1000, measure="time", resource='lse', userid=user_id)
+    logger.info(message='Cluster sweep of {} points completed and uploaded'.format(len(points)), action='cluster_sweep_completed', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed, **embeddings_cache.stats())
+    logger.accounting(message='Computed cluster sweep task', action='Clustering', value=seconds*1000, measure="time", resource='lse', userid=user_id)
 
-    return result_id
+    return {'result_id': sweep_id, 'result_ids': list(results), 'stages': stage.finish()}
@@ -16,6 +16,8 @@ from routers import experiment, reduction, cluster, label, task, image, status
 
 # other
 from utils.storage import Storage
+from utils.storage_async import AsyncStorage
+from utils.storage_cache import cache_from_env
 from utils.authorization import AuthError
 
 # logging
@@ -75,7 +77,7 @@ if not logger.handlers:
 load_dotenv()
 load_dotenv(os.getenv('ENVIRONMENT_FILE'))
 
-storage = Storage(host=os.getenv('HOST'), storage_type=os.getenv('STORAGE_TYPE'))
+storage = AsyncStorage(Storage(host=os.getenv('HOST'), storage_type=os.getenv('STORAGE_TYPE'), cache=cache_from_env()))
 app = FastAPI(root_path=os.getenv('APP_SERVER_ROOT_PATH'))
 
 
@@ -173,7 +175,7 @@ app.include_router(status.router)
 async def startup():
     if os.getenv('STORAGE_TYPE') == 'nextcloud':
       initial_time = time.time()
-      storage.connect(
+      await storage.connect(
         user=os.getenv('USER'),
         password=os.getenv('PASSWORD'),
       )
@@ -186,7 +188,7 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     if os.getenv('STORAGE_TYPE') == 'nextcloud':
-      storage.disconnect()
+      await storage.disconnect()
       logger.info(message='Storage client disconnected from nextcloud', action='storage_client_disconnected', resource='lse-service', userid="Server")
 
 
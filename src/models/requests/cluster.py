@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Literal
+from pydantic import BaseModel, Field, root_validator
+from typing import Any, Dict, List, Literal, Optional
+
+from utils.result_id import RESULT_ID_PATTERN
 
 
 ###############################################################################
@@ -23,10 +25,17 @@ class KMeans(BaseModel):
 
 
 class AgglomerativeClustering(BaseModel):
-    distance_threshold: int = Field(ge=1, le=10000)
+    distance_threshold: Optional[int] = Field(None, ge=1, le=10000)
+    n_clusters: Optional[int] = Field(None, ge=1, le=10000)
     affinity: Literal['euclidean', 'cosine', 'manhattan']
     linkage: Literal['ward', 'complete', 'average', 'single']
 
+    @root_validator(skip_on_failure=True)
+    def check_cut(cls, values):
+        if (values['distance_threshold'] is None) == (values['n_clusters'] is None):
+            raise ValueError('Exactly one of distance_threshold and n_clusters must be given')
+        return values
+
 
 class SpectralClustering(BaseModel):
     n_clusters: int = Field(ge=1, le=100)
@@ -42,6 +51,14 @@ class OPTICS(BaseModel):
     min_cluster_size: float = Field(ge=0, le=1)
 
 
+class OPTICSExtract(BaseModel):
+    cluster_id: str = Field(regex=RESULT_ID_PATTERN)
+    cluster_method: Literal['xi', 'dbscan']
+    eps: Optional[float] = Field(None, ge=0, le=10000)
+    xi: float = Field(0.05, ge=0, le=1)
+    min_cluster_size: float = Field(ge=0, le=1)
+
+
 class GaussianMixture(BaseModel):
     n_components: int = Field(ge=1, le=100)
     init_params: Literal['kmeans', 'random']
@@ -57,41 +74,74 @@ class Birch(BaseModel):
 ###############################################################################
 
 
-class DBSCANModel(BaseModel):
+Scoring = Literal['auto', 'exact', 'sampled', 'off']
+
+
+class ClusterBaseModel(BaseModel):
+    scoring: Optional[Scoring] = None
+
+
+class DBSCANModel(ClusterBaseModel):
     algorithm: Literal['dbscan']
     params: DBSCAN
 
 
-class AffinityPropagationModel(BaseModel):
+class AffinityPropagationModel(ClusterBaseModel):
     algorithm: Literal['affinity_propagation']
     params: AffinityPropagation
 
 
-class KMeansModel(BaseModel):
+class KMeansModel(ClusterBaseModel):
     algorithm: Literal['kmeans']
     params: KMeans
 
 
-class AgglomerativeClusteringModel(BaseModel):
+class AgglomerativeClusteringModel(ClusterBaseModel):
     algorithm: Literal['agglomerative_clustering']
     params: AgglomerativeClustering
 
 
-class SpectralClusteringModel(BaseModel):
+class SpectralClusteringModel(ClusterBaseModel):
     algorithm: Literal['spectral_clustering']
     params: SpectralClustering
 
 
-class OPTICSModel(BaseModel):
+class OPTICSModel(ClusterBaseModel):
     algorithm: Literal['optics']
     params: OPTICS
 
 
-class GaussianMixtureModel(BaseModel):
+class OPTICSExtractModel(ClusterBaseModel):
+    algorithm: Literal['optics_extract']
+    params: OPTICSExtract
+
+
+class GaussianMixtureModel(ClusterBaseModel):
     algorithm: Literal['gaussian_mixture']
     params: GaussianMixture
 
 
-class BirchModel(BaseModel):
+class BirchModel(ClusterBaseModel):
     algorithm: Literal['birch']
     params: Birch
+
+
+CLUSTER_MODELS = {
+    'dbscan': DBSCANModel,
+    'affinity_propagation': AffinityPropagationModel,
+    'kmeans': KMeansModel,
+    'agglomerative_clustering': AgglomerativeClusteringModel,
+    'spectral_clustering': SpectralClusteringModel,
+    'optics': OPTICSModel,
+    'optics_extract': OPTICSExtractModel,
+    'gaussian_mixture': GaussianMixtureModel,
+    'birch': BirchModel
+}
+
+
+class ClusterSweepModel(BaseModel):
+    algorithm: Literal['dbscan', 'affinity_propagation', 'kmeans', 'agglomerative_clustering', 'spectral_clustering',
+                       'optics', 'optics_extract', 'gaussian_mixture', 'birch']
+    params: dict = {}
+    grid: Dict[str, List[Any]]
+    scoring: Optional[Scoring] = None
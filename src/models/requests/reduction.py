@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Any, Dict, List, Literal
 
 
 ###############################################################################
@@ -91,3 +91,21 @@ class MDSModel(BaseModel):
     algorithm: Literal['mds']
     components: int = Field(ge=2, le=3)
     params: MDS
+
+
+REDUCTION_MODELS = {
+    'pca': PCAModel,
+    'tsne': TSNEModel,
+    'umap': UMAPModel,
+    'truncated_svd': TruncatedSVDModel,
+    'spectral_embedding': SpectralEmbeddingModel,
+    'isomap': IsomapModel,
+    'mds': MDSModel
+}
+
+
+class ReductionSweepModel(BaseModel):
+    algorithm: Literal['pca', 'tsne', 'umap', 'truncated_svd', 'spectral_embedding', 'isomap', 'mds']
+    components: int = Field(2, ge=2, le=3)
+    params: dict = {}
+    grid: Dict[str, List[Any]]
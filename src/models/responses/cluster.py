@@ -1,4 +1,4 @@
-from typing import List, Union
+from typing import List, Optional, Tuple, Union
 from pydantic import BaseModel
 
 
@@ -13,11 +13,22 @@ class Metadata(BaseModel):
     start_datetime: str
     end_datetime: str
     seconds_elapsed: int
+    scoring: Optional[str]
+
+
+class SweepPoint(BaseModel):
+    result_id: str
+    params: dict
+    seconds_elapsed: int
+    scores: dict
 
 
 class Scores(BaseModel):
     calinski_harabasz_score: float
     davies_bouldin_score: float
+    silhouette_score: Optional[float]
+    silhouette_stderr: Optional[float]
+    silhouette_sample_size: Optional[int]
 
 
 ###############################################################################
@@ -31,11 +42,29 @@ class ClusterBaseModel(BaseModel):
 
 
 class ClusterModel(BaseModel):
-    metadata: Metadata
-    groups: List[int]
-    silhouettes: Union[List, List[float]]
-    scores: Union[dict, Scores]
+    metadata: Optional[Metadata]
+    groups: Optional[List[int]]
+    silhouettes: Optional[Union[List, List[float]]]
+    cluster_silhouettes: Optional[List[dict]]
+    scores: Optional[Union[dict, Scores]]
 
 
 class ClusterPendingModel(BaseModel):
     count: int
+
+
+class ClusterHierarchyModel(BaseModel):
+    samples: int
+    leaves: List[int]
+    merges: List[Tuple[int, int, float, int]]
+
+
+class ClusterCutModel(BaseModel):
+    n_clusters: int
+    groups: List[int]
+
+
+class ClusterSweepSummaryModel(BaseModel):
+    algorithm: str
+    random_state: Optional[int]
+    points: List[SweepPoint]
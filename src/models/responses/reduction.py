@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -16,6 +16,14 @@ class Metadata(BaseModel):
     seconds_elapsed: int
 
 
+class SweepPoint(BaseModel):
+    result_id: str
+    components: int
+    params: dict
+    seconds_elapsed: int
+    scores: dict
+
+
 ###############################################################################
 # Models
 ###############################################################################
@@ -34,3 +42,9 @@ class ReductionModel(BaseModel):
 
 class ReductionPendingModel(BaseModel):
     count: int
+
+
+class ReductionSweepSummaryModel(BaseModel):
+    algorithm: str
+    random_state: Optional[int]
+    points: List[SweepPoint]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict
 
 
 ###############################################################################
@@ -16,3 +16,6 @@ class TaskModel(BaseModel):
     status: str
     name: Optional[str]
     result_id: Optional[str]
+    stage: Optional[str]
+    stages: Optional[Dict[str, float]]
+    progress: Optional[dict]
@@ -1,19 +1,32 @@
 import os
 import json
 import time
+import asyncio
+import functools
 
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import JSONResponse
-from typing import Union, List
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from typing import Union, List, Optional, Literal
 
 from celery_app import tasks
-from models.requests.cluster import DBSCANModel, AffinityPropagationModel, KMeansModel, AgglomerativeClusteringModel, SpectralClusteringModel, OPTICSModel, GaussianMixtureModel, BirchModel
-from models.responses.cluster import ClusterBaseModel, ClusterModel, ClusterPendingModel
+from models.requests.cluster import DBSCANModel, AffinityPropagationModel, KMeansModel, AgglomerativeClusteringModel, SpectralClusteringModel, OPTICSModel, OPTICSExtractModel, GaussianMixtureModel, BirchModel, CLUSTER_MODELS, ClusterSweepModel
+from models.responses.cluster import ClusterBaseModel, ClusterModel, ClusterPendingModel, ClusterHierarchyModel, ClusterCutModel, ClusterSweepSummaryModel
 from models.responses.task import TaskBaseModel
 from models.responses.error import ErrorModel
 
 import utils.constants as constants
 from utils.authorization import authorization
+from utils.manifest import read_manifest_async, crawl_results_async, rebuild_manifest, update_manifest
+from utils.result_id import sort_results
+from utils.task_registry import count_tasks
+from utils.embeddings import get_embeddings_etag_async
+from utils.dedup import RANDOM_STATE, result_key, deduplicate
+from utils.demo import merge_demo_results, find_demo_result, get_user_demo_dir, update_hidden, request_result_async, create_results_dir_async
+from utils.bundle import read_bundle_async
+from utils.sweep import SWEEP_MAX_POINTS, count_points, parse_points
+from utils.linkage import DENDROGRAM_LEAVES, read_linkage_async, summarize_linkage, count_clusters, cut_linkage
 
 import structlog
 
@@ -32,59 +45,66 @@ router = APIRouter()
         }
     }
 )
-def get_clusters(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
+async def get_clusters(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
     total_time = time.time()
     response = []
     storage = request.state.storage
 
     if experiment_id.startswith('demo'):
         experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        user_cluster_dir = 'data-{}'.format(user_id)
-        clusters_dir = os.path.join(experiment_dir, user_cluster_dir, constants.CLUSTER_DIR)
+        clusters_dir = os.path.join(experiment_dir, constants.CLUSTER_DIR)
     else:
         user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
         experiment_dir = os.path.join(user_dir, experiment_id)
         clusters_dir = os.path.join(experiment_dir, constants.CLUSTER_DIR)
 
-    clusters = []
-
-    try:
-        initial_time = time.time() 
-        clusters = storage.list(clusters_dir, depth=2)
-        elapsed = time.time() - initial_time
-        logger.debug(message='Retrieved clusters', duration=elapsed, action='get_clusters', subaction='list_clusters', status='SUCCED', resource='lse-service', userid=user_id)
-
-    except:
-        if not storage.dir_exist(experiment_dir):
-            logger.error(message='Experiment id not valid', action='get_clusters', subaction='list_clusters', status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Experiment id not valid"}
-            )
-
-        if not storage.dir_exist(clusters_dir):
-            logger.error(message='Clusters dir not valid', action='get_clusters', subaction='list_clusters', status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Clusters dir not valid"}
-            )
-
-    for cluster in clusters:
-        file_type = cluster.file_type
-        file_name = os.path.basename(cluster.path)
+    initial_time = time.time()
+    clusters = await read_manifest_async(storage, clusters_dir)
+    elapsed = time.time() - initial_time
 
-        if file_type == 'file' and file_name == constants.METADATA_FILENAME:
-            clu = {}
-
-            clu["id"] = cluster.path.split(os.path.sep)[-2]
+    if clusters is not None:
+        logger.debug(message='Retrieved clusters manifest', duration=elapsed, action='get_clusters', subaction='get_manifest', status='SUCCED', resource='lse-service', userid=user_id)
 
+    else:
+        try:
             initial_time = time.time()
-            metadata = storage.get_file(cluster.path)
+            clusters = await crawl_results_async(storage, clusters_dir)
             elapsed = time.time() - initial_time
-            logger.debug(message='Retrieved single cluster metadata', duration=elapsed, action='get_clusters', subaction='get_metadata', status='SUCCED', resource='lse-service', userid=user_id)
-            clu['metadata'] = json.loads(metadata)
+            logger.debug(message='Retrieved clusters', duration=elapsed, action='get_clusters', subaction='list_clusters', status='SUCCED', resource='lse-service', userid=user_id)
+
+        except:
+            paths = [experiment_dir, clusters_dir]
+            stat = dict(zip(paths, await storage.stat_many(paths)))
+
+            if stat[experiment_dir] != 'dir':
+                logger.error(message='Experiment id not valid', action='get_clusters', subaction='list_clusters', status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Experiment id not valid"}
+                )
+
+            # shared demo results dirs only exist once something was requested
+            if stat[clusters_dir] != 'dir' and not experiment_id.startswith('demo'):
+                logger.error(message='Clusters dir not valid', action='get_clusters', subaction='list_clusters', status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Clusters dir not valid"}
+                )
+
+            clusters = {}
+
+        else:
+            try:
+                await run_in_threadpool(rebuild_manifest, storage.sync, clusters_dir, clusters)
+            except:
+                logger.warning(message='Clusters manifest not stored', action='get_clusters', subaction='rebuild_manifest', status='FAILED', resource='lse-service', userid=user_id)
+
+    if experiment_id.startswith('demo'):
+        clusters = await merge_demo_results(storage, experiment_id, user_id, constants.CLUSTER_DIR, clusters)
+
+    for cluster_id, metadata in sort_results(clusters):
+        response.append({'id': cluster_id, 'metadata': metadata})
 
-            response.append(clu)
     elapsed = time.time() - total_time
     logger.info(message='{} clusters retrieved'.format(len(response)    ), duration=elapsed, action='get_clusters', status='SUCCED', resource='lse-service', userid=user_id)
     return response
@@ -96,26 +116,139 @@ def get_clusters(request: Request, experiment_id: str, user_id: dict = Depends(a
     summary="Get pending clusters count",
     response_model=ClusterPendingModel,
 )
-def get_pending_clusters_count(experiment_id: str, user_id: dict = Depends(authorization)):
+async def get_pending_clusters_count(experiment_id: str, user_id: dict = Depends(authorization)):
     total_time = time.time()
     response = {}
-    response['count'] = 0
+    response['count'] = sum(await asyncio.gather(*[
+        run_in_threadpool(count_tasks, name, user_id, experiment_id) for name in ('cluster', 'cluster_sweep')
+    ]))
+    elapsed = time.time() - total_time
+    logger.info(message='{} pending clusters retrieved'.format(response['count']), duration=elapsed, action='get_pending_clusters_count', status='SUCCED', resource='lse-service', userid=user_id)
+    return response
 
-    inspector = tasks.celery.control.inspect()
-    workers = inspector.active().keys()
 
-    for worker_id in workers:
-        active = inspector.active().get(worker_id)
-        reserved = inspector.reserved().get(worker_id)
+async def find_reachability_paths(storage, experiment_id, user_id, clusters_dir, cluster_ids):
+    # the reachability plot of each cluster result, looked up as get_cluster does, None when
+    # the result is not visible to the user
+    if not experiment_id.startswith('demo'):
+        return [os.path.join(clusters_dir, cluster_id, constants.REACHABILITY_FILENAME) for cluster_id in cluster_ids]
 
-        for task in active + reserved:
-            if 'cluster' == task['name'] and \
-                    experiment_id == task['kwargs']['experiment_id'] and \
-                    user_id == task['kwargs']['user_id']:
+    cluster_dirs = await asyncio.gather(*[
+        find_demo_result(storage, experiment_id, user_id, constants.CLUSTER_DIR, cluster_id) for cluster_id in cluster_ids
+    ])
+
+    return [os.path.join(dirs[0], constants.REACHABILITY_FILENAME) if dirs else None for dirs in cluster_dirs]
+
+
+async def read_hierarchy(storage, experiment_id, user_id, affinity, linkage, action):
+    # merge tree stored by the last agglomerative clustering with this affinity and linkage,
+    # or the error response when there is none for the current embeddings
+    if experiment_id.startswith('demo'):
+        experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
+    else:
+        user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
+        experiment_dir = os.path.join(user_dir, experiment_id)
+
+    initial_time = time.time()
+    tree = await read_linkage_async(storage, experiment_dir, affinity, linkage)
+    elapsed = time.time() - initial_time
+
+    if tree is not None:
+        logger.debug(message='Retrieved cluster hierarchy', duration=elapsed, action=action, subaction='get_linkage', status='SUCCED', resource='lse-service', userid=user_id)
+        return tree, None
+
+    if await storage.dir_exist(experiment_dir):
+        logger.error(message='Cluster hierarchy not computed', action=action, status='FAILED', resource='lse-service', userid=user_id)
+        return None, JSONResponse(
+            status_code=404,
+            content={"message": "Cluster hierarchy not computed"}
+        )
+
+    logger.error(message='Experiment id not valid', action=action, status='FAILED', resource='lse-service', userid=user_id)
+    return None, JSONResponse(
+        status_code=404,
+        content={"message": "Experiment id not valid"}
+    )
+
+
+@router.get(
+    "/experiments/{experiment_id}/clusters/hierarchy",
+    tags=["cluster"],
+    summary="Get agglomerative clustering dendrogram",
+    response_model=ClusterHierarchyModel,
+    responses={
+        404: {
+            "model": ErrorModel
+        }
+    }
+)
+async def get_cluster_hierarchy(
+    request: Request,
+    experiment_id: str,
+    affinity: Literal['euclidean', 'cosine', 'manhattan'],
+    linkage: Literal['ward', 'complete', 'average', 'single'],
+    leaves: int = DENDROGRAM_LEAVES,
+    user_id: dict = Depends(authorization)
+):
+    total_time = time.time()
+    storage = request.state.storage
+
+    tree, error = await read_hierarchy(storage, experiment_id, user_id, affinity, linkage, 'get_cluster_hierarchy')
+    if error is not None:
+        return error
+
+    response = summarize_linkage(*tree, leaves=leaves)
 
-                response['count'] += 1
     elapsed = time.time() - total_time
-    logger.info(message='{} pending clusters retrieved'.format(response['count']), duration=elapsed, action='get_pending_clusters_count', status='SUCCED', resource='lse-service', userid=user_id)
+    logger.info(message='Cluster hierarchy retrieved', duration=elapsed, action='get_cluster_hierarchy', status='SUCCED', resource='lse-service', userid=user_id)
+    return response
+
+
+@router.get(
+    "/experiments/{experiment_id}/clusters/hierarchy/groups",
+    tags=["cluster"],
+    summary="Cut agglomerative clustering dendrogram",
+    response_model=ClusterCutModel,
+    responses={
+        404: {
+            "model": ErrorModel
+        },
+        422: {
+            "model": ErrorModel
+        }
+    }
+)
+async def get_cluster_hierarchy_groups(
+    request: Request,
+    experiment_id: str,
+    affinity: Literal['euclidean', 'cosine', 'manhattan'],
+    linkage: Literal['ward', 'complete', 'average', 'single'],
+    distance_threshold: Optional[float] = None,
+    n_clusters: Optional[int] = None,
+    user_id: dict = Depends(authorization)
+):
+    total_time = time.time()
+    storage = request.state.storage
+
+    if (distance_threshold is None) == (n_clusters is None):
+        return JSONResponse(
+            status_code=422,
+            content={"message": "Either distance_threshold or n_clusters must be given"}
+        )
+
+    tree, error = await read_hierarchy(storage, experiment_id, user_id, affinity, linkage, 'get_cluster_hierarchy_groups')
+    if error is not None:
+        return error
+
+    children, distances, _ = tree
+    if n_clusters is None:
+        n_clusters = count_clusters(distances, distance_threshold)
+
+    groups = await run_in_threadpool(cut_linkage, children, n_clusters)
+    response = {'n_clusters': int(groups.max()) + 1, 'groups': groups.tolist()}
+
+    elapsed = time.time() - total_time
+    logger.info(message='Cluster hierarchy cut in {} clusters'.format(response['n_clusters']), duration=elapsed, action='get_cluster_hierarchy_groups', status='SUCCED', resource='lse-service', userid=user_id)
     return response
 
 
@@ -124,101 +257,148 @@ def get_pending_clusters_count(experiment_id: str, user_id: dict = Depends(autho
     tags=["cluster"],
     summary="Get cluster",
     response_model=ClusterModel,
+    response_model_exclude_unset=True,
     responses={
         404: {
             "model": ErrorModel
+        },
+        422: {
+            "model": ErrorModel
         }
     }
 )
-def get_cluster(request: Request, experiment_id: str, cluster_id: str, user_id: dict = Depends(authorization)):
+async def get_cluster(request: Request, experiment_id: str, cluster_id: str, fields: Optional[str] = None, user_id: dict = Depends(authorization)):
     total_time = time.time()
     response = {}
     storage = request.state.storage
 
     if experiment_id.startswith('demo'):
         experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        user_cluster_dir = 'data-{}'.format(user_id)
-        cluster_dir = os.path.join(experiment_dir, user_cluster_dir, constants.CLUSTER_DIR, cluster_id)
+        cluster_dirs = await find_demo_result(storage, experiment_id, user_id, constants.CLUSTER_DIR, cluster_id)
+
+        if not cluster_dirs:
+            logger.error(message='Cluster id not valid', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
+            return JSONResponse(
+                status_code=404,
+                content={"message": "Cluster id not valid"}
+            )
+
+        cluster_dir = cluster_dirs[0]
     else:
         user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
         experiment_dir = os.path.join(user_dir, experiment_id)
         cluster_dir = os.path.join(
             experiment_dir, constants.CLUSTER_DIR, cluster_id)
-    
+
+    # fields selects a subset of the result, e.g. fields=groups,scores
+    if fields is None:
+        selected_fields = None
+    else:
+        selected_fields = [field.strip() for field in fields.split(',') if field.strip()]
+
+        if not selected_fields or not set(selected_fields) <= set(constants.CLUSTER_FIELDS):
+            return JSONResponse(
+                status_code=422,
+                content={"message": "Fields must be a subset of {}".format(', '.join(constants.CLUSTER_FIELDS))}
+            )
+
+    bundle_path = os.path.join(cluster_dir, constants.CLUSTER_BUNDLE_FILENAME)
     metadata_path = os.path.join(cluster_dir, constants.METADATA_FILENAME)
     cluster_path = os.path.join(cluster_dir, constants.CLUSTER_FILENAME)
     silhouette_path = os.path.join(cluster_dir, constants.SILHOUETTE_FILENAME)
     scores_path = os.path.join(cluster_dir, constants.SCORES_FILENAME)
 
     try:
-        # TODO make it more efficient, split into multiple call
         initial_time = time.time()
-        metadata = storage.get_file(metadata_path)
+        parts = await read_bundle_async(storage, bundle_path, selected_fields)
         elapsed = time.time() - initial_time
-        logger.debug(message='Retrieved single cluster metadata', duration=elapsed, action='get_cluster', subaction='get_metadata', status='SUCCED', resource='lse-service', userid=user_id)
-        response['metadata'] = json.loads(metadata)
+        logger.debug(message='Retrieved cluster bundle', duration=elapsed, action='get_cluster', subaction='get_bundle', status='SUCCED', resource='lse-service', userid=user_id)
 
-        initial_time = time.time()
-        cluster = storage.get_file(cluster_path)
-        elapsed = time.time() - initial_time
-        logger.debug(message='Retrieved single cluster', duration=elapsed, action='get_cluster', subaction='get_cluster', status='SUCCED', resource='lse-service', userid=user_id)
-        response['groups'] = json.loads(cluster)
-
-        initial_time = time.time()
-        silohuette = storage.get_file(silhouette_path)
-        elapsed = time.time() - initial_time
-        logger.debug(message='Retrieved single cluster silhouette', duration=elapsed, action='get_cluster', subaction='get_silhouette', status='SUCCED', resource='lse-service', userid=user_id)
-        response['silhouettes'] = json.loads(silohuette)
-
-        initial_time = time.time()
-        scores = storage.get_file(scores_path)
-        elapsed = time.time() - initial_time
-        logger.debug(message='Retrieved single cluster scores', duration=elapsed, action='get_cluster', subaction='get_scores', status='SUCCED', resource='lse-service', userid=user_id)
-        response['scores'] = json.loads(scores)
+        for field, part in parts.items():
+            response[field] = json.loads(part)
 
     except:
-        if not storage.dir_exist(experiment_dir):
-            logger.error(message='Experiment id not valid', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Experiment id not valid"}
-            )
-
-        if not storage.dir_exist(cluster_dir):
-            logger.error(message='Cluster id not valid', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Cluster id not valid"}
-            )
+        parts = None
+
+    # results computed before bundles existed keep one file per part
+    if parts is None:
+        selected_fields = selected_fields or constants.CLUSTER_FIELDS
+
+        try:
+            if 'metadata' in selected_fields:
+                initial_time = time.time()
+                metadata = await storage.get_file(metadata_path)
+                elapsed = time.time() - initial_time
+                logger.debug(message='Retrieved single cluster metadata', duration=elapsed, action='get_cluster', subaction='get_metadata', status='SUCCED', resource='lse-service', userid=user_id)
+                response['metadata'] = json.loads(metadata)
+
+            if 'groups' in selected_fields:
+                initial_time = time.time()
+                cluster = await storage.get_file(cluster_path)
+                elapsed = time.time() - initial_time
+                logger.debug(message='Retrieved single cluster', duration=elapsed, action='get_cluster', subaction='get_cluster', status='SUCCED', resource='lse-service', userid=user_id)
+                response['groups'] = json.loads(cluster)
+
+            if 'silhouettes' in selected_fields:
+                initial_time = time.time()
+                silohuette = await storage.get_file(silhouette_path)
+                elapsed = time.time() - initial_time
+                logger.debug(message='Retrieved single cluster silhouette', duration=elapsed, action='get_cluster', subaction='get_silhouette', status='SUCCED', resource='lse-service', userid=user_id)
+                response['silhouettes'] = json.loads(silohuette)
+
+            if 'scores' in selected_fields:
+                initial_time = time.time()
+                scores = await storage.get_file(scores_path)
+                elapsed = time.time() - initial_time
+                logger.debug(message='Retrieved single cluster scores', duration=elapsed, action='get_cluster', subaction='get_scores', status='SUCCED', resource='lse-service', userid=user_id)
+                response['scores'] = json.loads(scores)
+
+        except:
+            paths = [experiment_dir, cluster_dir, metadata_path, cluster_path, silhouette_path, scores_path]
+            stat = dict(zip(paths, await storage.stat_many(paths)))
+
+            if stat[experiment_dir] != 'dir':
+                logger.error(message='Experiment id not valid', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Experiment id not valid"}
+                )
+
+            if stat[cluster_dir] != 'dir':
+                logger.error(message='Cluster id not valid', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Cluster id not valid"}
+                )
+
+            if stat[metadata_path] != 'file':
+                logger.error(message='Cluster metadata file not exist', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Cluster metadata file not exist"}
+                )
+
+            if stat[cluster_path] != 'file':
+                logger.error(message='Cluster file not exist', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Cluster file not exist"}
+                )
+
+            if stat[silhouette_path] != 'file':
+                logger.error(message='Cluster silhouette file not exist', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Cluster silhouette file not exist"}
+                )
+
+            if stat[scores_path] != 'file':
+                logger.error(message='Cluster scores file not exist', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Cluster scores file not exist"}
+                )
 
-        if not storage.file_exist(metadata_path):
-            logger.error(message='Cluster metadata file not exist', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Cluster metadata file not exist"}
-            )
-
-        if not storage.file_exist(cluster_path):
-            logger.error(message='Cluster file not exist', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Cluster file not exist"}
-            )
-
-        if not storage.file_exist(silhouette_path):
-            logger.error(message='Cluster silhouette file not exist', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Cluster silhouette file not exist"}
-            )
-
-        if not storage.file_exist(scores_path):
-            logger.error(message='Cluster scores file not exist', action='get_cluster', status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Cluster scores file not exist"}
-            )
-            
     elapsed = time.time() - total_time
     logger.info(message='Cluster retrieved', duration=elapsed, action='get_cluster', status='SUCCED', resource='lse-service', userid=user_id)
     return response
@@ -231,10 +411,10 @@ def get_cluster(request: Request, experiment_id: str, cluster_id: str, user_id:
     response_model=TaskBaseModel,
     status_code=201
 )
-def post_cluster(
+async def post_cluster(
     request: Request,
     cluster: Union[
-        AffinityPropagationModel, DBSCANModel, KMeansModel, AgglomerativeClusteringModel, SpectralClusteringModel, OPTICSModel, GaussianMixtureModel, BirchModel
+        AffinityPropagationModel, DBSCANModel, KMeansModel, AgglomerativeClusteringModel, SpectralClusteringModel, OPTICSModel, OPTICSExtractModel, GaussianMixtureModel, BirchModel
     ],
     experiment_id: str, user_id: dict = Depends(authorization)
 ):
@@ -243,32 +423,72 @@ def post_cluster(
 
     if experiment_id.startswith('demo'):
         experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        user_cluster_dir = 'data-{}'.format(user_id)
-        clusters_dir = os.path.join(experiment_dir, user_cluster_dir, constants.CLUSTER_DIR)
+        clusters_dir = os.path.join(experiment_dir, constants.CLUSTER_DIR)
     else:
         user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
         experiment_dir = os.path.join(user_dir, experiment_id)
         clusters_dir = os.path.join(experiment_dir, constants.CLUSTER_DIR)
 
-    if not storage.dir_exist(experiment_dir):
+    paths = [experiment_dir, clusters_dir]
+
+    # extractions read the reachability plot of an OPTICS result visible to the user
+    reachability_paths = []
+    if cluster.algorithm == 'optics_extract':
+        reachability_paths = await find_reachability_paths(storage, experiment_id, user_id, clusters_dir, [cluster.params.cluster_id])
+
+    paths += [path for path in reachability_paths if path is not None]
+    stat, embeddings_etag = await asyncio.gather(storage.stat_many(paths), get_embeddings_etag_async(storage, experiment_dir))
+    stat = dict(zip(paths, stat))
+
+    if stat[experiment_dir] != 'dir':
         return JSONResponse(
             status_code=404,
             content={"message": "Experiment id not valid"}
         )
 
-    if not storage.dir_exist(clusters_dir):
+    if stat[clusters_dir] != 'dir' and experiment_id.startswith('demo'):
+        await create_results_dir_async(storage, clusters_dir)
+
+    elif stat[clusters_dir] != 'dir':
         return JSONResponse(
             status_code=404,
             content={"message": "Clusters dir not valid"}
         )
 
-    task = tasks.cluster.apply_async(
-        kwargs={
-            "algorithm": cluster.algorithm,
-            "params": cluster.params.dict(),
-            "experiment_id": experiment_id,
-            "user_id": user_id
-        }
+    if any(path is None or stat[path] != 'file' for path in reachability_paths):
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Cluster reachability not exist"}
+        )
+
+    kwargs = {
+        "algorithm": cluster.algorithm,
+        "params": cluster.params.dict(),
+        "experiment_id": experiment_id,
+        "user_id": user_id,
+        "random_state": RANDOM_STATE
+    }
+    if cluster.scoring is not None:
+        kwargs['scoring'] = cluster.scoring
+
+    # identical requests on the same embeddings content share the result, or the running task
+    key, task_id = None, None
+    if embeddings_etag is not None:
+        key = result_key('cluster', embeddings_etag, **kwargs)
+        on_existing = None
+        if experiment_id.startswith('demo'):
+            on_existing = functools.partial(request_result_async, storage, experiment_id, user_id, constants.CLUSTER_DIR)
+
+        task_id, duplicate = await deduplicate(storage, tasks.cluster, clusters_dir, key, kwargs, on_existing)
+
+        if duplicate:
+            logger.info(message='Cluster task deduplicated', action='Clustering', subaction=cluster.algorithm, resource='lse-service', userid=user_id, task_id=task_id)
+            return {'task_id': task_id}
+
+    task = await run_in_threadpool(
+        tasks.cluster.apply_async,
+        kwargs=dict(kwargs, key=key),
+        task_id=task_id
     )
 
     response['task_id'] = task.id
@@ -280,6 +500,146 @@ def post_cluster(
     return response
 
 
+@router.post(
+    "/experiments/{experiment_id}/clusters/sweeps",
+    tags=["cluster"],
+    summary="Create a cluster per point of a parameter grid",
+    response_model=TaskBaseModel,
+    status_code=201,
+    responses={
+        404: {
+            "model": ErrorModel
+        },
+        422: {
+            "model": ErrorModel
+        }
+    }
+)
+async def post_cluster_sweep(request: Request, sweep: ClusterSweepModel, experiment_id: str, user_id: dict = Depends(authorization)):
+    total_time = time.time()
+    storage = request.state.storage
+
+    if experiment_id.startswith('demo'):
+        experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
+        clusters_dir = os.path.join(experiment_dir, constants.CLUSTER_DIR)
+    else:
+        user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
+        experiment_dir = os.path.join(user_dir, experiment_id)
+        clusters_dir = os.path.join(experiment_dir, constants.CLUSTER_DIR)
+
+    if not 1 <= count_points(sweep.grid) <= SWEEP_MAX_POINTS:
+        return JSONResponse(
+            status_code=422,
+            content={"message": "Grid must have between 1 and {} points".format(SWEEP_MAX_POINTS)}
+        )
+
+    try:
+        clusters = parse_points(CLUSTER_MODELS[sweep.algorithm], {'algorithm': sweep.algorithm, 'params': sweep.params}, sweep.grid)
+    except ValidationError as error:
+        return JSONResponse(
+            status_code=422,
+            content={"message": "Grid point not valid: {}".format(error)}
+        )
+
+    paths = [experiment_dir, clusters_dir]
+
+    # extractions read the reachability plot of OPTICS results visible to the user
+    reachability_paths = await find_reachability_paths(storage, experiment_id, user_id, clusters_dir, sorted(set(
+        cluster.params.cluster_id for cluster in clusters if cluster.algorithm == 'optics_extract'
+    )))
+
+    paths += [path for path in reachability_paths if path is not None]
+    stat, embeddings_etag = await asyncio.gather(storage.stat_many(paths), get_embeddings_etag_async(storage, experiment_dir))
+    stat = dict(zip(paths, stat))
+
+    if stat[experiment_dir] != 'dir':
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Experiment id not valid"}
+        )
+
+    if stat[clusters_dir] != 'dir' and experiment_id.startswith('demo'):
+        await create_results_dir_async(storage, clusters_dir)
+
+    elif stat[clusters_dir] != 'dir':
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Clusters dir not valid"}
+        )
+
+    if any(path is None or stat[path] != 'file' for path in reachability_paths):
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Cluster reachability not exist"}
+        )
+
+    points = [{'params': cluster.params.dict()} for cluster in clusters]
+
+    # results of the sweep carry the key of the single request, so later requests reuse them
+    scoring = {'scoring': sweep.scoring} if sweep.scoring is not None else {}
+
+    keys = None
+    if embeddings_etag is not None:
+        keys = [
+            result_key('cluster', embeddings_etag, algorithm=sweep.algorithm, params=point['params'], random_state=RANDOM_STATE, **scoring)
+            for point in points
+        ]
+
+    task = await run_in_threadpool(
+        tasks.cluster_sweep.apply_async,
+        kwargs={
+            "algorithm": sweep.algorithm,
+            "points": points,
+            "experiment_id": experiment_id,
+            "user_id": user_id,
+            "random_state": RANDOM_STATE,
+            "keys": keys,
+            **scoring
+        }
+    )
+
+    elapsed = time.time() - total_time
+    logger.info(message='Posted cluster sweep task of {} points'.format(len(points)), action='post_cluster_sweep', subaction=sweep.algorithm, status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
+    logger.accounting(message='Posted cluster sweep task', action='Clustering', value=len(points), measure="unit", resource='lse', userid=user_id)
+
+    return {'task_id': task.id}
+
+
+@router.get(
+    "/experiments/{experiment_id}/clusters/sweeps/{sweep_id}",
+    tags=["cluster"],
+    summary="Get cluster sweep scores",
+    response_model=ClusterSweepSummaryModel,
+    responses={
+        404: {
+            "model": ErrorModel
+        }
+    }
+)
+async def get_cluster_sweep(request: Request, experiment_id: str, sweep_id: str, user_id: dict = Depends(authorization)):
+    total_time = time.time()
+    storage = request.state.storage
+
+    if experiment_id.startswith('demo'):
+        clusters_dir = os.path.join(constants.DEMO_DIR, experiment_id, constants.CLUSTER_DIR)
+    else:
+        user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
+        clusters_dir = os.path.join(user_dir, experiment_id, constants.CLUSTER_DIR)
+
+    try:
+        response = json.loads(await storage.get_file(os.path.join(clusters_dir, constants.SWEEP_FILENAME.format(sweep_id))))
+    except:
+        logger.error(message='Sweep id not valid', action='get_cluster_sweep', status='FAILED', resource='lse-service', userid=user_id)
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Sweep id not valid"}
+        )
+
+    elapsed = time.time() - total_time
+    logger.info(message='Cluster sweep retrieved', duration=elapsed, action='get_cluster_sweep', status='SUCCED', resource='lse-service', userid=user_id)
+    return response
+
+
 @router.delete(
     "/experiments/{experiment_id}/clusters/{cluster_id}",
     tags=["cluster"],
@@ -290,13 +650,27 @@ def post_cluster(
         }
     }
 )
-def delete_cluster(request: Request, experiment_id: str, cluster_id: str, user_id: dict = Depends(authorization)):
+async def delete_cluster(request: Request, experiment_id: str, cluster_id: str, user_id: dict = Depends(authorization)):
     storage = request.state.storage
 
     if experiment_id.startswith('demo'):
         experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        user_cluster_dir = 'data-{}'.format(user_id)
-        cluster_dir = os.path.join(experiment_dir, user_cluster_dir, constants.CLUSTER_DIR, cluster_id)
+        cluster_dirs = await find_demo_result(storage, experiment_id, user_id, constants.CLUSTER_DIR, cluster_id)
+
+        if not cluster_dirs:
+            logger.error(message='Cluster id not valid', action='delete_cluster', status='FAILED', resource='lse-service', userid=user_id)
+            return JSONResponse(
+                status_code=404,
+                content={"message": "Cluster id not valid"}
+            )
+
+        # shared results are hidden for the user only, a copy of their own is deleted too
+        await run_in_threadpool(update_hidden, storage.sync, experiment_id, user_id, constants.CLUSTER_DIR, hide=[cluster_id])
+        logger.info(message='Hid cluster {}'.format(cluster_id), action='delete_cluster', resource='lse-service', userid=user_id)
+
+        cluster_dir = os.path.join(get_user_demo_dir(experiment_id, user_id), constants.CLUSTER_DIR, cluster_id)
+        if cluster_dir not in cluster_dirs:
+            return True
     else:
         user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
         experiment_dir = os.path.join(user_dir, experiment_id)
@@ -304,21 +678,29 @@ def delete_cluster(request: Request, experiment_id: str, cluster_id: str, user_i
             experiment_dir, constants.CLUSTER_DIR, cluster_id)
 
     try:
-        storage.delete(cluster_dir)
+        await storage.delete(cluster_dir)
         logger.info(message='Deleted cluster {}'.format(cluster_id), action='delete_cluster', resource='lse-service', userid=user_id)
     except:
-        if not storage.dir_exist(experiment_dir):
+        paths = [experiment_dir, cluster_dir]
+        stat = dict(zip(paths, await storage.stat_many(paths)))
+
+        if stat[experiment_dir] != 'dir':
             logger.error(message='Experiment id not valid', action='delete_cluster', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Experiment id not valid"}
             )
 
-        if not storage.dir_exist(cluster_dir):
+        if stat[cluster_dir] != 'dir':
             logger.error(message='Cluster id not valid', action='delete_cluster', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Cluster id not valid"}
             )
-    
+
+    try:
+        await run_in_threadpool(update_manifest, storage.sync, os.path.dirname(cluster_dir), remove=[cluster_id])
+    except:
+        logger.warning(message='Clusters manifest not updated', action='delete_cluster', subaction='update_manifest', status='FAILED', resource='lse-service', userid=user_id)
+
     return True
@@ -12,6 +12,8 @@ from models.responses.error import ErrorModel
 import utils.constants as constants
 from utils.authorization import authorization
 from utils.storage import Storage
+from utils.storage_async import AsyncStorage
+from utils.concurrency import gather_concurrent
 
 import structlog
 
@@ -23,18 +25,48 @@ def check_and_create_user_demo_folder(user_id: str, storage: Storage, experiment
     user_dir = '{}{}'.format("data-", user_id)
     user_demo_path = os.path.join(constants.DEMO_DIR, experiment_id, user_dir)
     
+    # demo results are shared, the user dir only holds the results they hid
     if not(storage.dir_exist(user_demo_path)):
         storage.mkdir(user_demo_path)
-    
-    user_reduction_path = os.path.join(user_demo_path, constants.REDUCTION_DIR)
-    if not(storage.dir_exist(user_reduction_path)):
-        demo_reduction_path = os.path.join(constants.DEMO_DIR, experiment_id, constants.REDUCTION_DIR)
-        storage.copy(demo_reduction_path, user_reduction_path)
 
-    user_cluster_path = os.path.join(user_demo_path, constants.CLUSTER_DIR)
-    if not(storage.dir_exist(user_cluster_path)):
-        demo_cluster_path = os.path.join(constants.DEMO_DIR, experiment_id, constants.CLUSTER_DIR)
-        storage.copy(demo_cluster_path, user_cluster_path)
+
+async def list_experiments(storage: AsyncStorage, user_dir: str, user_id: str):
+    # demo and user trees are listed together, then every metadata file is fetched concurrently
+    initial_time = time.time()
+    demo_experiments, user_experiments = await gather_concurrent(
+        lambda dir_path: storage.list(dir_path, depth=2), [constants.DEMO_DIR, user_dir])
+    elapsed = time.time() - initial_time
+    logger.debug(message='Retrieved user\'s folder tree', duration=elapsed, action='get_experiments', subaction='list_experiments', status='SUCCED', resource='lse-service', userid=user_id)
+
+    metadata_paths = []
+    for experiment in demo_experiments + user_experiments:
+        file_type = experiment['file_type']
+        file_name = os.path.basename(experiment['path'])
+
+        if file_type == 'file' and file_name == constants.METADATA_FILENAME:
+            metadata_paths.append(experiment['path'])
+
+    demo_paths = set(experiment['path'] for experiment in demo_experiments)
+
+    initial_time = time.time()
+    metadata_files = await gather_concurrent(storage.get_file, metadata_paths)
+    elapsed = time.time() - initial_time
+    logger.debug(message='Metadata retrieved', duration=elapsed, action='get_experiments', subaction='get_medata', status='SUCCED', resource='lse-service', userid=user_id)
+
+    experiments = []
+    demo_ids = []
+    for metadata_path, metadata in zip(metadata_paths, metadata_files):
+        exp = {}
+
+        exp["id"] = metadata_path.split(os.path.sep)[2]
+        exp['metadata'] = json.loads(metadata)
+
+        experiments.append(exp)
+
+        if metadata_path in demo_paths:
+            demo_ids.append(exp["id"])
+
+    return experiments, demo_ids
 
 
 @router.get(
@@ -48,48 +80,21 @@ def check_and_create_user_demo_folder(user_id: str, storage: Storage, experiment
         }
     }
 )
-def get_experiments(request: Request, background_tasks: BackgroundTasks, user_id: dict = Depends(authorization)):
+async def get_experiments(request: Request, background_tasks: BackgroundTasks, user_id: dict = Depends(authorization)):
     total_time = time.time()
     response = []
     storage = request.state.storage
 
-    # Demo experiments
-    experiments = storage.list(constants.DEMO_DIR, depth=2)
-    for experiment in experiments:
-        file_type = experiment.file_type
-        file_name = os.path.basename(experiment.path)
-
-        if file_type == 'file' and file_name == constants.METADATA_FILENAME:
-            exp = {}
-
-            exp["id"] = experiment.path.split(os.path.sep)[2]
-            print(experiment.path)
-            metadata = storage.get_file(experiment.path)
-            exp['metadata'] = json.loads(metadata)
-
-            response.append(exp)
-            background_tasks.add_task(check_and_create_user_demo_folder, user_id=user_id, storage=storage, experiment_id=exp["id"])
-
     user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
-    initial_time = time.time()
-    experiments = storage.list(user_dir, depth=2)
-    elapsed = time.time() - initial_time
-    logger.debug(message='Retrieved user\'s folder tree', duration=elapsed, action='get_experiments', subaction='list_experiments', status='SUCCED', resource='lse-service', userid=user_id)
-    for experiment in experiments:
-        file_type = experiment.file_type
-        file_name = os.path.basename(experiment.path)
 
-        if file_type == 'file' and file_name == constants.METADATA_FILENAME:
-            exp = {}
+    experiments, demo_ids = await storage.cached(('experiments', user_id), user_dir, lambda: list_experiments(storage, user_dir, user_id))
 
-            exp["id"] = experiment.path.split(os.path.sep)[2]
-            initial_time = time.time()
-            metadata = storage.get_file(experiment.path)
-            elapsed = time.time() - initial_time
-            logger.debug(message='Metadata retrieved', duration=elapsed, action='get_experiments', subaction='get_medata', status='SUCCED', resource='lse-service', userid=user_id)
-            exp['metadata'] = json.loads(metadata)
+    for exp in experiments:
+        response.append(exp)
+
+        if exp["id"] in demo_ids:
+            background_tasks.add_task(check_and_create_user_demo_folder, user_id=user_id, storage=storage.sync, experiment_id=exp["id"])
 
-            response.append(exp)
     elapsed = time.time() - total_time
     logger.info(message='get_experiments', duration=elapsed, action='get_experiments', status='SUCCED', resource='lse-service', userid=user_id)
     return response
@@ -106,7 +111,7 @@ def get_experiments(request: Request, background_tasks: BackgroundTasks, user_id
         }
     }
 )
-def get_experiment(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
+async def get_experiment(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
     response = {}
     storage = request.state.storage
 
@@ -116,20 +121,23 @@ def get_experiment(request: Request, experiment_id: str, user_id: dict = Depends
 
         try:
             initial_time = time.time()
-            metadata = storage.get_file(metadata_path)
+            metadata = await storage.get_file(metadata_path)
             elapsed = time.time() - initial_time
             logger.info(message='Metadata retrieved', duration=elapsed, action='get_experiment', subaction='get_metadata', status='SUCCED', resource='lse-service', userid=user_id)
             response['metadata'] = json.loads(metadata)
 
         except:
-            if not storage.dir_exist(experiment_dir):
+            paths = [experiment_dir, metadata_path]
+            stat = dict(zip(paths, await storage.stat_many(paths)))
+
+            if stat[experiment_dir] != 'dir':
                 logger.error(message='Experiment id not valid', duration=elapsed, action='get_experiment', subaction='get_metadata', status='FAILED', resource='lse-service', userid=user_id)
                 return JSONResponse(
                     status_code=404,
                     content={"message": "Experiment id not valid"}
                 )
 
-            if not storage.file_exist(metadata_path):
+            if stat[metadata_path] != 'file':
                 logger.error(message='Experiment metadata file not exist', duration=elapsed, action='get_experiment', subaction='get_metadata', status='FAILED', resource='lse-service', userid=user_id)
                 return JSONResponse(
                     status_code=404,
@@ -142,20 +150,23 @@ def get_experiment(request: Request, experiment_id: str, user_id: dict = Depends
 
         try:
             initial_time = time.time()
-            metadata = storage.get_file(metadata_path)
+            metadata = await storage.get_file(metadata_path)
             elapsed = time.time() - initial_time
             logger.info(message='Metadata retrieved', duration=elapsed, action='get_experiment', subaction='get_metadata', status='SUCCED', resource='lse-service', userid=user_id)
             response['metadata'] = json.loads(metadata)
 
         except:
-            if not storage.dir_exist(experiment_dir):
+            paths = [experiment_dir, metadata_path]
+            stat = dict(zip(paths, await storage.stat_many(paths)))
+
+            if stat[experiment_dir] != 'dir':
                 logger.error(message='Experiment id not valid', duration=elapsed, action='get_experiment', subaction='get_metadata', status='FAILED', resource='lse-service', userid=user_id)
                 return JSONResponse(
                     status_code=404,
                     content={"message": "Experiment id not valid"}
                 )
 
-            if not storage.file_exist(metadata_path):
+            if stat[metadata_path] != 'file':
                 logger.error(message='Experiment metadata file not exist', duration=elapsed, action='get_experiment', subaction='get_metadata', status='FAILED', resource='lse-service', userid=user_id)
                 return JSONResponse(
                     status_code=404,
@@ -175,7 +186,7 @@ def get_experiment(request: Request, experiment_id: str, user_id: dict = Depends
         }
     }
 )
-def delete_experiment(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
+async def delete_experiment(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
     if experiment_id.startswith("demo"):
         return JSONResponse(
                 status_code=200, # to make it 403 when client it's fixed
@@ -191,11 +202,11 @@ def delete_experiment(request: Request, experiment_id: str, user_id: dict = Depe
 
     try:
 
-        storage.delete(experiment_dir)
+        await storage.delete(experiment_dir)
         logger.info(message='{} experiment deleted'.format(experiment_dir), action='delete_experiment', status='SUCCED', resource='lse-service', userid=user_id)
 
     except:
-        if not storage.dir_exist(experiment_dir):
+        if not await storage.dir_exist(experiment_dir):
             logger.error(message='Experiment id {} not valid'.format(experiment_dir), action='delete_experiment', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
@@ -30,7 +30,7 @@ router = APIRouter()
         }
     }
 )
-def get_images_folder_name(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
+async def get_images_folder_name(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
     total_time = time.time()
     response = {}
     storage = request.state.storage
@@ -42,7 +42,7 @@ def get_images_folder_name(request: Request, experiment_id: str, user_id: dict =
         images_dir = os.path.join(data_dir, experiment_id, constants.IMAGES_DIR)
 
     try:
-        public_name = storage.get_link(images_dir)
+        public_name = await storage.get_link(images_dir)
         response['images_folder_name'] = os.path.split(public_name)[-1]
 
     except:
@@ -67,7 +67,7 @@ def get_images_folder_name(request: Request, experiment_id: str, user_id: dict =
         }
     }
 )
-def get_single_image(request: Request, image_name: str, experiment_id: str, user_id: dict = Depends(authorization)):
+async def get_single_image(request: Request, image_name: str, experiment_id: str, user_id: dict = Depends(authorization)):
     storage = request.state.storage
 
     data_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
@@ -75,7 +75,7 @@ def get_single_image(request: Request, image_name: str, experiment_id: str, user
                               constants.IMAGES_DIR, image_name)
 
     try:
-        link = storage.get_link(image_path)
+        link = await storage.get_link(image_path)
 
     except owncloud.owncloud.HTTPResponseError:
         return JSONResponse(
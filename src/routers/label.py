@@ -19,6 +19,10 @@ logger = structlog.getLogger("json_logger")
 router = APIRouter()
 
 
+async def get_labels_file(storage, labels_path):
+    return json.loads(await storage.get_file(labels_path))
+
+
 @router.get(
     "/experiments/{experiment_id}/labels",
     tags=["label"],
@@ -30,7 +34,7 @@ router = APIRouter()
         }
     }
 )
-def get_labels(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
+async def get_labels(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
     total_time = time.time()
     response = {}
     storage = request.state.storage
@@ -44,18 +48,20 @@ def get_labels(request: Request, experiment_id: str, user_id: dict = Depends(aut
     labels_path = os.path.join(experiment_dir, constants.LABELS_FILENAME)
 
     try:
-        labels = storage.get_file(labels_path)
-        response = json.loads(labels)
+        response = await storage.cached(('labels',), labels_path, lambda: get_labels_file(storage, labels_path))
 
     except:
-        if not storage.dir_exist(experiment_dir):
+        paths = [experiment_dir, labels_path]
+        stat = dict(zip(paths, await storage.stat_many(paths)))
+
+        if stat[experiment_dir] != 'dir':
             logger.error(message='Experiment id not valid', action='get_labels', subaction="get_file", status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Experiment id not valid"}
             )
 
-        if not storage.file_exist(labels_path):
+        if stat[labels_path] != 'file':
             logger.error(message='Experiment labels file not exist', action='get_labels', subaction="get_file", status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
@@ -1,19 +1,30 @@
 import os
 import json
 import time
+import asyncio
+import functools
 
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 from typing import Union, List
 
 from celery_app import tasks
-from models.requests.reduction import PCAModel, TSNEModel, UMAPModel, TruncatedSVDModel, SpectralEmbeddingModel, IsomapModel, MDSModel
-from models.responses.reduction import ReductionBaseModel, ReductionModel, ReductionPendingModel
+from models.requests.reduction import PCAModel, TSNEModel, UMAPModel, TruncatedSVDModel, SpectralEmbeddingModel, IsomapModel, MDSModel, REDUCTION_MODELS, ReductionSweepModel
+from models.responses.reduction import ReductionBaseModel, ReductionModel, ReductionPendingModel, ReductionSweepSummaryModel
 from models.responses.task import TaskBaseModel
 from models.responses.error import ErrorModel
 
 import utils.constants as constants
 from utils.authorization import authorization
+from utils.manifest import read_manifest_async, crawl_results_async, rebuild_manifest, update_manifest
+from utils.result_id import sort_results
+from utils.task_registry import count_tasks
+from utils.embeddings import get_embeddings_etag_async
+from utils.dedup import RANDOM_STATE, result_key, deduplicate
+from utils.sweep import SWEEP_MAX_POINTS, count_points, parse_points
+from utils.demo import merge_demo_results, find_demo_result, get_user_demo_dir, update_hidden, request_result_async, create_results_dir_async
 
 import structlog
 
@@ -33,59 +44,65 @@ router = APIRouter()
         }
     }
 )
-def get_reductions(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
+async def get_reductions(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
     total_time = time.time()
     response = []
     storage = request.state.storage
 
     if experiment_id.startswith('demo'):
         experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        user_reductions_dir = 'data-{}'.format(user_id)
-        reductions_dir = os.path.join(experiment_dir, user_reductions_dir, constants.REDUCTION_DIR)
+        reductions_dir = os.path.join(experiment_dir, constants.REDUCTION_DIR)
     else:
         user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
         experiment_dir = os.path.join(user_dir, experiment_id)
         reductions_dir = os.path.join(experiment_dir, constants.REDUCTION_DIR)
 
-    reductions = []
-
-    try:
-        initial_time = time.time()
-        reductions = storage.list(reductions_dir, depth=2)
-        elapsed = time.time() - initial_time
-        logger.debug(message='Listing reductions', action='get_reductions', subaction="list", status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
-
-    except:
-        if not storage.dir_exist(experiment_dir):
-            logger.error(message='Experiment id not valid', action='get_reductions', subaction="list", status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Experiment id not valid"}
-            )
-
-        if not storage.dir_exist(reductions_dir):
-            logger.error(message='Reductions dir not valid', action='get_reductions', subaction="list", status='FAILED', resource='lse-service', userid=user_id)
-            return JSONResponse(
-                status_code=404,
-                content={"message": "Reductions dir not valid"}
-            )
-
-    for reduction in reductions:
-        file_type = reduction.file_type
-        file_name = os.path.basename(reduction.path)
-
-        if file_type == 'file' and file_name == constants.METADATA_FILENAME:
-            red = {}
+    initial_time = time.time()
+    reductions = await read_manifest_async(storage, reductions_dir)
+    elapsed = time.time() - initial_time
 
-            red["id"] = reduction.path.split(os.path.sep)[-2]
+    if reductions is not None:
+        logger.debug(message='Getting reductions manifest', action='get_reductions', subaction="get_manifest", status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
 
+    else:
+        try:
             initial_time = time.time()
-            metadata = storage.get_file(reduction.path)
+            reductions = await crawl_results_async(storage, reductions_dir)
             elapsed = time.time() - initial_time
-            logger.debug(message='Getting metadata', action='get_reductions', subaction="get_file", status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
-            red['metadata'] = json.loads(metadata)
+            logger.debug(message='Listing reductions', action='get_reductions', subaction="list", status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
+
+        except:
+            paths = [experiment_dir, reductions_dir]
+            stat = dict(zip(paths, await storage.stat_many(paths)))
+
+            if stat[experiment_dir] != 'dir':
+                logger.error(message='Experiment id not valid', action='get_reductions', subaction="list", status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Experiment id not valid"}
+                )
+
+            # shared demo results dirs only exist once something was requested
+            if stat[reductions_dir] != 'dir' and not experiment_id.startswith('demo'):
+                logger.error(message='Reductions dir not valid', action='get_reductions', subaction="list", status='FAILED', resource='lse-service', userid=user_id)
+                return JSONResponse(
+                    status_code=404,
+                    content={"message": "Reductions dir not valid"}
+                )
+
+            reductions = {}
+
+        else:
+            try:
+                await run_in_threadpool(rebuild_manifest, storage.sync, reductions_dir, reductions)
+            except:
+                logger.warning(message='Reductions manifest not stored', action='get_reductions', subaction="rebuild_manifest", status='FAILED', resource='lse-service', userid=user_id)
+
+    if experiment_id.startswith('demo'):
+        reductions = await merge_demo_results(storage, experiment_id, user_id, constants.REDUCTION_DIR, reductions)
 
-            response.append(red)
+    for reduction_id, metadata in sort_results(reductions):
+        response.append({'id': reduction_id, 'metadata': metadata})
 
     elapsed = time.time() - total_time
     logger.info(message='Get reductions', action='get_reductions', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
@@ -98,25 +115,13 @@ def get_reductions(request: Request, experiment_id: str, user_id: dict = Depends
     summary="Get pending reductions count",
     response_model=ReductionPendingModel,
 )
-def get_pending_reductions_count(experiment_id: str, user_id: dict = Depends(authorization)):
+async def get_pending_reductions_count(experiment_id: str, user_id: dict = Depends(authorization)):
     total_time = time.time()
     
     response = {}
-    response['count'] = 0
-
-    inspector = tasks.celery.control.inspect()
-    workers = inspector.active().keys()
-
-    for worker_id in workers:
-        active = inspector.active().get(worker_id)
-        reserved = inspector.reserved().get(worker_id)
-
-        for task in active + reserved:
-            if 'reduction' == task['name'] and \
-                    experiment_id == task['kwargs']['experiment_id'] and \
-                    user_id == task['kwargs']['user_id']:
-
-                response['count'] += 1
+    response['count'] = sum(await asyncio.gather(*[
+        run_in_threadpool(count_tasks, name, user_id, experiment_id) for name in ('reduction', 'reduction_sweep')
+    ]))
     
     elapsed = time.time() - total_time
     logger.info(message='{} reductions in pending'.format(response['count']), action='get_pending_reductions_count', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
@@ -134,17 +139,24 @@ def get_pending_reductions_count(experiment_id: str, user_id: dict = Depends(aut
         }
     }
 )
-def get_reduction(request: Request, experiment_id: str, reduction_id: str, user_id: dict = Depends(authorization)):
+async def get_reduction(request: Request, experiment_id: str, reduction_id: str, user_id: dict = Depends(authorization)):
     total_time = time.time()
     response = {}
     storage = request.state.storage
 
     if experiment_id.startswith('demo'):
         experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        user_reductions_dir = 'data-{}'.format(user_id)
-        reduction_dir = os.path.join(
-            experiment_dir, user_reductions_dir, constants.REDUCTION_DIR, reduction_id)
-        
+        reduction_dirs = await find_demo_result(storage, experiment_id, user_id, constants.REDUCTION_DIR, reduction_id)
+
+        if not reduction_dirs:
+            logger.error(message='Reduction id not valid', action='get_reduction', status='FAILED', resource='lse-service', userid=user_id)
+            return JSONResponse(
+                status_code=404,
+                content={"message": "Reduction id not valid"}
+            )
+
+        reduction_dir = reduction_dirs[0]
+
     else:
         user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
         experiment_dir = os.path.join(user_dir, experiment_id)
@@ -158,54 +170,57 @@ def get_reduction(request: Request, experiment_id: str, reduction_id: str, user_
     try:
         # TODO make it more efficient, less call and split labels file to be less heavy to be readed
         initial_time = time.time()
-        metadata = storage.get_file(metadata_path)
+        metadata = await storage.get_file(metadata_path)
         elapsed = time.time() - initial_time
         logger.debug(message='Getting metadata', action='get_reduction', subaction="get_metadata_file", status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
         response['metadata'] = json.loads(metadata)
 
         initial_time = time.time()
-        reduction = storage.get_file(reduction_path)
+        reduction = await storage.get_file(reduction_path)
         elapsed = time.time() - initial_time
         logger.debug(message='Getting reduction', action='get_reduction', subaction="get_reduction_file", status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
         response['points'] = json.loads(reduction)
 
         initial_time = time.time()
-        labels = storage.get_file(labels_path)
+        labels = await storage.get_file(labels_path)
         elapsed = time.time() - initial_time
         logger.debug(message='Getting labels', action='get_reduction', subaction="get_labels_file", status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
         labels = json.loads(labels)
         response['ids'] = labels['columns']
 
     except:
-        if not storage.dir_exist(experiment_dir):
+        paths = [experiment_dir, reduction_dir, metadata_path, reduction_path, labels_path]
+        stat = dict(zip(paths, await storage.stat_many(paths)))
+
+        if stat[experiment_dir] != 'dir':
             logger.error(message='Experiment id not valid', action='get_reduction', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Experiment id not valid"}
             )
 
-        if not storage.dir_exist(reduction_dir):
+        if stat[reduction_dir] != 'dir':
             logger.error(message='Reduction id not valid', action='get_reduction', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Reduction id not valid"}
             )
 
-        if not storage.file_exist(metadata_path):
+        if stat[metadata_path] != 'file':
             logger.error(message='Metadata file not valid', action='get_reduction', subaction='get_metadata_file', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Reduction metadata file not exist"}
             )
 
-        if not storage.file_exist(reduction_path):
+        if stat[reduction_path] != 'file':
             logger.error(message='Reduction file not valid', action='get_reduction', subcation='get_reduction_file', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Reduction file not exist"}
             )
 
-        if not storage.file_exist(labels_path):
+        if stat[labels_path] != 'file':
             logger.error(message='Labels file not valid', action='get_reduction', subaction='get_labels_file', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
@@ -224,7 +239,7 @@ def get_reduction(request: Request, experiment_id: str, reduction_id: str, user_
     response_model=TaskBaseModel,
     status_code=201
 )
-def post_reduction(
+async def post_reduction(
     request: Request,
     reduction: Union[PCAModel, TSNEModel, UMAPModel, TruncatedSVDModel, SpectralEmbeddingModel, IsomapModel, MDSModel],
     experiment_id: str, user_id: dict = Depends(authorization)
@@ -236,33 +251,58 @@ def post_reduction(
 
     if experiment_id.startswith('demo'):
         experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        user_reductions_dir = 'data-{}'.format(user_id)
-        reductions_dir = os.path.join(experiment_dir, user_reductions_dir, constants.CLUSTER_DIR)
+        reductions_dir = os.path.join(experiment_dir, constants.REDUCTION_DIR)
     else:
         user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
         experiment_dir = os.path.join(user_dir, experiment_id)
         reductions_dir = os.path.join(experiment_dir, constants.REDUCTION_DIR)
 
-    if not storage.dir_exist(experiment_dir):
+    paths = [experiment_dir, reductions_dir]
+    stat, embeddings_etag = await asyncio.gather(storage.stat_many(paths), get_embeddings_etag_async(storage, experiment_dir))
+    stat = dict(zip(paths, stat))
+
+    if stat[experiment_dir] != 'dir':
         return JSONResponse(
             status_code=404,
             content={"message": "Experiment id not valid"}
         )
 
-    if not storage.dir_exist(reductions_dir):
+    if stat[reductions_dir] != 'dir' and experiment_id.startswith('demo'):
+        await create_results_dir_async(storage, reductions_dir)
+
+    elif stat[reductions_dir] != 'dir':
         return JSONResponse(
             status_code=404,
             content={"message": "Reductions dir not valid"}
         )
 
-    task = tasks.reduction.apply_async(
-        kwargs={
-            "algorithm": reduction.algorithm,
-            "components": reduction.components,
-            "params": reduction.params.dict(),
-            "experiment_id": experiment_id,
-            "user_id": user_id
-        }
+    kwargs = {
+        "algorithm": reduction.algorithm,
+        "components": reduction.components,
+        "params": reduction.params.dict(),
+        "experiment_id": experiment_id,
+        "user_id": user_id,
+        "random_state": RANDOM_STATE
+    }
+
+    # identical requests on the same embeddings content share the result, or the running task
+    key, task_id = None, None
+    if embeddings_etag is not None:
+        key = result_key('reduction', embeddings_etag, **kwargs)
+        on_existing = None
+        if experiment_id.startswith('demo'):
+            on_existing = functools.partial(request_result_async, storage, experiment_id, user_id, constants.REDUCTION_DIR)
+
+        task_id, duplicate = await deduplicate(storage, tasks.reduction, reductions_dir, key, kwargs, on_existing)
+
+        if duplicate:
+            logger.info(message='Reduction task deduplicated', action='post_reduction', status='SUCCESS', resource='lse-service', userid=user_id, task_id=task_id, duration=time.time() - total_time)
+            return {'task_id': task_id}
+
+    task = await run_in_threadpool(
+        tasks.reduction.apply_async,
+        kwargs=dict(kwargs, key=key),
+        task_id=task_id
     )
 
     response['task_id'] = task.id
@@ -272,6 +312,135 @@ def post_reduction(
     return response
 
 
+@router.post(
+    "/experiments/{experiment_id}/reductions/sweeps",
+    tags=["reduction"],
+    summary="Create a reduction per point of a parameter grid",
+    response_model=TaskBaseModel,
+    status_code=201,
+    responses={
+        404: {
+            "model": ErrorModel
+        },
+        422: {
+            "model": ErrorModel
+        }
+    }
+)
+async def post_reduction_sweep(request: Request, sweep: ReductionSweepModel, experiment_id: str, user_id: dict = Depends(authorization)):
+    total_time = time.time()
+    storage = request.state.storage
+
+    if experiment_id.startswith('demo'):
+        experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
+        reductions_dir = os.path.join(experiment_dir, constants.REDUCTION_DIR)
+    else:
+        user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
+        experiment_dir = os.path.join(user_dir, experiment_id)
+        reductions_dir = os.path.join(experiment_dir, constants.REDUCTION_DIR)
+
+    if not 1 <= count_points(sweep.grid) <= SWEEP_MAX_POINTS:
+        return JSONResponse(
+            status_code=422,
+            content={"message": "Grid must have between 1 and {} points".format(SWEEP_MAX_POINTS)}
+        )
+
+    try:
+        reductions = parse_points(
+            REDUCTION_MODELS[sweep.algorithm],
+            {'algorithm': sweep.algorithm, 'components': sweep.components, 'params': sweep.params},
+            sweep.grid,
+            top_level=('components',)
+        )
+    except ValidationError as error:
+        return JSONResponse(
+            status_code=422,
+            content={"message": "Grid point not valid: {}".format(error)}
+        )
+
+    paths = [experiment_dir, reductions_dir]
+    stat, embeddings_etag = await asyncio.gather(storage.stat_many(paths), get_embeddings_etag_async(storage, experiment_dir))
+    stat = dict(zip(paths, stat))
+
+    if stat[experiment_dir] != 'dir':
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Experiment id not valid"}
+        )
+
+    if stat[reductions_dir] != 'dir' and experiment_id.startswith('demo'):
+        await create_results_dir_async(storage, reductions_dir)
+
+    elif stat[reductions_dir] != 'dir':
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Reductions dir not valid"}
+        )
+
+    points = [{'components': reduction.components, 'params': reduction.params.dict()} for reduction in reductions]
+
+    # results of the sweep carry the key of the single request, so later requests reuse them
+    keys = None
+    if embeddings_etag is not None:
+        keys = [
+            result_key('reduction', embeddings_etag, algorithm=sweep.algorithm, random_state=RANDOM_STATE, **point)
+            for point in points
+        ]
+
+    task = await run_in_threadpool(
+        tasks.reduction_sweep.apply_async,
+        kwargs={
+            "algorithm": sweep.algorithm,
+            "points": points,
+            "experiment_id": experiment_id,
+            "user_id": user_id,
+            "random_state": RANDOM_STATE,
+            "keys": keys
+        }
+    )
+
+    elapsed = time.time() - total_time
+    logger.info(message='Posted reduction sweep task of {} points'.format(len(points)), action='post_reduction_sweep', subaction=sweep.algorithm, status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
+    logger.accounting(message='Posted reduction sweep task', action='Reduction', value=len(points), measure="unit", resource='lse', userid=user_id)
+
+    return {'task_id': task.id}
+
+
+@router.get(
+    "/experiments/{experiment_id}/reductions/sweeps/{sweep_id}",
+    tags=["reduction"],
+    summary="Get reduction sweep scores",
+    response_model=ReductionSweepSummaryModel,
+    responses={
+        404: {
+            "model": ErrorModel
+        }
+    }
+)
+async def get_reduction_sweep(request: Request, experiment_id: str, sweep_id: str, user_id: dict = Depends(authorization)):
+    total_time = time.time()
+    storage = request.state.storage
+
+    if experiment_id.startswith('demo'):
+        reductions_dir = os.path.join(constants.DEMO_DIR, experiment_id, constants.REDUCTION_DIR)
+    else:
+        user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
+        reductions_dir = os.path.join(user_dir, experiment_id, constants.REDUCTION_DIR)
+
+    try:
+        response = json.loads(await storage.get_file(os.path.join(reductions_dir, constants.SWEEP_FILENAME.format(sweep_id))))
+    except:
+        logger.error(message='Sweep id not valid', action='get_reduction_sweep', status='FAILED', resource='lse-service', userid=user_id)
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Sweep id not valid"}
+        )
+
+    elapsed = time.time() - total_time
+    logger.info(message='Get reduction sweep', action='get_reduction_sweep', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
+    return response
+
+
 @router.delete(
     "/experiments/{experiment_id}/reductions/{reduction_id}",
     tags=["reduction"],
@@ -282,14 +451,30 @@ def post_reduction(
         }
     }
 )
-def delete_reduction(request: Request, experiment_id: str, reduction_id: str, user_id: dict = Depends(authorization)):
+async def delete_reduction(request: Request, experiment_id: str, reduction_id: str, user_id: dict = Depends(authorization)):
     total_time = time.time()
     storage = request.state.storage
 
     if experiment_id.startswith('demo'):
         experiment_dir = os.path.join(constants.DEMO_DIR, experiment_id)
-        user_reduction_dir = 'data-{}'.format(user_id)
-        reduction_dir = os.path.join(experiment_dir, user_reduction_dir, constants.REDUCTION_DIR, reduction_id)
+        reduction_dirs = await find_demo_result(storage, experiment_id, user_id, constants.REDUCTION_DIR, reduction_id)
+
+        if not reduction_dirs:
+            logger.error(message='Reduction id not valid', action='delete_reduction', status='FAILED', resource='lse-service', userid=user_id)
+            return JSONResponse(
+                status_code=404,
+                content={"message": "Reduction id not valid"}
+            )
+
+        # shared results are hidden for the user only, a copy of their own is deleted too
+        await run_in_threadpool(update_hidden, storage.sync, experiment_id, user_id, constants.REDUCTION_DIR, hide=[reduction_id])
+        logger.debug(message='Reduction hidden', action='delete_reduction', subaction='hide_reduction', status='SUCCESS', resource='lse-service', userid=user_id)
+
+        reduction_dir = os.path.join(get_user_demo_dir(experiment_id, user_id), constants.REDUCTION_DIR, reduction_id)
+        if reduction_dir not in reduction_dirs:
+            elapsed = time.time() - total_time
+            logger.info(message='Delete reduction', action='delete_reduction', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
+            return True
     else:
         user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
         experiment_dir = os.path.join(user_dir, experiment_id)
@@ -298,25 +483,33 @@ def delete_reduction(request: Request, experiment_id: str, reduction_id: str, us
 
     try:
         initial_time = time.time()
-        storage.delete(reduction_dir)
+        await storage.delete(reduction_dir)
         elapsed = time.time() - initial_time
         logger.debug(message='Reduction deleted', action='delete_reduction', subaction='delete_reduction_dir', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
 
     except:
-        if not storage.dir_exist(experiment_dir):
+        paths = [experiment_dir, reduction_dir]
+        stat = dict(zip(paths, await storage.stat_many(paths)))
+
+        if stat[experiment_dir] != 'dir':
             logger.error(message='Experiment id not valid', action='delete_reduction', subaction='delete_reduction_dir', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Experiment id not valid"}
             )
 
-        if not storage.dir_exist(reduction_dir):
+        if stat[reduction_dir] != 'dir':
             logger.error(message='Reduction id not valid', action='delete_reduction', subaction='delete_reduction_dir', status='FAILED', resource='lse-service', userid=user_id)
             return JSONResponse(
                 status_code=404,
                 content={"message": "Reduction id not valid"}
             )
 
+    try:
+        await run_in_threadpool(update_manifest, storage.sync, os.path.dirname(reduction_dir), remove=[reduction_id])
+    except:
+        logger.warning(message='Reductions manifest not updated', action='delete_reduction', subaction='update_manifest', status='FAILED', resource='lse-service', userid=user_id)
+
     elapsed = time.time() - total_time
     logger.info(message='Delete reduction', action='delete_reduction', status='SUCCESS', resource='lse-service', userid=user_id, duration=elapsed)
 
@@ -3,6 +3,7 @@ import redis
 import time
 
 from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
 
 from celery_app.tasks import celery
 from models.responses.status import StatusModel
@@ -14,13 +15,26 @@ logger = structlog.getLogger("json_logger")
 router = APIRouter()
 
 
+def ping_queue():
+    redis_host = os.environ.get("REDIS_QUEUE_SERVICE_HOST")
+    redis_port = os.environ.get("REDIS_QUEUE_SERVICE_PORT")
+    queue = redis.Redis(host=redis_host, port=redis_port, db=0)
+    return queue.ping()
+
+
+def ping_scheduler():
+    inspect = celery.control.inspect()
+    workers = inspect.stats()
+    return len(workers.keys()) > 0
+
+
 @router.get(
     "/status",
     tags=["status"],
     summary="Get task",
     response_model=StatusModel
 )
-def get_status():
+async def get_status():
     total_time = time.time()
     response = {}
 
@@ -28,15 +42,10 @@ def get_status():
     response['server'] = True
 
     # queue
-    redis_host = os.environ.get("REDIS_QUEUE_SERVICE_HOST")
-    redis_port = os.environ.get("REDIS_QUEUE_SERVICE_PORT")
-    queue = redis.Redis(host=redis_host, port=redis_port, db=0)
-    response['queue'] = queue.ping()
+    response['queue'] = await run_in_threadpool(ping_queue)
 
     # scheduler
-    inspect = celery.control.inspect()
-    workers = inspect.stats()
-    response['scheduler'] = len(workers.keys()) > 0
+    response['scheduler'] = await run_in_threadpool(ping_scheduler)
 
     elapsed = time.time() - total_time
     logger.info(message='Get status', action='get_status', status='SUCCESS', resource='lse-service', duration=elapsed)
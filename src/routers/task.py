@@ -1,7 +1,20 @@
-from fastapi import APIRouter
+import os
+import json
+import asyncio
 
-from celery_app.tasks import celery
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from celery_app.tasks import celery, PROGRESS
 from models.responses.task import TaskModel
+from models.responses.error import ErrorModel
+
+import utils.constants as constants
+from utils.authorization import authorization
+from utils.task_registry import get_task as get_registered_task, list_tasks, unregister_task
+from utils.task_events import task_events
+from utils.manifest import drop_manifest
 
 from celery.states import state, SUCCESS
 
@@ -11,14 +24,19 @@ logger = structlog.getLogger("json_logger")
 
 router = APIRouter()
 
+EVENTS_KEEPALIVE = float(os.getenv('TASK_EVENTS_KEEPALIVE', 15))
 
-@router.get(
-    "/tasks/{task_id}",
-    tags=["tasks"],
-    summary="Get task",
-    response_model=TaskModel
-)
-def get_task(task_id):
+# results dir where each task stages its upload
+TASK_RESULTS_DIRS = {
+    'reduction': constants.REDUCTION_DIR,
+    'cluster': constants.CLUSTER_DIR,
+    'reduction_sweep': constants.REDUCTION_DIR,
+    'cluster_sweep': constants.CLUSTER_DIR
+}
+
+
+def read_task(task_id):
+    # reads from the result backend block, so this runs in the threadpool
     response = {}
     response['task_id'] = task_id
 
@@ -27,9 +45,127 @@ def get_task(task_id):
     response['status'] = task.state
 
     if task.state == state(SUCCESS):
+        result = task.get()
+        response['name'] = task.name
+
+        # results stored before stages were reported are the bare result id
+        if isinstance(result, dict):
+            response['result_id'] = result['result_id']
+            response['stages'] = result['stages']
+        else:
+            response['result_id'] = result
+
+    elif task.state == PROGRESS:
         response['name'] = task.name
-        response['result_id'] = task.get()
+        response['stage'] = task.info['stage']
+        response['stages'] = task.info['stages']
+        response['progress'] = task.info['progress']
+
+    return response
+
+
+@router.get(
+    "/tasks/{task_id}",
+    tags=["tasks"],
+    summary="Get task",
+    response_model=TaskModel
+)
+async def get_task(task_id):
+    response = await run_in_threadpool(read_task, task_id)
 
     logger.info(message='Get task', action='get_task', status='SUCCESS', resource='lse-service')
 
     return response
+
+
+def get_results_dir(task):
+    if task['experiment_id'].startswith('demo'):
+        experiment_dir = os.path.join(constants.DEMO_DIR, task['experiment_id'])
+    else:
+        user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, task['user_id'])
+        experiment_dir = os.path.join(user_dir, task['experiment_id'])
+
+    return os.path.join(experiment_dir, TASK_RESULTS_DIRS[task['name']])
+
+
+@router.delete(
+    "/tasks/{task_id}",
+    tags=["tasks"],
+    summary="Cancel task",
+    response_model=TaskModel,
+    responses={
+        404: {
+            "model": ErrorModel
+        }
+    }
+)
+async def cancel_task(request: Request, task_id: str, user_id: dict = Depends(authorization)):
+    storage = request.state.storage
+
+    # only queued and running tasks are in the registry, and each one is visible to its user only
+    task = await run_in_threadpool(get_registered_task, task_id)
+
+    if task is None or task['user_id'] != user_id:
+        logger.error(message='Task id not valid', action='cancel_task', status='FAILED', resource='lse-service', userid=user_id, task_id=task_id)
+        return JSONResponse(
+            status_code=404,
+            content={"message": "Task id not valid"}
+        )
+
+    # a queued task is dropped when a worker receives it, a running one is killed with its worker process
+    await run_in_threadpool(celery.control.revoke, task_id, terminate=True, signal='SIGTERM')
+    await run_in_threadpool(unregister_task, task_id, state='REVOKED')
+
+    results_dir = get_results_dir(task)
+
+    # a task killed between publishing a result and registering it leaves it out of the manifest
+    if task['state'] != 'PENDING':
+        await run_in_threadpool(drop_manifest, storage.sync, results_dir)
+
+    # a task killed while uploading leaves its staging dir behind
+    staging_dir = os.path.join(results_dir, constants.STAGING_DIR_PREFIX + task_id)
+    try:
+        await storage.delete(staging_dir)
+    except Exception:
+        logger.debug(message='No staging dir to clean up', action='cancel_task', subaction='delete_staging', status='SUCCESS', resource='lse-service', userid=user_id, task_id=task_id)
+
+    logger.info(message='Task cancelled', action='cancel_task', subaction=task['name'], status='SUCCESS', resource='lse-service', userid=user_id, task_id=task_id)
+
+    return {'task_id': task_id, 'status': 'REVOKED', 'name': task['name']}
+
+
+def format_event(event):
+    return 'event: task\ndata: {}\n\n'.format(json.dumps(event))
+
+
+@router.get(
+    "/experiments/{experiment_id}/tasks/events",
+    tags=["tasks"],
+    summary="Stream task events",
+    response_class=StreamingResponse
+)
+async def stream_task_events(request: Request, experiment_id: str, user_id: dict = Depends(authorization)):
+    # server-sent events: the queued and running tasks first, then every state change,
+    # ending with the final state and the result id
+    queue = task_events.subscribe(user_id, experiment_id)
+
+    async def stream():
+        try:
+            for event in await run_in_threadpool(list_tasks, user_id, experiment_id):
+                yield format_event(event)
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+
+                yield format_event(event)
+
+        finally:
+            task_events.unsubscribe(user_id, experiment_id, queue)
+
+    logger.info(message='Stream task events', action='stream_task_events', status='SUCCESS', resource='lse-service', userid=user_id)
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -1,4 +1,7 @@
+import os
 import time
+import asyncio
+import functools
 from fastapi import Header, Request
 from pydantic import Required
 
@@ -13,16 +16,78 @@ class AuthError(Exception):
         self.user_id = user_id
 
 
-def authorization(request: Request, user_id: str = Header(Required)):
+# Existence of the user dir cached per user id, so a burst of requests from one client triggers
+# at most one PROPFIND: concurrent misses for the same user await the check already in flight,
+# and share its result or its error. Runs on the event loop, so plain dicts are enough.
+class AuthorizationCache():
+    def __init__(self, ttl, negative_ttl, max_entries=10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.pending = {}
+
+    def _get(self, user_id):
+        entry = self.entries.get(user_id)
+
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+
+        return None
+
+    def _put(self, user_id, exists):
+        now = time.time()
+
+        if len(self.entries) >= self.max_entries:
+            self.entries = {key: entry for key, entry in self.entries.items() if entry[1] > now}
+
+        self.entries[user_id] = (exists, now + (self.ttl if exists else self.negative_ttl))
+
+    async def _fetch(self, user_id, fetch):
+        exists = await fetch()
+        self._put(user_id, exists)
+        return exists
+
+    def _done(self, user_id, future):
+        # dropped once settled, the error is retrieved even when every waiter went away
+        self.pending.pop(user_id, None)
+        if not future.cancelled():
+            future.exception()
+
+    async def check(self, user_id, fetch):
+        # fetch is a coroutine function, returns (exists, cached)
+        exists = self._get(user_id)
+        if exists is not None:
+            return exists, True
+
+        future = self.pending.get(user_id)
+        cached = future is not None
+
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(user_id, fetch))
+            future.add_done_callback(functools.partial(self._done, user_id))
+            self.pending[user_id] = future
+
+        # a cancelled request does not cancel the check the others are waiting on
+        return await asyncio.shield(future), cached
+
+
+authorization_cache = AuthorizationCache(
+    ttl=float(os.getenv('AUTHORIZATION_CACHE_TTL', 30)),
+    negative_ttl=float(os.getenv('AUTHORIZATION_CACHE_NEGATIVE_TTL', 5))
+)
+
+
+async def authorization(request: Request, user_id: str = Header(Required)):
     storage = request.state.storage
 
     user_dir = '{}{}'.format(constants.NEXTCLOUD_PREFIX_USER_DIR, user_id)
     initial_time = time.time()
-    user_dir_exist = storage.dir_exist(user_dir)
+    user_dir_exist, cached = await authorization_cache.check(user_id, lambda: storage.dir_exist(user_dir))
     elapsed = time.time() - initial_time
     if not user_dir_exist:
-        logger.error(message='User dir doesn\'t exist', duration=elapsed, action='authorization', subaction="check_folder_exist", status='FAILED', resource='lse-service', userid=user_id)
+        logger.error(message='User dir doesn\'t exist', duration=elapsed, action='authorization', subaction="check_folder_exist", status='FAILED', resource='lse-service', userid=user_id, cached=cached)
         raise AuthError(user_id=user_dir)
 
-    logger.debug(message='User dir exist', duration=elapsed, action='authorization', subaction="check_folder_exist", status='SUCCED', resource='lse-service', userid=user_id)
+    logger.debug(message='User dir exist', duration=elapsed, action='authorization', subaction="check_folder_exist", status='SUCCED', resource='lse-service', userid=user_id, cached=cached)
     return user_id
@@ -0,0 +1,133 @@
+import json
+import struct
+
+
+# Single object holding every part of a result, so it is written with one upload and read
+# with one GET. Layout:
+#
+#   b'LSEB' | version (uint8) | header length (uint32 little endian) | header | parts
+#
+# The header is a JSON offset table {"<part>": [offset, length], ...} relative to the end of
+# the header, so a subset of parts can be read with ranged requests.
+
+MAGIC = b'LSEB'
+VERSION = 1
+PREFIX = struct.Struct('<4sBI')
+
+HEADER_PREFETCH = 4096
+
+
+def pack_bundle(parts):
+    table = {}
+    payloads = []
+    offset = 0
+
+    for name, payload in parts:
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        table[name] = [offset, len(payload)]
+        payloads.append(payload)
+        offset += len(payload)
+
+    header = json.dumps(table).encode()
+
+    return PREFIX.pack(MAGIC, VERSION, len(header)) + header + b''.join(payloads)
+
+
+def read_prefix(data):
+    magic, version, header_length = PREFIX.unpack_from(data)
+
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a result bundle')
+
+    return PREFIX.size + header_length
+
+
+def read_header(data):
+    # returns the offset table and the absolute offset where parts start
+    payload_offset = read_prefix(data)
+    table = json.loads(bytes(data[PREFIX.size:payload_offset]))
+
+    return table, payload_offset
+
+
+def unpack_bundle(data, fields=None):
+    table, payload_offset = read_header(data)
+    fields = [name for name in fields if name in table] if fields else list(table.keys())
+
+    parts = {}
+    for name in fields:
+        offset, length = table[name]
+        parts[name] = bytes(data[payload_offset + offset:payload_offset + offset + length])
+
+    return parts
+
+
+def get_span(table, fields):
+    start = min(table[name][0] for name in fields)
+    end = max(table[name][0] + table[name][1] for name in fields)
+
+    return start, end
+
+
+def split_span(span, start, table, fields):
+    parts = {}
+    for name in fields:
+        offset, length = table[name]
+        parts[name] = span[offset - start:offset - start + length]
+
+    return parts
+
+
+def read_bundle(storage, file_path, fields=None):
+    if fields is None:
+        return unpack_bundle(storage.get_file(file_path))
+
+    # ranged access: fetch the header, then a single span covering the requested parts
+    head = storage.get_range(file_path, 0, HEADER_PREFETCH)
+    payload_offset = read_prefix(head)
+
+    if payload_offset > len(head):
+        head = storage.get_range(file_path, 0, payload_offset)
+
+    # parts added after the bundle was written are left out
+    table, payload_offset = read_header(head)
+    fields = [name for name in fields if name in table]
+    if not fields:
+        return {}
+
+    start, end = get_span(table, fields)
+
+    if payload_offset + end <= len(head):
+        span = head[payload_offset + start:payload_offset + end]
+    else:
+        span = storage.get_range(file_path, payload_offset + start, payload_offset + end)
+
+    return split_span(span, start, table, fields)
+
+
+async def read_bundle_async(storage, file_path, fields=None):
+    if fields is None:
+        return unpack_bundle(await storage.get_file(file_path))
+
+    head = await storage.get_range(file_path, 0, HEADER_PREFETCH)
+    payload_offset = read_prefix(head)
+
+    if payload_offset > len(head):
+        head = await storage.get_range(file_path, 0, payload_offset)
+
+    # parts added after the bundle was written are left out
+    table, payload_offset = read_header(head)
+    fields = [name for name in fields if name in table]
+    if not fields:
+        return {}
+
+    start, end = get_span(table, fields)
+
+    if payload_offset + end <= len(head):
+        span = head[payload_offset + start:payload_offset + end]
+    else:
+        span = await storage.get_range(file_path, payload_offset + start, payload_offset + end)
+
+    return split_span(span, start, table, fields)
@@ -0,0 +1,50 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+MAX_CONCURRENCY = int(os.getenv('STORAGE_MAX_CONCURRENCY', 8))
+
+
+def capture(callback):
+    # a failing item returns its exception instead of failing the whole batch
+    def wrapper(item):
+        try:
+            return callback(item)
+        except Exception as exception:
+            return exception
+
+    return wrapper
+
+
+def capture_async(callback):
+    async def wrapper(item):
+        try:
+            return await callback(item)
+        except Exception as exception:
+            return exception
+
+    return wrapper
+
+
+def map_concurrent(callback, items, max_workers=None):
+    # run blocking storage calls on a bounded pool, results keep the order of items
+    items = list(items)
+    max_workers = min(max_workers or MAX_CONCURRENCY, len(items))
+
+    if max_workers <= 1:
+        return [callback(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='lse-storage') as executor:
+        return list(executor.map(callback, items))
+
+
+async def gather_concurrent(callback, items, max_concurrency=None):
+    # async counterpart of map_concurrent, callback is a coroutine function
+    semaphore = asyncio.Semaphore(max_concurrency or MAX_CONCURRENCY)
+
+    async def run(item):
+        async with semaphore:
+            return await callback(item)
+
+    return list(await asyncio.gather(*[run(item) for item in items]))
@@ -2,19 +2,30 @@
 # "lse-${user_id}/${experiment_id}"
 # "lse-${user_id}/${experiment_id}/metadata.json"
 # "lse-${user_id}/${experiment_id}/embeddings.json"
+# "lse-${user_id}/${experiment_id}/embeddings.npy" (optional, preferred over embeddings.json)
+# "lse-${user_id}/${experiment_id}/knn-${metric}.npz" (nearest neighbours graph, built on demand)
+# "lse-${user_id}/${experiment_id}/linkage-${affinity}-${linkage}.npz" (agglomerative tree, built on demand)
 # "lse-${user_id}/${experiment_id}/labels.json"
 # "lse-${user_id}/${experiment_id}/images"
 # "lse-${user_id}/${experiment_id}/images/${image_id}"
 
 # "lse-${user_id}/${experiment_id}/reductions"
+# "lse-${user_id}/${experiment_id}/reductions/index.json"
 # "lse-${user_id}/${experiment_id}/reductions/${reduction_id}/metadata.json"
 # "lse-${user_id}/${experiment_id}/reductions/${reduction_id}/reduction.json"
+# "lse-${user_id}/${experiment_id}/reductions/.tmp-${task_id}" (staging, moved to ${reduction_id} once complete)
+# "lse-${user_id}/${experiment_id}/reductions/sweep-${sweep_id}.json" (scores of every result of a sweep)
 
 # "lse-${user_id}/${experiment_id}/clusters"
+# "lse-${user_id}/${experiment_id}/clusters/index.json"
+# "lse-${user_id}/${experiment_id}/clusters/${cluster_id}/cluster.bundle" (metadata, groups, scores, silhouettes and cluster silhouettes in one object)
+# "lse-${user_id}/${experiment_id}/clusters/${cluster_id}/reachability.npz" (OPTICS results only, to extract other clusterings)
 # "lse-${user_id}/${experiment_id}/clusters/${cluster_id}/metadata.json"
 # "lse-${user_id}/${experiment_id}/clusters/${cluster_id}/cluster.json"
 # "lse-${user_id}/${experiment_id}/clusters/${cluster_id}/score.json"
 # "lse-${user_id}/${experiment_id}/clusters/${cluster_id}/silhouette.json"
+# "lse-${user_id}/${experiment_id}/clusters/.tmp-${task_id}" (staging, moved to ${cluster_id} once complete)
+# "lse-${user_id}/${experiment_id}/clusters/sweep-${sweep_id}.json" (scores of every result of a sweep)
 
 # "lse-demo"
 # "lse-demo/${experiment_id}"
@@ -25,11 +36,16 @@
 # "lse-${user_id}/${experiment_id}/images"
 # "lse-${user_id}/${experiment_id}/images/${image_id}"
 
-# "lse-demo/${experiment_id}/data-${user_id}"/reductions"
+# "lse-demo/${experiment_id}/reductions" (shared store, same layout as above, created on demand)
+# "lse-demo/${experiment_id}/clusters" (shared store, same layout as above, created on demand)
+# "lse-demo/${experiment_id}/data-${user_id}/hidden.json" (shared results deleted by the user)
+# "lse-demo/${experiment_id}/data-${user_id}/requested.json" (shared results requested by the user)
+
+# "lse-demo/${experiment_id}/data-${user_id}"/reductions" (computed before results were shared)
 # "lse-demo/${experiment_id}/data-${user_id}"/reductions/${reduction_id}/metadata.json"
 # "lse-demo/${experiment_id}/data-${user_id}"/reductions/${reduction_id}/reduction.json"
 
-# "lse-demo/${experiment_id}/data-${user_id}"/clusters"
+# "lse-demo/${experiment_id}/data-${user_id}"/clusters" (computed before results were shared)
 # "lse-demo/${experiment_id}/data-${user_id}"/clusters/${cluster_id}/metadata.json"
 # "lse-demo/${experiment_id}/data-${user_id}"/clusters/${cluster_id}/cluster.json"
 # "lse-demo/${experiment_id}/data-${user_id}"/clusters/${cluster_id}/score.json"
@@ -40,13 +56,27 @@ NEXTCLOUD_PREFIX_USER_DIR = 'lse-'
 DEMO_DIR = 'lse-demo'
 
 EMBEDDINGS_FILENAME = 'embeddings.json'
+EMBEDDINGS_BINARY_FILENAME = 'embeddings.npy'
 METADATA_FILENAME = 'metadata.json'
 LABELS_FILENAME = 'labels.json'
 REDUCTION_FILENAME = 'reduction.json'
 CLUSTER_FILENAME = 'cluster.json'
 SILHOUETTE_FILENAME = 'silhouette.json'
 SCORES_FILENAME = 'scores.json'
+CLUSTER_BUNDLE_FILENAME = 'cluster.bundle'
+REACHABILITY_FILENAME = 'reachability.npz'
+MANIFEST_FILENAME = 'index.json'
+SWEEP_FILENAME = 'sweep-{}.json'
+KNN_GRAPH_FILENAME = 'knn-{}.npz'
+LINKAGE_FILENAME = 'linkage-{}-{}.npz'
+HIDDEN_FILENAME = 'hidden.json'
+REQUESTED_FILENAME = 'requested.json'
+
+MANIFEST_VERSION = 1
+
+CLUSTER_FIELDS = ['metadata', 'groups', 'scores', 'silhouettes', 'cluster_silhouettes']
 
 IMAGES_DIR = 'images'
 REDUCTION_DIR = 'reductions'
 CLUSTER_DIR = 'clusters'
+STAGING_DIR_PREFIX = '.tmp-'
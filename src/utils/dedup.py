@@ -0,0 +1,103 @@
+import os
+import json
+import uuid
+import hashlib
+
+import redis
+from celery.app.task import Context
+from celery.states import SUCCESS
+from starlette.concurrency import run_in_threadpool
+
+from utils.redis_client import get_redis
+from utils.task_registry import TASK_REGISTRY_TTL, get_task, publish_task
+from utils.manifest import read_manifest_async
+from utils.result_id import sort_results
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# Identical requests (same task, algorithm, components, params and seed on the same embeddings
+# content) are answered with the result, or the running task, of the first one. The key is
+# stored in the metadata of each result; tasks still running are found through
+# lse:inflight:<results_dir>:<user_id>:<key>, holding the id of the task computing it. Running
+# tasks are only shared within a user: their registry record, events and pending counts belong
+# to that user, and so does cancelling them. Results stored in shared demo dirs are shared.
+#
+# Tasks seed every estimator taking a random_state, so a stored result is the one a new run
+# would compute.
+
+RANDOM_STATE = int(os.getenv('TASK_RANDOM_STATE', 0))
+INFLIGHT_PREFIX = 'lse:inflight:'
+
+
+def result_key(name, embeddings_etag, **kwargs):
+    # kwargs are the task kwargs, the experiment is identified by the embeddings content
+    kwargs = {key: value for key, value in kwargs.items() if key not in ('experiment_id', 'user_id')}
+    content = json.dumps({'task': name, 'embeddings': embeddings_etag, **kwargs}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def find_result(results, key):
+    # the latest result with the key, results maps result ids to their metadata
+    result_ids = [result_id for result_id, metadata in sort_results(results) if metadata.get('key') == key]
+    return result_ids[-1] if result_ids else None
+
+
+def claim_key(results_dir, user_id, key, task_id):
+    # returns the id of a queued or running task of the user with the same key, otherwise
+    # task_id claims it
+    client = get_redis()
+    name = '{}{}:{}:{}'.format(INFLIGHT_PREFIX, results_dir, user_id, key)
+
+    if client.set(name, task_id, nx=True, ex=TASK_REGISTRY_TTL):
+        return None
+
+    current = client.get(name)
+    if current is not None and get_task(current.decode()) is not None:
+        return current.decode()
+
+    client.set(name, task_id, ex=TASK_REGISTRY_TTL)
+    return None
+
+
+def store_existing_result(task, task_id, kwargs, result_id):
+    # a task id already done, so clients follow the same flow as for a computed result
+    request = Context(task=task.name, args=[], kwargs=kwargs)
+    task.backend.store_result(task_id, {'result_id': result_id, 'stages': {}}, SUCCESS, request=request)
+
+    publish_task(task_id, {
+        'name': task.name,
+        'user_id': kwargs['user_id'],
+        'experiment_id': kwargs['experiment_id'],
+        'state': SUCCESS,
+        'result_id': result_id
+    })
+
+
+async def deduplicate(storage, task, results_dir, key, kwargs, on_existing=None):
+    # returns (task_id, duplicate): an existing task id answering the request, or a new task
+    # id to enqueue the task with. on_existing is awaited with the id of an existing result
+    task_id = str(uuid.uuid4())
+
+    results = await read_manifest_async(storage, results_dir) or {}
+    result_id = find_result(results, key)
+
+    if result_id is not None:
+        if on_existing is not None:
+            await on_existing(result_id)
+
+        await run_in_threadpool(store_existing_result, task, task_id, kwargs, result_id)
+        return task_id, True
+
+    try:
+        running_task_id = await run_in_threadpool(claim_key, results_dir, kwargs['user_id'], key, task_id)
+    except redis.RedisError as exception:
+        logger.warning(message='Task deduplication failed: {}'.format(exception), action='deduplicate', status='FAILED', resource='lse-service', userid=kwargs.get('user_id'))
+        return task_id, False
+
+    if running_task_id is not None:
+        return running_task_id, True
+
+    return task_id, False
@@ -0,0 +1,180 @@
+import os
+import json
+import asyncio
+
+from starlette.concurrency import run_in_threadpool
+
+import utils.constants as constants
+from utils.redis_client import get_redis
+from utils.manifest import read_manifest_async, crawl_results_async, rebuild_manifest, MANIFEST_LOCK_TIMEOUT
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# Results of a demo experiment live in a single store, lse-demo/<exp>/{reductions,clusters},
+# computed once for every user asking for them. Each user lists the seeded results, the ones
+# put there with the demo, and the ones they requested, kept in data-<user>/requested.json.
+# Deleting a shared result only hides it for the user, in data-<user>/hidden.json. Both hold
+#
+# {"reductions": ["<reduction_id>", ...], "clusters": ["<cluster_id>", ...]}
+#
+# Results computed in data-<user>/{reductions,clusters} before the store was shared are still
+# listed and served to their user.
+
+
+def get_demo_dir(experiment_id):
+    return os.path.join(constants.DEMO_DIR, experiment_id)
+
+
+def get_user_demo_dir(experiment_id, user_id):
+    return os.path.join(get_demo_dir(experiment_id), 'data-{}'.format(user_id))
+
+
+def get_hidden_path(experiment_id, user_id):
+    return os.path.join(get_user_demo_dir(experiment_id, user_id), constants.HIDDEN_FILENAME)
+
+
+def get_requested_path(experiment_id, user_id):
+    return os.path.join(get_user_demo_dir(experiment_id, user_id), constants.REQUESTED_FILENAME)
+
+
+def is_seeded(metadata):
+    # results computed by tasks carry their dedup key, possibly null
+    return 'key' not in metadata
+
+
+async def read_result_ids_async(storage, file_path, results_type):
+    async def fetch():
+        try:
+            return json.loads(await storage.get_file(file_path))
+        except Exception:
+            return {}
+
+    return set((await storage.cached(('result_ids',), file_path, fetch)).get(results_type, []))
+
+
+async def read_hidden_async(storage, experiment_id, user_id, results_type):
+    return await read_result_ids_async(storage, get_hidden_path(experiment_id, user_id), results_type)
+
+
+async def read_requested_async(storage, experiment_id, user_id, results_type):
+    return await read_result_ids_async(storage, get_requested_path(experiment_id, user_id), results_type)
+
+
+def update_result_ids(storage, file_path, results_type, add=(), remove=()):
+    with get_redis().lock('lse:result-ids:{}'.format(file_path), timeout=MANIFEST_LOCK_TIMEOUT, blocking_timeout=MANIFEST_LOCK_TIMEOUT):
+        try:
+            result_ids = json.loads(storage.get_file(file_path, cache=False))
+        except Exception:
+            result_ids = {}
+
+        result_ids[results_type] = sorted((set(result_ids.get(results_type, [])) | set(add)) - set(remove))
+
+        # data-<user> is created along the experiments listing, a task may finish before
+        user_demo_dir = os.path.dirname(file_path)
+        if not storage.dir_exist(user_demo_dir, cache=False):
+            storage.mkdir(user_demo_dir)
+
+        storage.put_file(file_path, json.dumps(result_ids))
+
+
+def update_hidden(storage, experiment_id, user_id, results_type, hide=(), unhide=()):
+    update_result_ids(storage, get_hidden_path(experiment_id, user_id), results_type, add=hide, remove=unhide)
+
+
+def add_requested(storage, experiment_id, user_id, results_type, result_ids):
+    update_result_ids(storage, get_requested_path(experiment_id, user_id), results_type, add=result_ids)
+
+
+async def request_result_async(storage, experiment_id, user_id, results_type, result_id):
+    # a user requesting a shared result lists it, and sees it again if they had hidden it
+    requested, hidden = await asyncio.gather(
+        read_requested_async(storage, experiment_id, user_id, results_type),
+        read_hidden_async(storage, experiment_id, user_id, results_type)
+    )
+
+    if result_id not in requested:
+        await run_in_threadpool(add_requested, storage.sync, experiment_id, user_id, results_type, [result_id])
+
+    if result_id in hidden:
+        await run_in_threadpool(update_hidden, storage.sync, experiment_id, user_id, results_type, unhide=[result_id])
+
+
+async def create_results_dir_async(storage, results_dir):
+    # shared results dirs are created by the first request on the demo experiment
+    try:
+        await storage.mkdir(results_dir)
+    except Exception:
+        if not await storage.dir_exist(results_dir, cache=False):
+            raise
+
+
+async def load_results_async(storage, results_dir):
+    # the manifest, or a crawl stored as the manifest
+    results = await read_manifest_async(storage, results_dir)
+
+    if results is None:
+        results = await crawl_results_async(storage, results_dir)
+
+        try:
+            await run_in_threadpool(rebuild_manifest, storage.sync, results_dir, results)
+        except Exception:
+            logger.warning(message='Manifest not stored', action='load_results', subaction='rebuild_manifest', status='FAILED', resource='lse-service', userid='server', path=results_dir)
+
+    return results
+
+
+async def merge_demo_results(storage, experiment_id, user_id, results_type, shared_results):
+    # the seeded and requested shared results with the user's own ones, without the hidden ones
+    user_results_dir = os.path.join(get_user_demo_dir(experiment_id, user_id), results_type)
+
+    async def load_user_results():
+        try:
+            return await load_results_async(storage, user_results_dir)
+        except Exception:
+            return {}
+
+    user_results, requested, hidden = await asyncio.gather(
+        load_user_results(),
+        read_requested_async(storage, experiment_id, user_id, results_type),
+        read_hidden_async(storage, experiment_id, user_id, results_type)
+    )
+
+    results = dict(user_results)
+    results.update({
+        result_id: metadata for result_id, metadata in shared_results.items()
+        if result_id in requested or is_seeded(metadata)
+    })
+
+    return {result_id: metadata for result_id, metadata in results.items() if result_id not in hidden}
+
+
+async def find_demo_result(storage, experiment_id, user_id, results_type, result_id):
+    # dirs holding the result visible to the user, the shared one first
+    shared_results_dir = os.path.join(get_demo_dir(experiment_id), results_type)
+    result_dirs = [
+        os.path.join(shared_results_dir, result_id),
+        os.path.join(get_user_demo_dir(experiment_id, user_id), results_type, result_id)
+    ]
+
+    stat, requested, hidden = await asyncio.gather(
+        storage.stat_many(result_dirs),
+        read_requested_async(storage, experiment_id, user_id, results_type),
+        read_hidden_async(storage, experiment_id, user_id, results_type)
+    )
+
+    if result_id in hidden:
+        return []
+
+    result_dirs = [result_dir for result_dir, file_type in zip(result_dirs, stat) if file_type == 'dir']
+
+    # shared results requested by other users only
+    if result_dirs and result_dirs[0].startswith(shared_results_dir + '/') and result_id not in requested:
+        metadata = (await load_results_async(storage, shared_results_dir)).get(result_id)
+
+        if metadata is None or not is_seeded(metadata):
+            result_dirs = result_dirs[1:]
+
+    return result_dirs
@@ -0,0 +1,166 @@
+import io
+import os
+import json
+import threading
+import asyncio
+from collections import OrderedDict
+
+import numpy as np
+
+import utils.constants as constants
+
+
+def get_embeddings_paths(experiment_dir):
+    binary_path = os.path.join(experiment_dir, constants.EMBEDDINGS_BINARY_FILENAME)
+    json_path = os.path.join(experiment_dir, constants.EMBEDDINGS_FILENAME)
+
+    return binary_path, json_path
+
+
+def decode_binary(data):
+    # parse the .npy header and view the payload in place, without copying it
+    stream = io.BytesIO(data)
+    version = np.lib.format.read_magic(stream)
+
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+
+    if dtype.hasobject:
+        raise ValueError('Embeddings with object dtype are not supported')
+
+    count = int(np.prod(shape))
+    embeddings = np.frombuffer(data, dtype=dtype, count=count, offset=stream.tell())
+
+    return embeddings.reshape(shape, order='F' if fortran_order else 'C')
+
+
+def decode_json(data):
+    return np.asarray(json.loads(data))
+
+
+class EmbeddingsCache():
+    # LRU of decoded embeddings bounded by bytes, entries are validated against the storage etag.
+    # Arrays mapped from shared memory are budgeted apart from private copies: their pages are
+    # shared with sibling processes and stay published for as long as an entry holds them
+
+    def __init__(self, max_bytes, max_shared_bytes=None, on_evict=None):
+        self.max_bytes = max_bytes
+        self.max_shared_bytes = max_shared_bytes
+        self.on_evict = on_evict
+        self.size = 0
+        self.shared_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, file_path, etag):
+        with self.lock:
+            entry = self.entries.get(file_path)
+
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(file_path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, file_path, etag, embeddings, shared=False):
+        if not shared and embeddings.nbytes > self.max_bytes:
+            # not kept, so nothing holds on to whatever backs it either
+            if self.on_evict is not None:
+                self.on_evict(file_path, etag)
+            return
+
+        # cached arrays are shared between tasks, so they must never be modified in place
+        embeddings.flags.writeable = False
+
+        with self.lock:
+            self._remove(file_path, keep_etag=etag)
+
+            self.entries[file_path] = (etag, embeddings, shared)
+            if shared:
+                self.shared_size += embeddings.nbytes
+            else:
+                self.size += embeddings.nbytes
+
+            while self.size > self.max_bytes:
+                self._remove(next(path for path, entry in self.entries.items() if not entry[2]))
+
+            # the array just put is kept even above the budget, its segment is in use
+            while self.max_shared_bytes is not None and self.shared_size > self.max_shared_bytes:
+                evicted = next((path for path, entry in self.entries.items() if entry[2] and path != file_path), None)
+                if evicted is None:
+                    break
+                self._remove(evicted)
+
+    def _remove(self, file_path, keep_etag=None):
+        entry = self.entries.pop(file_path, None)
+        if entry is not None:
+            if entry[2]:
+                self.shared_size -= entry[1].nbytes
+            else:
+                self.size -= entry[1].nbytes
+
+            if self.on_evict is not None and entry[0] != keep_etag:
+                self.on_evict(file_path, entry[0])
+
+    def stats(self):
+        return {
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'cache_entries': len(self.entries),
+            'cache_bytes': self.size,
+            'cache_shared_bytes': self.shared_size
+        }
+
+
+def get_embeddings_etag(storage, experiment_dir):
+    # etag of the embeddings file load_embeddings would read
+    binary_path, json_path = get_embeddings_paths(experiment_dir)
+    return storage.get_etag(binary_path) or storage.get_etag(json_path)
+
+
+async def get_embeddings_etag_async(storage, experiment_dir):
+    binary_etag, json_etag = await asyncio.gather(*[storage.get_etag(path) for path in get_embeddings_paths(experiment_dir)])
+    return binary_etag or json_etag
+
+
+def load_embeddings(storage, experiment_dir, cache=None, shared=None, on_stage=None):
+    binary_path, json_path = get_embeddings_paths(experiment_dir)
+
+    file_path, decode = binary_path, decode_binary
+    etag = storage.get_etag(binary_path)
+
+    if etag is None:
+        file_path, decode = json_path, decode_json
+        etag = storage.get_etag(json_path)
+
+    if cache is not None and etag is not None:
+        embeddings = cache.get(file_path, etag)
+        if embeddings is not None:
+            return embeddings
+
+    def fetch():
+        if on_stage is not None:
+            on_stage('downloading')
+        # not through the storage cache, decoded embeddings are kept by the caches above
+        data = storage.get_file(file_path, cache=False)
+
+        if on_stage is not None:
+            on_stage('parsing')
+        return decode(data)
+
+    mapped = shared is not None and etag is not None
+    if mapped:
+        embeddings = shared.get(file_path, etag, fetch)
+    else:
+        embeddings = fetch()
+
+    if cache is not None and etag is not None:
+        cache.put(file_path, etag, embeddings, shared=mapped)
+
+    return embeddings
@@ -0,0 +1,113 @@
+import io
+import os
+
+import numpy as np
+import scipy.sparse as sparse
+from sklearn.utils import check_random_state
+
+import utils.constants as constants
+from utils.embeddings import get_embeddings_etag
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# Nearest neighbours of every embedding, built once per experiment and metric with the
+# approximate search umap-learn uses (pynndescent), and stored beside the embeddings:
+#
+# "<experiment_dir>/knn-<metric>.npz" {"indices", "distances"} of shape (samples, k), each row
+# sorted by distance and starting with the sample itself, plus the embeddings "etag"
+#
+# A graph is reused while the embeddings are unchanged and it holds enough neighbours, otherwise
+# it is rebuilt with more. Below KNN_GRAPH_MIN_SAMPLES the exact search of each estimator is
+# cheap enough, and UMAP ignores precomputed neighbours anyway; above KNN_GRAPH_MAX_NEIGHBORS the
+# graph is too large to be worth storing.
+
+KNN_GRAPH_MIN_SAMPLES = int(os.getenv('KNN_GRAPH_MIN_SAMPLES', 4096))
+KNN_GRAPH_MIN_NEIGHBORS = int(os.getenv('KNN_GRAPH_MIN_NEIGHBORS', 32))
+KNN_GRAPH_MAX_NEIGHBORS = int(os.getenv('KNN_GRAPH_MAX_NEIGHBORS', 128))
+
+# metric names of the estimators, to the pynndescent metric computing the same distances
+METRICS = {
+    'euclidean': 'euclidean',
+    'l2': 'euclidean',
+    'minkowski': 'euclidean',
+    'manhattan': 'manhattan',
+    'l1': 'manhattan',
+    'cityblock': 'manhattan',
+    'chebyshev': 'chebyshev',
+    'cosine': 'cosine',
+    'correlation': 'correlation'
+}
+
+
+def get_knn_graph_path(experiment_dir, metric):
+    return os.path.join(experiment_dir, constants.KNN_GRAPH_FILENAME.format(metric))
+
+
+def encode_graph(indices, distances, etag):
+    buffer = io.BytesIO()
+    np.savez(buffer, indices=indices, distances=distances, etag=np.array(etag))
+    return buffer.getvalue()
+
+
+def decode_graph(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as graph:
+        return graph['indices'], graph['distances'], str(graph['etag'])
+
+
+def build_graph(embeddings, metric, n_neighbors, random_state=None):
+    from umap.umap_ import nearest_neighbors
+
+    indices, distances, _ = nearest_neighbors(
+        embeddings, n_neighbors, metric, {}, False, check_random_state(random_state)
+    )
+
+    return indices, distances
+
+
+def load_knn_graph(storage, experiment_dir, embeddings, metric, n_neighbors, random_state=None, on_stage=None):
+    # (indices, distances) with n_neighbors columns, the sample itself included, or None when
+    # the estimator should search the neighbours itself
+    metric = METRICS.get(metric)
+    if metric is None or len(embeddings) < KNN_GRAPH_MIN_SAMPLES or not 0 < n_neighbors <= min(KNN_GRAPH_MAX_NEIGHBORS, len(embeddings) - 1):
+        return None
+
+    etag = get_embeddings_etag(storage, experiment_dir)
+    if etag is None:
+        return None
+
+    if on_stage is not None:
+        on_stage('neighbors')
+
+    graph_path = get_knn_graph_path(experiment_dir, metric)
+
+    try:
+        indices, distances, graph_etag = decode_graph(storage.get_file(graph_path))
+
+        if graph_etag == etag and indices.shape == (len(embeddings), indices.shape[1]) and indices.shape[1] >= n_neighbors:
+            return indices[:, :n_neighbors], distances[:, :n_neighbors]
+    except Exception:
+        pass
+
+    indices, distances = build_graph(embeddings, metric, min(max(n_neighbors, KNN_GRAPH_MIN_NEIGHBORS), len(embeddings) - 1), random_state)
+
+    # approximate search may leave a sample short of neighbours
+    if (indices < 0).any():
+        return None
+
+    try:
+        storage.put_file(graph_path, encode_graph(indices, distances, etag))
+    except Exception as exception:
+        logger.warning(message='Neighbours graph not stored: {}'.format(exception), action='knn_graph', subaction='put_graph', status='FAILED', resource='lse-service', userid='celery', path=graph_path)
+
+    return indices[:, :n_neighbors], distances[:, :n_neighbors]
+
+
+def to_sparse_graph(indices, distances):
+    # distance graph accepted by the sklearn estimators as metric or affinity 'precomputed'
+    samples, neighbors = indices.shape
+    indptr = np.arange(0, samples * neighbors + 1, neighbors)
+
+    return sparse.csr_matrix((distances.ravel(), indices.ravel(), indptr), shape=(samples, samples))
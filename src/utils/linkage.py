@@ -0,0 +1,162 @@
+import io
+import os
+import asyncio
+
+import numpy as np
+from scipy.cluster import hierarchy
+
+from starlette.concurrency import run_in_threadpool
+
+import utils.constants as constants
+from utils.embeddings import get_embeddings_etag, get_embeddings_etag_async
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# Merge tree of agglomerative clustering, computed once per experiment, affinity and linkage
+# and stored beside the embeddings, so any distance_threshold or n_clusters is a cut of it:
+#
+# "<experiment_dir>/linkage-<affinity>-<linkage>.npz" {"children", "distances", "sizes"} of
+# the samples - 1 merges in order, plus the embeddings "etag"
+#
+# Nodes are numbered as in scipy and sklearn, samples first, then the node of merge i is
+# samples + i.
+
+DENDROGRAM_LEAVES = int(os.getenv('DENDROGRAM_LEAVES', 64))
+
+# affinity names of AgglomerativeClustering, to the scipy metric computing the same distances
+METRICS = {
+    'euclidean': 'euclidean',
+    'l2': 'euclidean',
+    'manhattan': 'cityblock',
+    'l1': 'cityblock',
+    'cosine': 'cosine'
+}
+
+
+def get_linkage_path(experiment_dir, affinity, linkage):
+    return os.path.join(experiment_dir, constants.LINKAGE_FILENAME.format(affinity, linkage))
+
+
+def encode_linkage(tree, etag):
+    children, distances, sizes = tree
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, children=children, distances=distances, sizes=sizes, etag=np.array(etag))
+    return buffer.getvalue()
+
+
+def decode_linkage(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as tree:
+        return (tree['children'], tree['distances'], tree['sizes']), str(tree['etag'])
+
+
+def compute_linkage(embeddings, affinity, linkage):
+    # same tree as AgglomerativeClustering without connectivity, which also builds it with scipy
+    if linkage == 'ward':
+        if affinity != 'euclidean':
+            raise ValueError('{} was provided as affinity. Ward can only work with euclidean distances.'.format(affinity))
+        tree = hierarchy.ward(embeddings)
+    else:
+        tree = hierarchy.linkage(embeddings, method=linkage, metric=METRICS[affinity])
+
+    return tree[:, :2].astype(np.int32), tree[:, 2], tree[:, 3].astype(np.int32)
+
+
+def load_linkage(storage, experiment_dir, embeddings, affinity, linkage, on_stage=None):
+    # (children, distances, sizes) of the stored tree when it matches the embeddings, otherwise
+    # computed and stored for the next cuts
+    if on_stage is not None:
+        on_stage('linkage')
+
+    linkage_path = get_linkage_path(experiment_dir, affinity, linkage)
+    etag = get_embeddings_etag(storage, experiment_dir)
+
+    if etag is not None:
+        try:
+            tree, linkage_etag = decode_linkage(storage.get_file(linkage_path))
+
+            if linkage_etag == etag and len(tree[0]) == len(embeddings) - 1:
+                return tree
+        except Exception:
+            pass
+
+    tree = compute_linkage(embeddings, affinity, linkage)
+
+    if etag is not None:
+        try:
+            storage.put_file(linkage_path, encode_linkage(tree, etag))
+        except Exception as exception:
+            logger.warning(message='Linkage not stored: {}'.format(exception), action='linkage', subaction='put_linkage', status='FAILED', resource='lse-service', userid='celery', path=linkage_path)
+
+    return tree
+
+
+async def read_linkage_async(storage, experiment_dir, affinity, linkage):
+    # stored tree when it matches the embeddings, None when it is still to be computed
+    async def get_linkage():
+        try:
+            return await storage.get_file(get_linkage_path(experiment_dir, affinity, linkage))
+        except Exception:
+            return None
+
+    data, etag = await asyncio.gather(get_linkage(), get_embeddings_etag_async(storage, experiment_dir))
+    if data is None or etag is None:
+        return None
+
+    tree, linkage_etag = await run_in_threadpool(decode_linkage, data)
+    return tree if linkage_etag == etag else None
+
+
+def count_clusters(distances, distance_threshold):
+    # clusters left by AgglomerativeClustering(distance_threshold=...), merges at or above it are undone
+    return int(np.count_nonzero(distances >= distance_threshold)) + 1
+
+
+def cut_linkage(children, n_clusters):
+    # labels 0..n_clusters-1 of the samples once the last n_clusters - 1 merges are undone
+    samples = len(children) + 1
+    n_clusters = min(max(n_clusters, 1), samples)
+    merges = samples - n_clusters
+
+    # every node points to the node it is merged into, roots to themselves, then pointer jumping
+    parents = np.arange(2 * samples - 1)
+    parents[children[:merges].ravel()] = np.repeat(samples + np.arange(merges), 2)
+
+    while True:
+        jumped = parents[parents]
+        if (jumped == parents).all():
+            break
+        parents = jumped
+
+    _, labels = np.unique(parents[:samples], return_inverse=True)
+    return labels
+
+
+def summarize_linkage(children, distances, sizes, leaves=DENDROGRAM_LEAVES):
+    # top of the tree for the UI: the subtrees left once the last leaves - 1 merges are undone,
+    # numbered by their order in those merges, then the merges numbered from leaves on as in scipy
+    samples = len(children) + 1
+    leaves = min(max(leaves, 1), samples)
+    first = samples - leaves
+
+    def size(node):
+        return 1 if node < samples else int(sizes[node - samples])
+
+    top = children[first:]
+    nodes = [int(node) for node in top.ravel() if node < samples + first]
+
+    numbers = {node: number for number, node in enumerate(nodes)}
+    for merge in range(len(top)):
+        numbers[samples + first + merge] = leaves + merge
+
+    return {
+        'samples': samples,
+        'leaves': [size(node) for node in nodes] if nodes else [samples],
+        'merges': [
+            [numbers[left], numbers[right], float(distance), int(merge_size)]
+            for (left, right), distance, merge_size in zip(top.tolist(), distances[first:], sizes[first:])
+        ]
+    }
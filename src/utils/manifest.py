@@ -0,0 +1,197 @@
+import os
+import json
+import time
+
+import utils.constants as constants
+from utils.redis_client import get_redis
+from utils.retry import retry
+from utils.concurrency import map_concurrent, gather_concurrent
+from utils.bundle import read_bundle, read_bundle_async
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# Each results dir (reductions/, clusters/) keeps an index.json holding the metadata of every
+# result, so listing is a single GET instead of a depth 2 PROPFIND plus one GET per result.
+#
+# {"version": 1, "updated": 1690000000.0, "results": {"<result_id>": {<metadata>}, ...}}
+
+MANIFEST_MAX_AGE = int(os.getenv('MANIFEST_MAX_AGE', 24 * 60 * 60))
+MANIFEST_LOCK_TIMEOUT = 60
+MANIFEST_RETRIES = int(os.getenv('MANIFEST_RETRIES', 2))
+
+
+def get_manifest_path(results_dir):
+    return os.path.join(results_dir, constants.MANIFEST_FILENAME)
+
+
+def parse_manifest(data):
+    try:
+        manifest = json.loads(data)
+    except ValueError:
+        return None
+
+    if not isinstance(manifest, dict) or manifest.get('version') != constants.MANIFEST_VERSION:
+        return None
+
+    if time.time() - manifest.get('updated', 0) > MANIFEST_MAX_AGE:
+        return None
+
+    return manifest.get('results')
+
+
+def read_manifest(storage, results_dir, cache=True):
+    # returns None when the manifest is missing or stale
+    manifest_path = get_manifest_path(results_dir)
+
+    try:
+        if not cache:
+            return parse_manifest(storage.get_file(manifest_path, cache=False))
+
+        return storage.cached(('manifest',), manifest_path, lambda: parse_manifest(storage.get_file(manifest_path)))
+    except Exception:
+        return None
+
+
+async def read_manifest_async(storage, results_dir):
+    manifest_path = get_manifest_path(results_dir)
+
+    async def fetch():
+        return parse_manifest(await storage.get_file(manifest_path))
+
+    try:
+        return await storage.cached(('manifest',), manifest_path, fetch)
+    except Exception:
+        return None
+
+
+def index_results(items):
+    # results store their metadata either in metadata.json or inside a bundle
+    metadata_paths = {}
+    bundle_paths = {}
+
+    for result in items:
+        file_name = os.path.basename(result['path'])
+
+        if result['file_type'] != 'file':
+            continue
+
+        result_id = result['path'].split(os.path.sep)[-2]
+
+        # staging dirs of results still being uploaded
+        if result_id.startswith(constants.STAGING_DIR_PREFIX):
+            continue
+
+        if file_name == constants.METADATA_FILENAME:
+            metadata_paths[result_id] = result['path']
+        elif file_name == constants.CLUSTER_BUNDLE_FILENAME:
+            bundle_paths[result_id] = result['path']
+
+    result_ids = list(metadata_paths.keys()) + [result_id for result_id in bundle_paths if result_id not in metadata_paths]
+
+    return result_ids, metadata_paths, bundle_paths
+
+
+def crawl_results(storage, results_dir, cache=True):
+    result_ids, metadata_paths, bundle_paths = index_results(storage.list(results_dir, depth=2, cache=cache))
+
+    def get_metadata(result_id):
+        if result_id in metadata_paths:
+            return json.loads(storage.get_file(metadata_paths[result_id], cache=cache))
+
+        return json.loads(read_bundle(storage, bundle_paths[result_id], ['metadata'])['metadata'])
+
+    return dict(zip(result_ids, map_concurrent(get_metadata, result_ids)))
+
+
+async def crawl_results_async(storage, results_dir):
+    result_ids, metadata_paths, bundle_paths = index_results(await storage.list(results_dir, depth=2))
+
+    async def get_metadata(result_id):
+        if result_id in metadata_paths:
+            return json.loads(await storage.get_file(metadata_paths[result_id]))
+
+        return json.loads((await read_bundle_async(storage, bundle_paths[result_id], ['metadata']))['metadata'])
+
+    return dict(zip(result_ids, await gather_concurrent(get_metadata, result_ids)))
+
+
+def write_manifest(storage, results_dir, results):
+    manifest = {
+        'version': constants.MANIFEST_VERSION,
+        'updated': time.time(),
+        'results': results
+    }
+
+    storage.put_file(get_manifest_path(results_dir), json.dumps(manifest))
+
+
+def manifest_lock(results_dir):
+    return get_redis().lock(
+        'lse:manifest:{}'.format(results_dir),
+        timeout=MANIFEST_LOCK_TIMEOUT,
+        blocking_timeout=MANIFEST_LOCK_TIMEOUT
+    )
+
+
+def update_manifest(storage, results_dir, add=None, remove=None):
+    # read-modify-write under a lock shared by every server replica and worker, bypassing caches
+    with manifest_lock(results_dir):
+        results = read_manifest(storage, results_dir, cache=False)
+
+        if results is None:
+            results = crawl_results(storage, results_dir, cache=False)
+
+        if add is not None:
+            results.update(add)
+
+        for result_id in remove or []:
+            results.pop(result_id, None)
+
+        write_manifest(storage, results_dir, results)
+
+    return results
+
+
+def register_results(storage, results_dir, results):
+    # called once results are published, so it never fails the task: when the manifest cannot
+    # be updated it is dropped, and the next reader rebuilds it from the results dir
+    try:
+        retry(max=MANIFEST_RETRIES)(update_manifest)(storage, results_dir, add=results)
+        return True
+
+    except Exception as exception:
+        logger.error(message='Manifest update failed: {}'.format(exception), action='register_results', status='FAILED', resource='lse-service', userid='celery', path=results_dir)
+        drop_manifest(storage, results_dir)
+        return False
+
+
+def drop_manifest(storage, results_dir):
+    # under the lock when it can be taken, so a concurrent writer does not put back a stale copy
+    manifest_path = get_manifest_path(results_dir)
+
+    try:
+        try:
+            lock = manifest_lock(results_dir)
+            locked = lock.acquire()
+        except Exception:
+            locked = False
+
+        try:
+            if storage.file_exist(manifest_path, cache=False):
+                storage.delete(manifest_path)
+        finally:
+            if locked:
+                lock.release()
+
+    except Exception as exception:
+        logger.error(message='Manifest drop failed: {}'.format(exception), action='drop_manifest', status='FAILED', resource='lse-service', userid='celery', path=results_dir)
+
+
+def rebuild_manifest(storage, results_dir, results):
+    # store a crawl done by a reader, unless a writer rebuilt the manifest in the meantime
+    with manifest_lock(results_dir):
+        if read_manifest(storage, results_dir, cache=False) is None:
+            write_manifest(storage, results_dir, results)
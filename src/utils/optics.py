@@ -0,0 +1,52 @@
+import io
+
+import numpy as np
+from sklearn.cluster import cluster_optics_dbscan, cluster_optics_xi
+
+
+# Reachability plot of an OPTICS run, stored with its result so clusterings at other eps or
+# xi are extracted from it without running OPTICS again:
+#
+# "<cluster_dir>/reachability.npz" {"reachability", "ordering", "core_distances",
+# "predecessor"} of the fitted estimator, plus the "min_samples" it was fitted with
+
+def reachability_plot(optics):
+    return {
+        'reachability': optics.reachability_,
+        'ordering': optics.ordering_,
+        'core_distances': optics.core_distances_,
+        'predecessor': optics.predecessor_,
+        'min_samples': np.array(optics.min_samples)
+    }
+
+
+def encode_reachability(plot):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **plot)
+    return buffer.getvalue()
+
+
+def decode_reachability(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as plot:
+        return {name: plot[name] for name in plot.files}
+
+
+def extract_clusters(plot, cluster_method, eps=None, xi=0.05, min_cluster_size=None):
+    # labels OPTICS would have given with these extraction params, -1 for noise
+    if cluster_method == 'dbscan':
+        return cluster_optics_dbscan(
+            reachability=plot['reachability'],
+            core_distances=plot['core_distances'],
+            ordering=plot['ordering'],
+            eps=np.inf if eps is None else eps
+        )
+
+    labels, _ = cluster_optics_xi(
+        reachability=plot['reachability'],
+        predecessor=plot['predecessor'],
+        ordering=plot['ordering'],
+        min_samples=plot['min_samples'].item(),
+        min_cluster_size=min_cluster_size,
+        xi=xi
+    )
+    return labels
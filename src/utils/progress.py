@@ -0,0 +1,31 @@
+import time
+
+
+# Coarse stages of a task (downloading, parsing, fitting, scoring, uploading, registering),
+# with the seconds spent in each. Every stage change, and every progress update within a
+# stage, is passed to report as {"stage", "stages", "progress"}.
+class StageReporter():
+    def __init__(self, report=None):
+        self.report = report
+        self.stage = None
+        self.started = None
+        self.stages = {}
+
+    def _close(self, now):
+        if self.stage is not None:
+            self.stages[self.stage] = round(self.stages.get(self.stage, 0) + now - self.started, 3)
+
+    def __call__(self, stage, **progress):
+        now = time.time()
+
+        if stage != self.stage:
+            self._close(now)
+            self.stage, self.started = stage, now
+
+        if self.report is not None:
+            self.report({'stage': stage, 'stages': dict(self.stages), 'progress': progress or None})
+
+    def finish(self):
+        self._close(time.time())
+        self.stage = None
+        return dict(self.stages)
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import threading
+
+import redis
+
+from utils.redis_client import get_redis
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# Second cache tier shared by every server replica and worker. Entries of a path live in one
+# hash, lse:cache:<path>, so a write drops the path, its ancestors (listings and computed
+# payloads built from their content) and its descendants. Invalidated paths are published on
+# a channel so each replica also evicts its in-process tier.
+#
+# Entries are stored as JSON, never pickled, since anyone able to write to Redis would otherwise
+# run code in every reader. File contents follow the JSON header as raw bytes. Encoded entries
+# are compressed with zlib above a size threshold; entries larger than the size limit, or
+# holding values JSON cannot represent, are kept in the process tier only.
+
+KEY_PREFIX = 'lse:cache:'
+CHANNEL = 'lse:cache:invalidate'
+
+RAW = b'\x00'
+COMPRESSED = b'\x01'
+
+
+class RedisCache():
+    def __init__(self, max_value_bytes=1024 * 1024, compress_min_bytes=1024, retain=60):
+        self.max_value_bytes = max_value_bytes
+        self.compress_min_bytes = compress_min_bytes
+        # expired entries are kept a little longer so their etag can be revalidated
+        self.retain = retain
+        self.origin = uuid.uuid4().hex
+        self.subscriber = None
+
+    def _name(self, path):
+        return KEY_PREFIX + path
+
+    def _field(self, key):
+        return json.dumps(key)
+
+    def encode(self, entry):
+        binary = isinstance(entry['value'], bytes)
+        header = {'entry': dict(entry, value=None) if binary else entry, 'binary': binary}
+        data = json.dumps(header).encode() + b'\n' + (entry['value'] if binary else b'')
+
+        if len(data) >= self.compress_min_bytes:
+            return COMPRESSED + zlib.compress(data)
+
+        return RAW + data
+
+    def decode(self, data):
+        if data[:1] == COMPRESSED:
+            data = zlib.decompress(data[1:])
+        else:
+            data = data[1:]
+
+        # the JSON header never holds a raw newline, the payload may
+        header, _, payload = data.partition(b'\n')
+        header = json.loads(header)
+
+        entry = header['entry']
+        if header['binary']:
+            entry['value'] = payload
+
+        return entry
+
+    def get(self, key, path):
+        try:
+            data = get_redis().hget(self._name(path), self._field(key))
+        except redis.RedisError as exception:
+            logger.warning(message='Redis cache read failed: {}'.format(exception), action='redis_cache', subaction='get', status='FAILED', resource='lse-service', userid='server')
+            return None
+
+        if data is None:
+            return None
+
+        try:
+            return self.decode(data)
+        except (ValueError, KeyError, TypeError, zlib.error) as exception:
+            logger.warning(message='Redis cache entry not valid: {}'.format(exception), action='redis_cache', subaction='get', status='FAILED', resource='lse-service', userid='server')
+            return None
+
+    def set(self, key, path, entry):
+        # checked on the raw size first, so large files are never copied and compressed to be dropped
+        size = len(entry['value']) if isinstance(entry['value'], bytes) else entry['size']
+        if size > self.max_value_bytes:
+            return
+
+        try:
+            data = self.encode(entry)
+        except (TypeError, ValueError):
+            return
+
+        if len(data) > self.max_value_bytes:
+            return
+
+        name = self._name(path)
+        expire = max(int(entry['expires'] - time.time()), 0) + self.retain
+
+        try:
+            pipeline = get_redis().pipeline()
+            pipeline.hset(name, self._field(key), data)
+            pipeline.expire(name, expire)
+            pipeline.execute()
+        except redis.RedisError as exception:
+            logger.warning(message='Redis cache write failed: {}'.format(exception), action='redis_cache', subaction='set', status='FAILED', resource='lse-service', userid='server')
+
+    def invalidate(self, path):
+        names = [self._name(path)]
+
+        ancestor = path
+        while ancestor:
+            ancestor = ancestor.rsplit('/', 1)[0] if '/' in ancestor else ''
+            names.append(self._name(ancestor))
+
+        try:
+            client = get_redis()
+            names += list(client.scan_iter(match=escape(self._name(path)) + '/*', count=1000))
+
+            pipeline = client.pipeline()
+            pipeline.delete(*names)
+            pipeline.publish(CHANNEL, json.dumps({'origin': self.origin, 'path': path}))
+            pipeline.execute()
+        except redis.RedisError as exception:
+            logger.warning(message='Redis cache invalidation failed: {}'.format(exception), action='redis_cache', subaction='invalidate', status='FAILED', resource='lse-service', userid='server', path=path)
+
+    def subscribe(self, on_invalidate, on_reset):
+        # started lazily, so prefork worker processes subscribe after the fork
+        if self.subscriber is not None and self.subscriber[0] == os.getpid():
+            return
+
+        thread = threading.Thread(target=self._listen, args=(on_invalidate, on_reset), name='lse-cache-invalidation', daemon=True)
+        self.subscriber = (os.getpid(), thread)
+        thread.start()
+
+    def _listen(self, on_invalidate, on_reset):
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+
+                # messages may have been missed while disconnected
+                on_reset()
+
+                for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+
+                    invalidation = json.loads(message['data'])
+                    if invalidation['origin'] != self.origin:
+                        on_invalidate(invalidation['path'])
+
+            except Exception as exception:
+                logger.warning(message='Redis cache invalidation listener failed: {}'.format(exception), action='redis_cache', subaction='subscribe', status='FAILED', resource='lse-service', userid='server')
+                time.sleep(1)
+
+
+def escape(pattern):
+    for char in '\\*?[]':
+        pattern = pattern.replace(char, '\\' + char)
+
+    return pattern
+
+
+def redis_cache_from_env():
+    if os.getenv('REDIS_CACHE_ENABLED', 'false').lower() != 'true':
+        return None
+
+    return RedisCache(
+        max_value_bytes=int(os.getenv('REDIS_CACHE_MAX_VALUE_BYTES', 1024 * 1024)),
+        compress_min_bytes=int(os.getenv('REDIS_CACHE_COMPRESS_MIN_BYTES', 1024)),
+        retain=int(os.getenv('REDIS_CACHE_RETAIN', 60))
+    )
@@ -0,0 +1,19 @@
+import os
+import redis
+
+
+client = None
+
+
+def get_redis():
+    global client
+
+    # created lazily, so prefork worker processes open their own connections after the fork
+    if client is None:
+        client = redis.Redis(
+            host=os.environ.get("REDIS_QUEUE_SERVICE_HOST"),
+            port=os.environ.get("REDIS_QUEUE_SERVICE_PORT"),
+            db=0
+        )
+
+    return client
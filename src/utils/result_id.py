@@ -0,0 +1,36 @@
+import os
+import time
+
+
+# Result ids are "<milliseconds since epoch, 13 digits>-<12 random hex digits>", so tasks
+# finishing in the same millisecond on any worker never share a result dir, and ids sort
+# chronologically as strings. Results stored before were named after the epoch second.
+
+RANDOM_BYTES = 6
+# both shapes, for validating ids that end up in storage paths
+RESULT_ID_PATTERN = r'^\d+(-[0-9a-f]{12})?$'
+
+
+def new_result_id(timestamp=None):
+    if timestamp is None:
+        timestamp = time.time()
+
+    return '{:013d}-{}'.format(int(timestamp * 1000), os.urandom(RANDOM_BYTES).hex())
+
+
+def result_sort_key(result_id):
+    # (milliseconds, id), with legacy ids scaled to milliseconds and unknown ids sorted first
+    timestamp = result_id.split('-', 1)[0]
+
+    if not timestamp.isdigit():
+        return (0, result_id)
+
+    if '-' not in result_id:
+        return (int(timestamp) * 1000, result_id)
+
+    return (int(timestamp), result_id)
+
+
+def sort_results(results):
+    # results maps result ids to their metadata
+    return sorted(results.items(), key=lambda item: result_sort_key(item[0]))
@@ -1,4 +1,5 @@
 import time
+import asyncio
 
 import structlog
 
@@ -26,3 +27,27 @@ def retry(exceptions=(Exception), max=3, delay=3, backoff=1):
             return callback(*args, **kwargs)
         return wrapper
     return decorator
+
+
+def retry_async(exceptions=(Exception), max=3, delay=3, backoff=1):
+    def decorator(callback):
+        async def wrapper(*args, **kwargs):
+            attempts = 0
+
+            while (max - attempts) > 0:
+                try:
+                    return await callback(*args, **kwargs)
+
+                except exceptions as exception:
+                    sleep = delay ** (backoff * attempts)
+
+                    print('retry exception:\n\t{}\n\tattempts: {}\n\tsleep: {}'.format(
+                        exception, attempts, sleep))
+
+                    attempts += 1
+                    logger.debug(message='Retry {}'.format(attempts), action='retry', status='SUCCESS', resource='lse-service')
+                    await asyncio.sleep(sleep)
+
+            return await callback(*args, **kwargs)
+        return wrapper
+    return decorator
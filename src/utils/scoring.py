@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+import scipy.sparse as sparse
+from sklearn import config_context
+from sklearn.metrics import pairwise_distances_chunked, calinski_harabasz_score, davies_bouldin_score
+from sklearn.utils import check_random_state
+
+
+# Scores of a clustering: silhouette of every sample, its aggregates per cluster, and the
+# calinski-harabasz and davies-bouldin scores. Silhouettes are O(n²), so they are computed
+# by rows of distances bounded by SCORING_WORKING_MEMORY (MiB), over SCORING_N_JOBS cores:
+#
+# exact    every sample
+# sampled  SCORING_SAMPLE_SIZE samples drawn with the task random_state, against every sample,
+#          the others get None, the mean comes with its standard error
+# off      nothing is scored
+# auto     exact up to SCORING_EXACT_MAX_SAMPLES samples, sampled above
+
+SCORING_MODES = ('auto', 'exact', 'sampled', 'off')
+SCORING_MODE = os.getenv('SCORING_MODE', 'auto')
+SCORING_EXACT_MAX_SAMPLES = int(os.getenv('SCORING_EXACT_MAX_SAMPLES', 20000))
+SCORING_SAMPLE_SIZE = int(os.getenv('SCORING_SAMPLE_SIZE', 10000))
+SCORING_WORKING_MEMORY = int(os.getenv('SCORING_WORKING_MEMORY', 256))
+SCORING_N_JOBS = int(os.getenv('SCORING_N_JOBS', 1))
+
+
+def resolve_mode(mode, samples):
+    mode = mode or SCORING_MODE
+
+    if mode == 'auto':
+        mode = 'exact' if samples <= SCORING_EXACT_MAX_SAMPLES else 'sampled'
+    if mode == 'sampled' and samples <= SCORING_SAMPLE_SIZE:
+        mode = 'exact'
+
+    return mode
+
+
+def silhouette_rows(embeddings, labels, rows, metric='euclidean'):
+    # silhouette of the samples at rows, against every sample, as silhouette_samples computes it
+    codes, encoded = np.unique(labels, return_inverse=True)
+    counts = np.bincount(encoded, minlength=len(codes))
+    members = sparse.csr_matrix(
+        (np.ones(len(encoded)), (np.arange(len(encoded)), encoded)),
+        shape=(len(encoded), len(codes))
+    )
+
+    # distance of each row to every cluster, summed
+    sums = []
+    with config_context(working_memory=SCORING_WORKING_MEMORY):
+        for chunk in pairwise_distances_chunked(embeddings[rows], embeddings, metric=metric, n_jobs=SCORING_N_JOBS):
+            sums.append(members.T.dot(chunk.T).T)
+    sums = np.vstack(sums)
+
+    own = encoded[rows]
+    index = np.arange(len(rows))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intra = sums[index, own] / np.maximum(counts[own] - 1, 1)
+
+        sums[index, own] = np.inf
+        inter = (sums / counts).min(axis=1)
+
+        silhouettes = np.nan_to_num((inter - intra) / np.maximum(intra, inter))
+
+    silhouettes[counts[own] == 1] = 0
+    return silhouettes
+
+
+def aggregate_silhouettes(labels, rows, silhouettes):
+    # per cluster: size, scored samples, mean with its standard error, min and max
+    aggregates = []
+
+    for label in np.unique(labels):
+        values = silhouettes[labels[rows] == label]
+        size = int((labels == label).sum())
+
+        aggregate = {'cluster': int(label), 'size': size, 'samples': len(values)}
+        if len(values):
+            aggregate.update(
+                mean=float(values.mean()),
+                stderr=standard_error(values, size),
+                min=float(values.min()),
+                max=float(values.max())
+            )
+
+        aggregates.append(aggregate)
+
+    return aggregates
+
+
+def standard_error(values, population):
+    # of the mean of values sampled without replacement from population, 0 when all are there
+    if len(values) < 2 or len(values) >= population:
+        return 0.0
+
+    return float(values.std(ddof=1) / np.sqrt(len(values)) * np.sqrt(1 - len(values) / population))
+
+
+def score_clusters(embeddings, clusters, mode=None, random_state=None):
+    # (mode, silhouettes, cluster silhouettes, scores), empty for a single group or when off
+    samples = len(embeddings)
+    mode = resolve_mode(mode, samples)
+
+    if mode == 'off' or not 2 <= len(np.unique(clusters)) < samples:
+        return mode, [], [], {}
+
+    if mode == 'sampled':
+        rows = np.sort(check_random_state(random_state).choice(samples, SCORING_SAMPLE_SIZE, replace=False))
+    else:
+        rows = np.arange(samples)
+
+    values = silhouette_rows(embeddings, clusters, rows)
+
+    if mode == 'sampled':
+        silhouettes = [None] * samples
+        for row, value in zip(rows.tolist(), values.tolist()):
+            silhouettes[row] = value
+    else:
+        silhouettes = values.tolist()
+
+    scores = {
+        'calinski_harabasz_score': calinski_harabasz_score(embeddings, clusters),
+        'davies_bouldin_score': davies_bouldin_score(embeddings, clusters),
+        'silhouette_score': float(values.mean())
+    }
+    if mode == 'sampled':
+        scores['silhouette_stderr'] = standard_error(values, samples)
+        scores['silhouette_sample_size'] = len(rows)
+
+    return mode, silhouettes, aggregate_silhouettes(clusters, rows, values), scores
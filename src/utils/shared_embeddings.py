@@ -0,0 +1,122 @@
+import os
+import fcntl
+import hashlib
+
+import numpy as np
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# Embeddings published as .npy files in a tmpfs directory (/dev/shm) and mapped read-only
+# by every worker process, so sibling processes share one copy of the pages.
+#
+# Reference counting relies on flock: each attached process holds a shared lock on the
+# segment lock file, so the kernel drops the reference even if the process dies. A process
+# detaching tries to upgrade to an exclusive lock; if it succeeds nobody else is attached
+# and the segment is unlinked.
+
+SEGMENT_PREFIX = 'lse-embeddings-'
+
+
+class SharedEmbeddings():
+    def __init__(self, directory='/dev/shm'):
+        self.directory = directory
+        self.attached = {}
+
+    def _paths(self, file_path, etag):
+        key = hashlib.sha1('{}:{}'.format(file_path, etag).encode()).hexdigest()
+        base = os.path.join(self.directory, '{}{}'.format(SEGMENT_PREFIX, key))
+
+        return key, base + '.npy', base + '.lock', base + '.create'
+
+    def _lock_shared(self, lock_path):
+        # retry until the held lock file is the one linked on disk, a detaching process
+        # may unlink it between our open and flock
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_SH)
+
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(fd).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+
+            os.close(fd)
+
+    def get(self, file_path, etag, loader):
+        key, data_path, lock_path, create_path = self._paths(file_path, etag)
+
+        if key in self.attached:
+            return self.attached[key][1]
+
+        lock_fd = self._lock_shared(lock_path)
+
+        try:
+            if not os.path.exists(data_path):
+                # serialize creation so only the first process downloads and decodes
+                create_fd = os.open(create_path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(create_fd, fcntl.LOCK_EX)
+
+                try:
+                    if not os.path.exists(data_path):
+                        self._publish(data_path, loader())
+                        logger.info(message='Embeddings published to shared memory', action='shared_embeddings', subaction='publish', status='SUCCESS', resource='lse-service', userid='celery', path=file_path)
+                finally:
+                    os.close(create_fd)
+
+            embeddings = np.load(data_path, mmap_mode='r', allow_pickle=False)
+
+        except Exception:
+            os.close(lock_fd)
+            raise
+
+        self.attached[key] = (lock_fd, embeddings, data_path, lock_path, create_path)
+        return embeddings
+
+    def _publish(self, data_path, embeddings):
+        temp_path = '{}.{}.tmp'.format(data_path, os.getpid())
+        with open(temp_path, 'wb') as file:
+            np.save(file, np.ascontiguousarray(embeddings), allow_pickle=False)
+
+        os.replace(temp_path, data_path)
+
+    def release(self, file_path, etag):
+        key = self._paths(file_path, etag)[0]
+        entry = self.attached.pop(key, None)
+
+        if entry is not None:
+            self._detach(*entry)
+
+    def _detach(self, lock_fd, embeddings, data_path, lock_path, create_path):
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        except BlockingIOError:
+            # other processes are still attached
+            os.close(lock_fd)
+            return
+
+        for path in (data_path, create_path, lock_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+        os.close(lock_fd)
+
+    def close(self):
+        while self.attached:
+            self._detach(*self.attached.popitem()[1])
+
+    def sweep(self):
+        # unlink segments left behind by processes that exited without detaching
+        for name in os.listdir(self.directory):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith('.lock')):
+                continue
+
+            base = os.path.join(self.directory, name[:-len('.lock')])
+            lock_fd = self._lock_shared(base + '.lock')
+            self._detach(lock_fd, None, base + '.npy', base + '.lock', base + '.create')
@@ -1,9 +1,14 @@
+import os
+import json
+
 from utils.storage_owncloud import Storage_owncloud
 from utils.storage_minio import Storage_minio
+from utils.storage_cache import LIST_ENTRY_SIZE, listing_entries
+from utils.concurrency import map_concurrent, capture
 
 class Storage():
-    
-    def __init__(self, host, storage_type:str = "Nextcloud", **kwargs):
+
+    def __init__(self, host, storage_type:str = "Nextcloud", cache=None, **kwargs):
         if storage_type == "Nextcloud":
             self.storage_type = "owncloud"
             self.storage = Storage_owncloud(host)
@@ -13,35 +18,105 @@ class Storage():
         else:
             raise Exception("Storage type not yet implemented")
 
+        # optional read-through cache, see utils/storage_cache.py
+        self.cache = cache
+
+    def _cache_path(self, path, bucket_name=""):
+        return os.path.join(bucket_name, path).strip('/')
+
+    def _invalidate(self, *paths, bucket_name=""):
+        if self.cache is not None:
+            for path in paths:
+                self.cache.invalidate(self._cache_path(path, bucket_name))
+
     def connect(self, user, password):
         return self.storage.connect(user, password) if self.storage_type == "owncloud" else None
-    
+
     def disconnect(self):
         return self.storage.disconnect() if self.storage_type == "owncloud" else None
-    
-    def file_exist(self, file_path, bucket_name=""):
-        return self.storage.file_exist(file_path) if self.storage_type == "owncloud" else self.storage.file_exist(bucket_name=bucket_name, file_path=file_path)
-    
-    def dir_exist(self, dir_path="", bucket_name=""):
-        return self.storage.dir_exist(dir_path=dir_path) if self.storage_type == "owncloud" else self.storage.dir_exist(bucket_name=bucket_name)
-    
-    def list(self, dir_path, bucket_name="", depth=1, prefix=None, recursive=False):
-        return self.storage.list(dir_path=dir_path, depth=depth) if self.storage_type == "owncloud" else self.storage.list(bucket_name=bucket_name, prefix=prefix, recursive=recursive)
-    
-    def get_file(self, file_path, bucket_name=""):
-        return self.storage.get_file(file_path) if self.storage_type == "owncloud" else self.storage.get_file(bucket_name=bucket_name, file_path=file_path)
-    
+
+    def file_exist(self, file_path, bucket_name="", cache=True):
+        fetch = lambda: self.storage.file_exist(file_path) if self.storage_type == "owncloud" else self.storage.file_exist(bucket_name=bucket_name, file_path=file_path)
+
+        if self.cache is None or not cache:
+            return fetch()
+        return self.cache.read(('file_exist', bucket_name, file_path), self._cache_path(file_path, bucket_name), fetch)
+
+    def dir_exist(self, dir_path="", bucket_name="", cache=True):
+        fetch = lambda: self.storage.dir_exist(dir_path=dir_path) if self.storage_type == "owncloud" else self.storage.dir_exist(bucket_name=bucket_name)
+
+        if self.cache is None or not cache:
+            return fetch()
+        return self.cache.read(('dir_exist', bucket_name, dir_path), self._cache_path(dir_path, bucket_name), fetch)
+
+    def get_etag(self, file_path, bucket_name=""):
+        return self.storage.get_etag(file_path) if self.storage_type == "owncloud" else self.storage.get_etag(bucket_name=bucket_name, file_path=file_path)
+
+    def list(self, dir_path, bucket_name="", depth=1, prefix=None, recursive=False, cache=True):
+        fetch = lambda: listing_entries(self.storage.list(dir_path=dir_path, depth=depth)) if self.storage_type == "owncloud" else self.storage.list(bucket_name=bucket_name, prefix=prefix, recursive=recursive)
+
+        if self.cache is None or not cache or self.storage_type != "owncloud":
+            return fetch()
+
+        return self.cache.read(('list', bucket_name, dir_path, depth), self._cache_path(dir_path, bucket_name), fetch, sizeof=lambda items: LIST_ENTRY_SIZE * (len(items) + 1), recursive=True)
+
+    def cached(self, key, path, compute, bucket_name=""):
+        # payload computed from the content below path, e.g. a parsed listing
+        if self.cache is None:
+            return compute()
+
+        return self.cache.read(('cached',) + tuple(key), self._cache_path(path, bucket_name), compute, sizeof=lambda value: len(json.dumps(value)), recursive=True)
+
+    def get_file(self, file_path, bucket_name="", cache=True):
+        if self.cache is None or not cache:
+            return self.storage.get_file(file_path) if self.storage_type == "owncloud" else self.storage.get_file(bucket_name=bucket_name, file_path=file_path)
+
+        fetch = lambda etag: self.storage.get_file_conditional(file_path, etag) if self.storage_type == "owncloud" else self.storage.get_file_conditional(bucket_name=bucket_name, file_path=file_path, etag=etag)
+        return self.cache.read_conditional(('get_file', bucket_name, file_path), self._cache_path(file_path, bucket_name), fetch)
+
+    def get_many(self, file_paths, bucket_name="", cache=True):
+        # per path the file content or the exception raised fetching it
+        return map_concurrent(capture(lambda file_path: self.get_file(file_path, bucket_name=bucket_name, cache=cache)), file_paths)
+
+    def stat_many(self, paths, bucket_name=""):
+        # per path 'file', 'dir', None when missing, or the exception raised checking it
+        return self.storage.stat_many(paths) if self.storage_type == "owncloud" else self.storage.stat_many(bucket_name=bucket_name, file_paths=paths)
+
+    def get_range(self, file_path, start, end, bucket_name=""):
+        return self.storage.get_range(file_path, start, end) if self.storage_type == "owncloud" else self.storage.get_range(bucket_name=bucket_name, file_path=file_path, start=start, end=end)
+
     def get_link(self, file_path, bucket_name=""):
         return self.storage.get_link(file_path) if self.storage_type == "owncloud" else self.storage.get_link(bucket_name=bucket_name, file_path=file_path)
-    
+
     def mkdir(self, dir_path="", bucket_name=""):
-        return self.storage.mkdir(dir_path=dir_path) if self.storage_type == "owncloud" else self.storage.mkdir(bucket_name=bucket_name)
-    
+        result = self.storage.mkdir(dir_path=dir_path) if self.storage_type == "owncloud" else self.storage.mkdir(bucket_name=bucket_name)
+        self._invalidate(dir_path, bucket_name=bucket_name)
+        return result
+
     def copy(self, source_path="", target_path="", bucket_name="", file_name="", new_bucket_name="", new_file_name=""):
-        return self.storage.copy(source_path=source_path, target_path=target_path) if self.storage_type == "owncloud" else self.storage.copy(bucket_name=bucket_name, file_name=file_name, new_bucket_name=new_bucket_name, new_file_name=new_file_name)
-    
+        result = self.storage.copy(source_path=source_path, target_path=target_path) if self.storage_type == "owncloud" else self.storage.copy(bucket_name=bucket_name, file_name=file_name, new_bucket_name=new_bucket_name, new_file_name=new_file_name)
+        if self.storage_type == "owncloud":
+            self._invalidate(target_path)
+        else:
+            self._invalidate(file_name, bucket_name=bucket_name)
+            self._invalidate(new_file_name, bucket_name=new_bucket_name)
+        return result
+
+    def move(self, source_path, target_path, bucket_name=""):
+        result = self.storage.move(source_path, target_path) if self.storage_type == "owncloud" else self.storage.move(bucket_name=bucket_name, file_name=source_path, new_file_name=target_path)
+        self._invalidate(source_path, target_path, bucket_name=bucket_name)
+        return result
+
     def put_file(self, file_path, file_data, bucket_name="", length=-1):
-        return self.storage.put_file(file_path, file_data) if self.storage_type == "owncloud" else self.storage.put_file(bucket_name=bucket_name, file_name=file_path, file_data=file_data, length=length)
-    
+        result = self.storage.put_file(file_path, file_data) if self.storage_type == "owncloud" else self.storage.put_file(bucket_name=bucket_name, file_name=file_path, file_data=file_data, length=length)
+        self._invalidate(file_path, bucket_name=bucket_name)
+        return result
+
+    def put_many(self, files, bucket_name=""):
+        # files is a list of (file_path, file_data), per file the result or the exception raised
+        return map_concurrent(capture(lambda file: self.put_file(file[0], file[1], bucket_name=bucket_name)), files)
+
     def delete(self, file_path, bucket_name=""):
-        return self.storage.delete(file_path) if self.storage_type == "owncloud" else self.storage.delete(bucket_name=bucket_name, file_name=file_path)
\ No newline at end of file
+        result = self.storage.delete(file_path) if self.storage_type == "owncloud" else self.storage.delete(bucket_name=bucket_name, file_name=file_path)
+        self._invalidate(file_path, bucket_name=bucket_name)
+        return result
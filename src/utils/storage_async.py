@@ -0,0 +1,152 @@
+import os
+import json
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.concurrency import run_in_threadpool
+
+from utils.storage_owncloud_async import AsyncStorage_owncloud
+from utils.storage_cache import LIST_ENTRY_SIZE, listing_entries
+from utils.concurrency import gather_concurrent, capture_async
+
+
+MINIO_MAX_WORKERS = int(os.getenv('STORAGE_ASYNC_MINIO_MAX_WORKERS', 64))
+
+
+# MinIO calls run on a dedicated executor, so they do not take threads from the pool
+# serving the remaining sync code
+class AsyncStorage_minio():
+    def __init__(self, storage, max_workers=MINIO_MAX_WORKERS):
+        self.storage = storage
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='lse-minio')
+
+    def __getattr__(self, name):
+        method = getattr(self.storage, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+        return call
+
+
+# Async counterpart of utils/storage.py, wrapping a sync Storage: both share the backend
+# configuration and the cache, and the sync one stays available as storage.sync for code
+# running in threads (background tasks, manifest writes under the redis lock).
+class AsyncStorage():
+
+    def __init__(self, storage):
+        self.sync = storage
+        self.storage_type = storage.storage_type
+        self.cache = storage.cache
+
+        if self.storage_type == "owncloud":
+            self.storage = AsyncStorage_owncloud(storage.storage.pool)
+        else:
+            self.storage = AsyncStorage_minio(storage.storage)
+
+    def _cache_path(self, path, bucket_name=""):
+        return self.sync._cache_path(path, bucket_name)
+
+    def _invalidate(self, *paths, bucket_name=""):
+        self.sync._invalidate(*paths, bucket_name=bucket_name)
+
+    async def connect(self, user, password):
+        result = await run_in_threadpool(self.sync.connect, user, password)
+
+        if self.storage_type == "owncloud":
+            self.storage.connect()
+
+        return result
+
+    async def disconnect(self):
+        if self.storage_type == "owncloud":
+            await self.storage.disconnect()
+
+        return await run_in_threadpool(self.sync.disconnect)
+
+    async def file_exist(self, file_path, bucket_name="", cache=True):
+        fetch = lambda: self.storage.file_exist(file_path) if self.storage_type == "owncloud" else self.storage.file_exist(bucket_name=bucket_name, file_path=file_path)
+
+        if self.cache is None or not cache:
+            return await fetch()
+        return await self.cache.aread(('file_exist', bucket_name, file_path), self._cache_path(file_path, bucket_name), fetch)
+
+    async def dir_exist(self, dir_path="", bucket_name="", cache=True):
+        fetch = lambda: self.storage.dir_exist(dir_path=dir_path) if self.storage_type == "owncloud" else self.storage.dir_exist(bucket_name=bucket_name)
+
+        if self.cache is None or not cache:
+            return await fetch()
+        return await self.cache.aread(('dir_exist', bucket_name, dir_path), self._cache_path(dir_path, bucket_name), fetch)
+
+    async def get_etag(self, file_path, bucket_name=""):
+        return await (self.storage.get_etag(file_path) if self.storage_type == "owncloud" else self.storage.get_etag(bucket_name=bucket_name, file_path=file_path))
+
+    async def list(self, dir_path, bucket_name="", depth=1, prefix=None, recursive=False, cache=True):
+        async def fetch():
+            if self.storage_type == "owncloud":
+                return listing_entries(await self.storage.list(dir_path=dir_path, depth=depth))
+            return await self.storage.list(bucket_name=bucket_name, prefix=prefix, recursive=recursive)
+
+        if self.cache is None or not cache or self.storage_type != "owncloud":
+            return await fetch()
+
+        return await self.cache.aread(('list', bucket_name, dir_path, depth), self._cache_path(dir_path, bucket_name), fetch, sizeof=lambda items: LIST_ENTRY_SIZE * (len(items) + 1), recursive=True)
+
+    async def cached(self, key, path, compute, bucket_name=""):
+        # compute is a coroutine function, see Storage.cached
+        if self.cache is None:
+            return await compute()
+
+        return await self.cache.aread(('cached',) + tuple(key), self._cache_path(path, bucket_name), compute, sizeof=lambda value: len(json.dumps(value)), recursive=True)
+
+    async def get_file(self, file_path, bucket_name="", cache=True):
+        if self.cache is None or not cache:
+            return await (self.storage.get_file(file_path) if self.storage_type == "owncloud" else self.storage.get_file(bucket_name=bucket_name, file_path=file_path))
+
+        fetch = lambda etag: self.storage.get_file_conditional(file_path, etag) if self.storage_type == "owncloud" else self.storage.get_file_conditional(bucket_name=bucket_name, file_path=file_path, etag=etag)
+        return await self.cache.aread_conditional(('get_file', bucket_name, file_path), self._cache_path(file_path, bucket_name), fetch)
+
+    async def get_many(self, file_paths, bucket_name="", cache=True):
+        return await gather_concurrent(capture_async(lambda file_path: self.get_file(file_path, bucket_name=bucket_name, cache=cache)), file_paths)
+
+    async def stat_many(self, paths, bucket_name=""):
+        return await (self.storage.stat_many(paths) if self.storage_type == "owncloud" else self.storage.stat_many(bucket_name=bucket_name, file_paths=paths))
+
+    async def get_range(self, file_path, start, end, bucket_name=""):
+        return await (self.storage.get_range(file_path, start, end) if self.storage_type == "owncloud" else self.storage.get_range(bucket_name=bucket_name, file_path=file_path, start=start, end=end))
+
+    async def get_link(self, file_path, bucket_name=""):
+        return await (self.storage.get_link(file_path) if self.storage_type == "owncloud" else self.storage.get_link(bucket_name=bucket_name, file_path=file_path))
+
+    async def mkdir(self, dir_path="", bucket_name=""):
+        result = await (self.storage.mkdir(dir_path=dir_path) if self.storage_type == "owncloud" else self.storage.mkdir(bucket_name=bucket_name))
+        self._invalidate(dir_path, bucket_name=bucket_name)
+        return result
+
+    async def copy(self, source_path="", target_path="", bucket_name="", file_name="", new_bucket_name="", new_file_name=""):
+        result = await (self.storage.copy(source_path=source_path, target_path=target_path) if self.storage_type == "owncloud" else self.storage.copy(bucket_name=bucket_name, file_name=file_name, new_bucket_name=new_bucket_name, new_file_name=new_file_name))
+        if self.storage_type == "owncloud":
+            self._invalidate(target_path)
+        else:
+            self._invalidate(file_name, bucket_name=bucket_name)
+            self._invalidate(new_file_name, bucket_name=new_bucket_name)
+        return result
+
+    async def move(self, source_path, target_path, bucket_name=""):
+        result = await (self.storage.move(source_path, target_path) if self.storage_type == "owncloud" else self.storage.move(bucket_name=bucket_name, file_name=source_path, new_file_name=target_path))
+        self._invalidate(source_path, target_path, bucket_name=bucket_name)
+        return result
+
+    async def put_file(self, file_path, file_data, bucket_name="", length=-1):
+        result = await (self.storage.put_file(file_path, file_data) if self.storage_type == "owncloud" else self.storage.put_file(bucket_name=bucket_name, file_name=file_path, file_data=file_data, length=length))
+        self._invalidate(file_path, bucket_name=bucket_name)
+        return result
+
+    async def put_many(self, files, bucket_name=""):
+        return await gather_concurrent(capture_async(lambda file: self.put_file(file[0], file[1], bucket_name=bucket_name)), files)
+
+    async def delete(self, file_path, bucket_name=""):
+        result = await (self.storage.delete(file_path) if self.storage_type == "owncloud" else self.storage.delete(bucket_name=bucket_name, file_name=file_path))
+        self._invalidate(file_path, bucket_name=bucket_name)
+        return result
@@ -0,0 +1,199 @@
+import os
+import time
+import fnmatch
+import threading
+from collections import OrderedDict
+
+from utils.redis_cache import redis_cache_from_env
+
+# Read-through cache used by the Storage facade. Entries live for the TTL of the first rule
+# matching their path; an expired get_file entry holding an etag is revalidated with a
+# conditional request instead of being downloaded again. Listings and computed payloads are
+# recursive: they are also dropped when something below their path changes.
+#
+# An optional shared tier (utils/redis_cache.py) is looked up on a miss and written on a fetch.
+
+LIST_ENTRY_SIZE = 512
+FLAG_ENTRY_SIZE = 64
+
+
+def listing_entries(items):
+    # listings are kept as plain dicts, so the shared tier can store them as JSON
+    return [{'path': item.path, 'file_type': item.file_type} for item in items]
+
+
+def parse_ttls(rules):
+    # "lse-demo/*/data-*=0,lse-demo=300" -> [('lse-demo/*/data-*', 0), ('lse-demo', 300)]
+    ttls = []
+
+    for rule in (rules or '').split(','):
+        if '=' not in rule:
+            continue
+
+        prefix, ttl = rule.rsplit('=', 1)
+        ttls.append((prefix.strip().strip('/'), float(ttl)))
+
+    return ttls
+
+
+class StorageCache():
+    def __init__(self, max_bytes, ttl=0, ttls=None, shared=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.ttls = ttls or []
+        self.shared = shared
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_ttl(self, path):
+        for prefix, ttl in self.ttls:
+            if fnmatch.fnmatchcase(path, prefix) or fnmatch.fnmatchcase(path, prefix + '/*'):
+                return ttl
+
+        return self.ttl
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+            return entry
+
+    def _lookup(self, key, path):
+        entry = self._get(key)
+
+        if self.shared is None or (entry is not None and entry['expires'] > time.time()):
+            return entry
+
+        if self.max_bytes > 0:
+            self.shared.subscribe(self._invalidate_local, self.clear)
+
+        shared_entry = self.shared.get(key, path)
+
+        if shared_entry is not None and (entry is None or shared_entry['expires'] > entry['expires']):
+            entry = dict(shared_entry, path=path)
+            self._put(key, entry)
+
+        return entry
+
+    def _store(self, key, path, value, etag, size, recursive=False):
+        entry = {
+            'path': path,
+            'value': value,
+            'etag': etag,
+            'size': size,
+            'recursive': recursive,
+            'expires': time.time() + self.get_ttl(path)
+        }
+
+        self._put(key, entry)
+
+        if self.shared is not None:
+            self.shared.set(key, path, {name: entry[name] for name in ('value', 'etag', 'size', 'recursive', 'expires')})
+
+    def _put(self, key, entry):
+        if entry['size'] > self.max_bytes:
+            return
+
+        with self.lock:
+            self._remove(key)
+
+            self.entries[key] = entry
+            self.size += entry['size']
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry['size']
+
+    def read(self, key, path, fetch, sizeof=None, recursive=False):
+        entry = self._lookup(key, path)
+
+        if entry is not None and entry['expires'] > time.time():
+            return entry['value']
+
+        value = fetch()
+        self._store(key, path, value, None, sizeof(value) if sizeof is not None else FLAG_ENTRY_SIZE, recursive)
+        return value
+
+    def read_conditional(self, key, path, fetch):
+        # fetch(etag) returns (data, etag), data is None when the etag still matches
+        entry = self._lookup(key, path)
+
+        if entry is not None and entry['expires'] > time.time():
+            return entry['value']
+
+        data, etag = fetch(entry['etag'] if entry is not None else None)
+
+        if data is None:
+            data = entry['value']
+
+        self._store(key, path, data, etag, len(data))
+        return data
+
+    async def aread(self, key, path, fetch, sizeof=None, recursive=False):
+        entry = self._lookup(key, path)
+
+        if entry is not None and entry['expires'] > time.time():
+            return entry['value']
+
+        value = await fetch()
+        self._store(key, path, value, None, sizeof(value) if sizeof is not None else FLAG_ENTRY_SIZE, recursive)
+        return value
+
+    async def aread_conditional(self, key, path, fetch):
+        entry = self._lookup(key, path)
+
+        if entry is not None and entry['expires'] > time.time():
+            return entry['value']
+
+        data, etag = await fetch(entry['etag'] if entry is not None else None)
+
+        if data is None:
+            data = entry['value']
+
+        self._store(key, path, data, etag, len(data))
+        return data
+
+    def invalidate(self, path):
+        path = path.strip('/')
+        self._invalidate_local(path)
+
+        if self.shared is not None:
+            self.shared.invalidate(path)
+
+    def _invalidate_local(self, path):
+        # drop the path, everything below it and the recursive entries of its ancestors
+        with self.lock:
+            for key in list(self.entries.keys()):
+                entry = self.entries[key]
+                entry_path = entry['path']
+
+                if entry_path == path or entry_path.startswith(path + '/') or \
+                        (entry['recursive'] and (entry_path == '' or path.startswith(entry_path + '/'))):
+                    self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+def cache_from_env():
+    max_bytes = int(os.getenv('STORAGE_CACHE_MAX_BYTES', 0))
+    shared = redis_cache_from_env()
+
+    if max_bytes <= 0 and shared is None:
+        return None
+
+    return StorageCache(
+        max_bytes=max(max_bytes, 0),
+        ttl=float(os.getenv('STORAGE_CACHE_TTL', 5)),
+        ttls=parse_ttls(os.getenv('STORAGE_CACHE_TTLS', 'lse-demo/*/data-*=5,lse-demo/*/reductions=5,lse-demo/*/clusters=5,lse-demo=300')),
+        shared=shared
+    )
@@ -4,6 +4,7 @@ from minio.error import S3Error
 from requests.exceptions import ConnectionError
 
 from utils.retry import retry
+from utils.concurrency import map_concurrent, capture
 
 class Storage_minio():
     def __init__(self, host, access_key, secret_key):
@@ -27,6 +28,36 @@ class Storage_minio():
             print('storage exception:\n\t{}\n\t{}'.format(exception, file_path))
             return False
         
+    @retry(exceptions=(ConnectionError))
+    def get_etag(self, bucket_name, file_path):
+        try:
+            file = self.client.stat_object(bucket_name, file_path)
+            return file.etag or str(file.last_modified)
+
+        except S3Error as exception:
+            print('storage exception:\n\t{}\n\t{}'.format(exception, file_path))
+            return None
+
+    @retry(exceptions=(ConnectionError))
+    def stat(self, bucket_name, file_path):
+        try:
+            self.client.stat_object(bucket_name, file_path)
+            return 'file'
+
+        except S3Error as exception:
+            if exception.code == 'NoSuchBucket':
+                return None
+            if exception.code != 'NoSuchKey':
+                raise
+
+        # objects below the path make it a dir
+        if next(iter(self.client.list_objects(bucket_name, prefix=file_path.rstrip('/') + '/')), None) is not None:
+            return 'dir'
+        return None
+
+    def stat_many(self, bucket_name, file_paths):
+        return map_concurrent(capture(lambda file_path: self.stat(bucket_name, file_path)), file_paths)
+
     @retry(exceptions=(ConnectionError))
     def list(self, bucket_name, prefix=None, recursive=False):
         return self.client.list_objects(bucket_name, prefix=prefix, recursive=recursive)
@@ -35,6 +66,28 @@ class Storage_minio():
     def get_file(self, bucket_name, file_path):
         return self.client.get_object(bucket_name, file_path)
     
+    @retry(exceptions=(ConnectionError))
+    def get_file_conditional(self, bucket_name, file_path, etag=None):
+        current_etag = self.client.stat_object(bucket_name, file_path).etag
+        if etag is not None and etag == current_etag:
+            return None, etag
+
+        response = self.client.get_object(bucket_name, file_path)
+        try:
+            return response.read(), current_etag
+        finally:
+            response.close()
+            response.release_conn()
+    
+    @retry(exceptions=(ConnectionError))
+    def get_range(self, bucket_name, file_path, start, end):
+        response = self.client.get_object(bucket_name, file_path, offset=start, length=end - start)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+    
     @retry(exceptions=(ConnectionError))
     def get_link(self, bucket_name, file_path):
         return self.client.presigned_get_object(bucket_name, file_path)
@@ -56,6 +109,20 @@ class Storage_minio():
     def copy(self, bucket_name, file_name, new_bucket_name, new_file_name):
         return self.client.copy_object(bucket_name, file_name, CopySource(new_bucket_name, new_file_name))
     
+    @retry(exceptions=(ConnectionError))
+    def move(self, bucket_name, file_name, new_file_name):
+        # S3 has no rename: copy every object below the prefix, then delete the sources
+        prefix = file_name.rstrip('/') + '/'
+        names = [item.object_name for item in self.client.list_objects(bucket_name, prefix=prefix, recursive=True)] or [file_name]
+
+        for name in names:
+            self.client.copy_object(bucket_name, new_file_name + name[len(file_name):], CopySource(bucket_name, name))
+
+        for name in names:
+            self.client.remove_object(bucket_name, name)
+
+        return True
+
     @retry(exceptions=(ConnectionError))
     def put_file(self, bucket_name, file_name, file_data, length=-1):
         return self.client.put_object(bucket_name, file_name, data=file_data, length=length)
@@ -1,24 +1,150 @@
+import os
+import queue
+import posixpath
+import threading
+from contextlib import contextmanager
+
 import owncloud
 from owncloud import HTTPResponseError
+from urllib import parse
 from requests.exceptions import ConnectionError
 
 from utils.retry import retry
+from utils.concurrency import map_concurrent, capture
+
+
+POOL_SIZE = int(os.getenv('STORAGE_POOL_SIZE', 10))
+
+
+# owncloud.Client wraps a single requests.Session, which is not safe to share between the
+# threads serving sync routes. Clients are created lazily up to size, logged in with the
+# credentials given to connect, and checked out for a single operation, so each keeps its
+# own keep-alive connections.
+class ClientPool():
+    def __init__(self, host, size=POOL_SIZE):
+        self.host = host
+        self.size = size
+        self.credentials = None
+        self.created = 0
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    def _create(self):
+        oc = owncloud.Client(self.host)
+
+        if self.credentials is not None:
+            oc.login(*self.credentials)
+
+        return oc
+
+    def connect(self, user, password):
+        self.credentials = (user, password)
+
+        # log in a first client now, so wrong credentials fail at startup
+        with self.client():
+            pass
+
+    def disconnect(self):
+        self.credentials = None
+
+        while True:
+            try:
+                oc = self.idle.get_nowait()
+            except queue.Empty:
+                return
+
+            with self.lock:
+                self.created -= 1
+
+            oc.logout()
+
+    def _checkout(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+
+        if not create:
+            return self.idle.get()
+
+        try:
+            return self._create()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    @contextmanager
+    def client(self):
+        oc = self._checkout()
+
+        try:
+            yield oc
+        finally:
+            self.idle.put(oc)
+
+
+def plan_stat_many(paths):
+    # paths sharing a parent are answered by a single depth 1 PROPFIND of the parent, which also
+    # answers the parent itself when requested; any other path gets a depth 0 PROPFIND
+    paths = [path.strip('/') for path in paths]
+    requested = set(paths)
+
+    parents = {}
+    for path in requested:
+        parents.setdefault(posixpath.dirname(path), []).append(path)
+
+    listings = set(parent for parent, children in parents.items() if len(children) > 1 or parent in requested)
+    singles = [path for path in requested if path not in listings and posixpath.dirname(path) not in listings]
+
+    return paths, listings, singles
+
+
+def resolve_stat_many(paths, listings, singles, results):
+    # results maps each listing and single to a list of FileInfo, None when missing or an exception
+    status = {}
+
+    for listing in listings:
+        result = results[('list', listing)]
+
+        if isinstance(result, Exception):
+            status[listing] = result
+            for path in paths:
+                if posixpath.dirname(path) == listing:
+                    status.setdefault(path, result)
+            continue
+
+        status[listing] = 'dir' if result is not None else None
+        for file in result or []:
+            status.setdefault(file.path.strip('/'), file.file_type)
+
+    for path in singles:
+        result = results[('stat', path)]
+        status[path] = result if isinstance(result, Exception) else (result[0].file_type if result else None)
+
+    return [status.get(path) for path in paths]
 
 
 class Storage_owncloud():
-    def __init__(self, host):
-        self.oc = owncloud.Client(host)
+    def __init__(self, host, pool_size=POOL_SIZE):
+        self.pool = ClientPool(host, pool_size)
 
     def connect(self, user, password):
-        return self.oc.login(user, password)
+        return self.pool.connect(user, password)
 
     def disconnect(self):
-        return self.oc.logout()
+        return self.pool.disconnect()
 
     @retry(exceptions=(ConnectionError))
     def file_exist(self, file_path):
         try:
-            file = self.oc.file_info(file_path)
+            with self.pool.client() as oc:
+                file = oc.file_info(file_path)
             return file.file_type == 'file'
 
         except HTTPResponseError as exception:
@@ -28,42 +154,122 @@ class Storage_owncloud():
     @retry(exceptions=(ConnectionError))
     def dir_exist(self, dir_path):
         try:
-            dir = self.oc.file_info(dir_path)
+            with self.pool.client() as oc:
+                dir = oc.file_info(dir_path)
             return dir.file_type == 'dir'
 
         except HTTPResponseError as exception:
             print('storage exception:\n\t{}\n\t{}'.format(exception, dir_path))
             return False
 
+    @retry(exceptions=(ConnectionError))
+    def get_etag(self, file_path):
+        try:
+            with self.pool.client() as oc:
+                file = oc.file_info(file_path)
+            return file.get_etag() or str(file.get_last_modified())
+
+        except HTTPResponseError as exception:
+            print('storage exception:\n\t{}\n\t{}'.format(exception, file_path))
+            return None
+
     @retry(exceptions=(ConnectionError))
     def list(self, dir_path, depth=1):
-        return self.oc.list(dir_path, depth)
+        with self.pool.client() as oc:
+            return oc.list(dir_path, depth)
+
+    @retry(exceptions=(ConnectionError))
+    def _propfind(self, request):
+        # ('list', dir) or ('stat', path), returns a list of FileInfo, None when missing
+        operation, path = request
+
+        try:
+            with self.pool.client() as oc:
+                if operation == 'list':
+                    return oc.list(path, 1)
+
+                file = oc.file_info(path)
+                return [file] if file is not None else None
+
+        except HTTPResponseError as exception:
+            if exception.status_code == 404:
+                return None
+            raise
+
+    def stat_many(self, paths):
+        # 'file', 'dir', None when missing, or the exception of a failed request, per path
+        paths, listings, singles = plan_stat_many(paths)
+        requests = [('list', listing) for listing in listings] + [('stat', path) for path in singles]
+
+        results = dict(zip(requests, map_concurrent(capture(self._propfind), requests)))
+        return resolve_stat_many(paths, listings, singles, results)
 
     @retry(exceptions=(ConnectionError))
     def get_file(self, file_path):
-        return self.oc.get_file_contents(file_path)
+        with self.pool.client() as oc:
+            return oc.get_file_contents(file_path)
+
+    def _get(self, file_path, headers):
+        # pyocclient has no ranged or conditional download, so the request goes through its session
+        with self.pool.client() as oc:
+            path = oc._normalize_path(file_path)
+            return oc._session.get(
+                oc._webdav_url + parse.quote(oc._encode_string(path)),
+                headers=headers
+            )
+
+    @retry(exceptions=(ConnectionError))
+    def get_file_conditional(self, file_path, etag=None):
+        res = self._get(file_path, {'If-None-Match': etag} if etag else {})
+
+        if res.status_code == 304:
+            return None, etag
+        if res.status_code == 200:
+            return res.content, res.headers.get('ETag')
+        raise HTTPResponseError(res)
+
+    @retry(exceptions=(ConnectionError))
+    def get_range(self, file_path, start, end):
+        res = self._get(file_path, {'Range': 'bytes={}-{}'.format(start, end - 1)})
+
+        if res.status_code == 206:
+            return res.content
+        if res.status_code == 200:
+            return res.content[start:end]
+        raise HTTPResponseError(res)
 
     @retry(exceptions=(ConnectionError))
     def get_link(self, file_path):
-        if self.oc.is_shared(file_path):
-            return self.oc.get_shares(file_path)[0].get_link()
-        return self.oc.share_file_with_link(file_path).get_link()
+        with self.pool.client() as oc:
+            if oc.is_shared(file_path):
+                return oc.get_shares(file_path)[0].get_link()
+            return oc.share_file_with_link(file_path).get_link()
 
     @retry(exceptions=(ConnectionError))
     def mkdir(self, dir_path):
-        return self.oc.mkdir(dir_path)
+        with self.pool.client() as oc:
+            return oc.mkdir(dir_path)
 
     @retry(exceptions=(ConnectionError))
     def copy(self, source_path, target_path):
-        return self.oc.copy(source_path, target_path)
+        with self.pool.client() as oc:
+            return oc.copy(source_path, target_path)
+
+    @retry(exceptions=(ConnectionError))
+    def move(self, source_path, target_path):
+        with self.pool.client() as oc:
+            return oc.move(source_path, target_path)
 
     @retry(exceptions=(ConnectionError))
     def put_file(self, file_path, file_data):
-        return self.oc.put_file_contents(file_path, file_data)
+        with self.pool.client() as oc:
+            return oc.put_file_contents(file_path, file_data)
 
     @retry(exceptions=(ConnectionError))
     def delete(self, file_path):
-        return self.oc.delete(file_path)
+        with self.pool.client() as oc:
+            return oc.delete(file_path)
 
     def __str__(self):
-        return str(list(self.oc.get_config()))
+        with self.pool.client() as oc:
+            return str(list(oc.get_config()))
@@ -0,0 +1,219 @@
+import os
+import xml.etree.ElementTree as ET
+from urllib import parse
+
+import httpx
+from owncloud import FileInfo, HTTPResponseError
+
+from utils.retry import retry_async
+from utils.concurrency import gather_concurrent, capture_async
+from utils.storage_owncloud import plan_stat_many, resolve_stat_many
+
+
+MAX_CONNECTIONS = int(os.getenv('STORAGE_ASYNC_MAX_CONNECTIONS', 100))
+TIMEOUT = float(os.getenv('STORAGE_ASYNC_TIMEOUT', 60))
+
+OCS_SHARES_PATH = 'ocs/v1.php/apps/files_sharing/api/v1/shares'
+OCS_SHARE_TYPE_LINK = 3
+
+
+# WebDAV client on httpx mirroring Storage_owncloud, so routers can keep many requests in
+# flight without holding a thread each. The endpoint and the credentials are taken from a
+# client of the sync pool once it is logged in, so both resolve the same DAV endpoint.
+class AsyncStorage_owncloud():
+    def __init__(self, pool):
+        self.pool = pool
+        self.client = None
+
+    def connect(self):
+        with self.pool.client() as oc:
+            self.url = oc.url
+            self.davpath = oc._davpath
+            self.webdav_url = oc._webdav_url
+            auth, verify = oc._session.auth, oc._session.verify
+
+        self.client = httpx.AsyncClient(
+            auth=auth,
+            verify=verify,
+            timeout=TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+        )
+
+    async def disconnect(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _url(self, path):
+        if not path.startswith('/'):
+            path = '/' + path
+
+        return self.webdav_url + parse.quote(path)
+
+    async def _request(self, method, path, **kwargs):
+        res = await self.client.request(method, self._url(path), **kwargs)
+
+        if res.status_code >= 400:
+            raise HTTPResponseError(res)
+
+        return res
+
+    def _parse_element(self, element):
+        href = element.find('{DAV:}href').text
+        if href.startswith(self.davpath):
+            href = href[len(self.davpath):]
+        href = parse.unquote(href)
+
+        attributes = {}
+        for attribute in element.find('{DAV:}propstat').find('{DAV:}prop'):
+            attributes[attribute.tag] = attribute.text
+
+        return FileInfo(href, 'dir' if href.endswith('/') else 'file', attributes)
+
+    async def _propfind(self, path, depth):
+        res = await self._request('PROPFIND', path, headers={'Depth': str(depth)})
+        return [self._parse_element(element) for element in ET.fromstring(res.content)]
+
+    async def file_info(self, path):
+        return (await self._propfind(path, 0))[0]
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def file_exist(self, file_path):
+        try:
+            file = await self.file_info(file_path)
+            return file.file_type == 'file'
+
+        except HTTPResponseError as exception:
+            print('storage exception:\n\t{}\n\t{}'.format(exception, file_path))
+            return False
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def dir_exist(self, dir_path):
+        try:
+            dir = await self.file_info(dir_path)
+            return dir.file_type == 'dir'
+
+        except HTTPResponseError as exception:
+            print('storage exception:\n\t{}\n\t{}'.format(exception, dir_path))
+            return False
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def get_etag(self, file_path):
+        try:
+            file = await self.file_info(file_path)
+            return file.get_etag() or str(file.get_last_modified())
+
+        except HTTPResponseError as exception:
+            print('storage exception:\n\t{}\n\t{}'.format(exception, file_path))
+            return None
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def list(self, dir_path, depth=1):
+        if not dir_path.endswith('/'):
+            dir_path += '/'
+
+        # the first element is the dir itself
+        return (await self._propfind(dir_path, depth))[1:]
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def _stat_request(self, request):
+        # see Storage_owncloud._propfind
+        operation, path = request
+
+        try:
+            if operation == 'list':
+                return (await self._propfind(path.rstrip('/') + '/', 1))[1:]
+            return await self._propfind(path, 0)
+
+        except HTTPResponseError as exception:
+            if exception.status_code == 404:
+                return None
+            raise
+
+    async def stat_many(self, paths):
+        paths, listings, singles = plan_stat_many(paths)
+        requests = [('list', listing) for listing in listings] + [('stat', path) for path in singles]
+
+        results = dict(zip(requests, await gather_concurrent(capture_async(self._stat_request), requests)))
+        return resolve_stat_many(paths, listings, singles, results)
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def get_file(self, file_path):
+        return (await self._request('GET', file_path)).content
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def get_file_conditional(self, file_path, etag=None):
+        res = await self._request('GET', file_path, headers={'If-None-Match': etag} if etag else {})
+
+        if res.status_code == 304:
+            return None, etag
+        return res.content, res.headers.get('ETag')
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def get_range(self, file_path, start, end):
+        res = await self._request('GET', file_path, headers={'Range': 'bytes={}-{}'.format(start, end - 1)})
+
+        if res.status_code == 206:
+            return res.content
+        return res.content[start:end]
+
+    async def _ocs(self, method, **kwargs):
+        res = await self.client.request(method, self.url + OCS_SHARES_PATH, headers={'OCS-APIREQUEST': 'true'}, **kwargs)
+
+        if res.status_code != 200:
+            raise HTTPResponseError(res)
+
+        tree = ET.fromstring(res.content)
+        return int(tree.find('meta/statuscode').text), tree.find('data')
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def get_link(self, file_path):
+        # raises HTTPResponseError when the path does not exist
+        await self.file_info(file_path)
+
+        if not file_path.startswith('/'):
+            file_path = '/' + file_path
+
+        status, data = await self._ocs('GET', params={'path': file_path})
+        if status == 100:
+            for element in data.iter('element'):
+                url = element.find('url')
+                if url is not None and url.text:
+                    return url.text
+
+        status, data = await self._ocs('POST', data={'shareType': OCS_SHARE_TYPE_LINK, 'path': file_path})
+        if status != 100:
+            raise HTTPResponseError(status)
+
+        return data.find('url').text
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def mkdir(self, dir_path):
+        if not dir_path.endswith('/'):
+            dir_path += '/'
+
+        await self._request('MKCOL', dir_path)
+        return True
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def copy(self, source_path, target_path):
+        if target_path.endswith('/'):
+            target_path += os.path.basename(source_path)
+
+        await self._request('COPY', source_path, headers={'Destination': self._url(target_path)})
+        return True
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def move(self, source_path, target_path):
+        await self._request('MOVE', source_path, headers={'Destination': self._url(target_path)})
+        return True
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def put_file(self, file_path, file_data):
+        await self._request('PUT', file_path, content=file_data)
+        return True
+
+    @retry_async(exceptions=(httpx.TransportError))
+    async def delete(self, file_path):
+        await self._request('DELETE', file_path)
+        return True
@@ -0,0 +1,39 @@
+import os
+import itertools
+
+
+# A sweep is a request of the single result endpoints plus a grid {"<name>": [values, ...]},
+# run as one task computing a result per combination of the values. Grid names are params,
+# except the request fields given as top level, such as components.
+
+SWEEP_MAX_POINTS = int(os.getenv('SWEEP_MAX_POINTS', 50))
+
+
+def count_points(grid):
+    count = 1
+    for values in grid.values():
+        count *= len(values)
+    return count
+
+
+def expand_grid(request, grid, top_level=()):
+    names = sorted(grid)
+    points = []
+
+    for values in itertools.product(*(grid[name] for name in names)):
+        point = dict(request, params=dict(request['params']))
+
+        for name, value in zip(names, values):
+            if name in top_level:
+                point[name] = value
+            else:
+                point['params'][name] = value
+
+        points.append(point)
+
+    return points
+
+
+def parse_points(model, request, grid, top_level=()):
+    # every point validated as a request of the single result endpoint, raises ValidationError
+    return [model.parse_obj(point) for point in expand_grid(request, grid, top_level)]
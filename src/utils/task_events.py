@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import asyncio
+import threading
+
+from utils.redis_client import get_redis
+from utils.task_registry import EVENTS_CHANNEL_PREFIX, events_channel
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# A single pattern subscription per server process, fanned out to the event streams of the
+# connected clients, so an open stream costs an asyncio queue rather than a redis connection
+# and a thread each.
+
+QUEUE_SIZE = int(os.getenv('TASK_EVENTS_QUEUE_SIZE', 100))
+
+
+class TaskEvents():
+    def __init__(self):
+        self.queues = {}
+        self.loop = None
+        self.listener = None
+
+    def _start(self):
+        if self.listener is not None and self.listener.is_alive():
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self.listener = threading.Thread(target=self._listen, name='lse-task-events', daemon=True)
+        self.listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(EVENTS_CHANNEL_PREFIX + '*')
+
+                for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+
+                    # the queues are only touched on the loop, subscribe and unsubscribe change them
+                    self.loop.call_soon_threadsafe(self._dispatch, message['channel'].decode(), json.loads(message['data']))
+
+            except Exception as exception:
+                logger.warning(message='Task events listener failed: {}'.format(exception), action='task_events', subaction='subscribe', status='FAILED', resource='lse-service', userid='server')
+                time.sleep(1)
+
+    def _dispatch(self, channel, event):
+        for queue in self.queues.get(channel, ()):
+            # a client too slow to drain its queue loses the oldest events
+            if queue.full():
+                queue.get_nowait()
+
+            queue.put_nowait(event)
+
+    def subscribe(self, user_id, experiment_id):
+        self._start()
+
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.queues.setdefault(events_channel(user_id, experiment_id), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, experiment_id, queue):
+        channel = events_channel(user_id, experiment_id)
+        queues = self.queues.get(channel, set())
+        queues.discard(queue)
+
+        if not queues:
+            self.queues.pop(channel, None)
+
+
+task_events = TaskEvents()
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+
+import redis
+
+from utils.redis_client import get_redis
+
+import structlog
+
+logger = structlog.getLogger("json_logger")
+
+
+# Queued and running tasks of each (task name, user, experiment), kept up to date by celery
+# signals, so counting pending tasks is a single ZCOUNT instead of broadcasting inspect calls
+# to every worker.
+#
+# lse:tasks:<name>:<user_id>:<experiment_id>   zset of task ids, scored by their expiry
+# lse:task:<task_id>                            {"name", "user_id", "experiment_id", "state", ...}
+#
+# Entries expire after TASK_REGISTRY_TTL, so a worker killed before task_postrun does not leave
+# a task pending forever.
+#
+# Every change is also published on lse:events:<user_id>:<experiment_id>, the channel streamed
+# to clients by routers/task.py.
+
+TASK_NAMES = ('reduction', 'cluster', 'reduction_sweep', 'cluster_sweep')
+TASK_REGISTRY_TTL = int(os.getenv('TASK_REGISTRY_TTL', 24 * 60 * 60))
+
+KEY_PREFIX = 'lse:tasks:'
+TASK_KEY_PREFIX = 'lse:task:'
+EVENTS_CHANNEL_PREFIX = 'lse:events:'
+
+
+def _key(name, user_id, experiment_id):
+    return '{}{}:{}:{}'.format(KEY_PREFIX, name, user_id, experiment_id)
+
+
+def _task_key(task_id):
+    return TASK_KEY_PREFIX + task_id
+
+
+def events_channel(user_id, experiment_id):
+    return '{}{}:{}'.format(EVENTS_CHANNEL_PREFIX, user_id, experiment_id)
+
+
+def _event(task_id, task):
+    return json.dumps(dict(task, task_id=task_id))
+
+
+def get_task(task_id):
+    data = get_redis().get(_task_key(task_id))
+    return json.loads(data) if data is not None else None
+
+
+def _save(pipeline, task_id, task):
+    now = time.time()
+    key = _key(task['name'], task['user_id'], task['experiment_id'])
+
+    pipeline.set(_task_key(task_id), json.dumps(task), ex=TASK_REGISTRY_TTL)
+    pipeline.zremrangebyscore(key, '-inf', now)
+    pipeline.zadd(key, {task_id: now + TASK_REGISTRY_TTL})
+    pipeline.expire(key, TASK_REGISTRY_TTL)
+    pipeline.publish(events_channel(task['user_id'], task['experiment_id']), _event(task_id, task))
+
+
+def register_task(task_id, name, user_id, experiment_id):
+    task = {
+        'name': name,
+        'user_id': user_id,
+        'experiment_id': experiment_id,
+        'state': 'PENDING',
+        'queued': time.time()
+    }
+
+    try:
+        pipeline = get_redis().pipeline()
+        _save(pipeline, task_id, task)
+        pipeline.execute()
+    except redis.RedisError as exception:
+        logger.warning(message='Task registry write failed: {}'.format(exception), action='task_registry', subaction='register', status='FAILED', resource='lse-service', userid=user_id, task_id=task_id)
+
+
+def update_task(task_id, **fields):
+    # read and saved in one transaction, so a task unregistered in between is not brought back
+    def update(pipeline):
+        data = pipeline.get(_task_key(task_id))
+        if data is None:
+            return
+
+        task = json.loads(data)
+        task.update(fields)
+
+        pipeline.multi()
+        _save(pipeline, task_id, task)
+
+    try:
+        get_redis().transaction(update, _task_key(task_id))
+    except redis.RedisError as exception:
+        logger.warning(message='Task registry write failed: {}'.format(exception), action='task_registry', subaction='update', status='FAILED', resource='lse-service', userid='celery', task_id=task_id)
+
+
+def unregister_task(task_id, **fields):
+    # fields of the final event, as state and result_id
+    try:
+        task = get_task(task_id)
+        if task is None:
+            return
+
+        task.update(fields)
+
+        pipeline = get_redis().pipeline()
+        pipeline.zrem(_key(task['name'], task['user_id'], task['experiment_id']), task_id)
+        pipeline.delete(_task_key(task_id))
+        pipeline.publish(events_channel(task['user_id'], task['experiment_id']), _event(task_id, task))
+        pipeline.execute()
+    except redis.RedisError as exception:
+        logger.warning(message='Task registry write failed: {}'.format(exception), action='task_registry', subaction='unregister', status='FAILED', resource='lse-service', userid='celery', task_id=task_id)
+
+
+def publish_task(task_id, task):
+    # event of a task answered without running, as a deduplicated one
+    get_redis().publish(events_channel(task['user_id'], task['experiment_id']), _event(task_id, task))
+
+
+def count_tasks(name, user_id, experiment_id):
+    return get_redis().zcount(_key(name, user_id, experiment_id), time.time(), '+inf')
+
+
+def list_tasks(user_id, experiment_id):
+    # queued and running tasks of every name, with their task id
+    client = get_redis()
+    task_ids = []
+
+    for name in TASK_NAMES:
+        task_ids += [task_id.decode() for task_id in client.zrangebyscore(_key(name, user_id, experiment_id), time.time(), '+inf')]
+
+    if not task_ids:
+        return []
+
+    tasks = client.mget([_task_key(task_id) for task_id in task_ids])
+    return [dict(json.loads(task), task_id=task_id) for task_id, task in zip(task_ids, tasks) if task is not None]
@@ -0,0 +1,83 @@
+import os
+import sys
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import structlog
+from fastapi import BackgroundTasks
+
+import utils.concurrency as concurrency
+from routers.experiment import get_experiments
+
+
+# Benchmark of GET /experiments against an in-memory async storage that sleeps on every call,
+# to mimic the round trip to Nextcloud.
+#
+# cd src && PYTHONPATH=. python ../tests/benchmark/bench_get_experiments.py [experiments] [latency]
+
+
+class LatencyStorage():
+    def __init__(self, files, latency):
+        self.files = files
+        self.latency = latency
+
+    async def list(self, dir_path, depth=1):
+        await asyncio.sleep(self.latency)
+        prefix = '/{}/'.format(dir_path)
+        return [{'path': path, 'file_type': 'file'} for path in self.files if path.startswith(prefix)]
+
+    async def get_file(self, file_path):
+        await asyncio.sleep(self.latency)
+        return self.files[file_path]
+
+    async def cached(self, key, path, compute):
+        return await compute()
+
+
+def build_storage(experiments, latency):
+    metadata = json.dumps({
+        'name': 'experiment',
+        'image': {'format': 'png', 'dim': 64, 'channels': {'map': {}, 'preview': {'r': 0, 'g': 1, 'b': 2}}},
+        'dataset': {'split_threshold': 0},
+        'preprocessing': {'normalization_type': 'none'},
+        'augmentation': {'threshold': 0, 'flip_x': False, 'flip_y': False, 'rotate': {}, 'shift': {}},
+        'architecture': {'name': 'cae', 'filters': [], 'latent_dim': 32},
+        'training': {'epochs': 1, 'batch_size': 1, 'optimizer': {}, 'loss': 'mse'}
+    })
+
+    files = {}
+    for index in range(experiments):
+        files['/lse-user/experiment-{}/metadata.json'.format(index)] = metadata
+
+    return LatencyStorage(files, latency)
+
+
+def run(storage, max_concurrency):
+    concurrency.MAX_CONCURRENCY = max_concurrency
+    request = SimpleNamespace(state=SimpleNamespace(storage=storage))
+
+    start_time = time.time()
+    response = asyncio.run(get_experiments(request, BackgroundTasks(), user_id='user'))
+    elapsed = time.time() - start_time
+
+    return response, elapsed
+
+
+if __name__ == '__main__':
+    structlog.configure(logger_factory=structlog.stdlib.LoggerFactory(), wrapper_class=structlog.stdlib.BoundLogger)
+
+    experiments = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    storage = build_storage(experiments, latency)
+
+    serial, serial_elapsed = run(storage, 1)
+    concurrent, concurrent_elapsed = run(storage, int(os.getenv('STORAGE_MAX_CONCURRENCY', 8)))
+
+    assert [exp['id'] for exp in serial] == [exp['id'] for exp in concurrent]
+
+    print('experiments: {}, latency: {:.0f}ms'.format(experiments, latency * 1000))
+    print('serial:      {:.3f}s'.format(serial_elapsed))
+    print('concurrent:  {:.3f}s ({:.1f}x)'.format(concurrent_elapsed, serial_elapsed / concurrent_elapsed))
@@ -0,0 +1,74 @@
+import asyncio
+
+from utils.authorization import AuthorizationCache
+
+
+def test_authorization_cache_single_flight():
+    """
+    Test authorization cache: check the same user from concurrent requests.
+    Should run a single existence check and serve the rest from the cache
+    """
+
+    cache = AuthorizationCache(ttl=30, negative_ttl=5)
+    checks = []
+
+    async def fetch():
+        checks.append(1)
+        await asyncio.sleep(0.05)
+        return True
+
+    async def burst():
+        return await asyncio.gather(*[cache.check('user', fetch) for _ in range(8)])
+
+    results = asyncio.run(burst())
+
+    assert len(checks) == 1
+    assert all(exists for exists, _ in results)
+    assert sum(1 for _, cached in results if not cached) == 1
+
+
+def test_authorization_cache_negative_ttl():
+    """
+    Test authorization cache: check a missing user after the negative ttl.
+    Should check the user dir again
+    """
+
+    cache = AuthorizationCache(ttl=30, negative_ttl=0)
+    checks = []
+
+    async def fetch():
+        checks.append(1)
+        return False
+
+    assert asyncio.run(cache.check('user', fetch)) == (False, False)
+    assert asyncio.run(cache.check('user', fetch)) == (False, False)
+    assert len(checks) == 2
+
+
+def test_authorization_cache_single_flight_failure():
+    """
+    Test authorization cache: concurrent requests while the existence check fails.
+    Should fail every waiter with a single check, and check again on the next request
+    """
+
+    cache = AuthorizationCache(ttl=30, negative_ttl=5)
+    checks = []
+
+    async def fail():
+        checks.append(1)
+        await asyncio.sleep(0.05)
+        raise ConnectionError()
+
+    async def burst():
+        return await asyncio.gather(*[cache.check('user', fail) for _ in range(8)], return_exceptions=True)
+
+    async def succeed():
+        checks.append(1)
+        return True
+
+    results = asyncio.run(burst())
+
+    assert len(checks) == 1
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert asyncio.run(cache.check('user', succeed)) == (True, False)
+    assert len(checks) == 2
@@ -0,0 +1,68 @@
+import json
+
+from utils.bundle import pack_bundle, unpack_bundle, read_bundle
+
+
+class RangeStorage():
+    def __init__(self, data):
+        self.data = data
+        self.calls = []
+
+    def get_file(self, file_path):
+        self.calls.append(('get', None, None))
+        return self.data
+
+    def get_range(self, file_path, start, end):
+        self.calls.append(('range', start, end))
+        return self.data[start:end]
+
+
+def build_bundle(silhouettes_length):
+    return pack_bundle([
+        ('metadata', json.dumps({'algorithm': 'kmeans'})),
+        ('groups', json.dumps([0, 1, 1])),
+        ('scores', json.dumps({})),
+        ('silhouettes', json.dumps([0.5] * silhouettes_length))
+    ])
+
+
+def test_bundle_unpack():
+    """
+    Test bundle: pack every part and unpack it.
+    Should return the original parts
+    """
+
+    parts = unpack_bundle(build_bundle(3))
+
+    assert list(parts.keys()) == ['metadata', 'groups', 'scores', 'silhouettes']
+    assert json.loads(parts['groups']) == [0, 1, 1]
+    assert json.loads(parts['silhouettes']) == [0.5, 0.5, 0.5]
+
+
+def test_bundle_read_fields():
+    """
+    Test bundle: read a single part from a large bundle.
+    Should fetch the header and the part with ranged requests only
+    """
+
+    storage = RangeStorage(build_bundle(10000))
+
+    parts = read_bundle(storage, 'cluster.bundle', ['groups'])
+
+    assert json.loads(parts['groups']) == [0, 1, 1]
+    assert [call[0] for call in storage.calls] == ['range']
+
+
+def test_bundle_read_fields_span():
+    """
+    Test bundle: read the first and the last part of a large bundle.
+    Should fetch the span covering both with a second ranged request
+    """
+
+    storage = RangeStorage(build_bundle(10000))
+
+    parts = read_bundle(storage, 'cluster.bundle', ['metadata', 'silhouettes'])
+
+    assert json.loads(parts['metadata']) == {'algorithm': 'kmeans'}
+    assert len(json.loads(parts['silhouettes'])) == 10000
+    assert [call[0] for call in storage.calls] == ['range', 'range']
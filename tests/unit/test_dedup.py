@@ -0,0 +1,60 @@
+import utils.dedup as dedup
+from utils.dedup import result_key, find_result
+
+
+def test_dedup_result_key():
+    """
+    Test dedup: key the same request from two users, a different seed and different embeddings.
+    Should only share the key between the two users
+    """
+
+    request = {'algorithm': 'kmeans', 'params': {'n_clusters': 3}, 'experiment_id': 'demo-1', 'random_state': 0}
+    key = result_key('cluster', '"etag"', user_id='user-1', **request)
+
+    assert result_key('cluster', '"etag"', user_id='user-2', **request) == key
+    assert result_key('cluster', '"etag"', user_id='user-1', **dict(request, random_state=1)) != key
+    assert result_key('cluster', '"other"', user_id='user-1', **request) != key
+    assert result_key('reduction', '"etag"', user_id='user-1', **request) != key
+
+
+def test_dedup_find_result():
+    """
+    Test dedup: look a key up in results stored with and without keys.
+    Should return the latest result with the key
+    """
+
+    results = {
+        '1690000002000-aaaaaaaaaaaa': {'key': 'a'},
+        '1690000000': {'algorithm': 'kmeans'},
+        '1690000001000-bbbbbbbbbbbb': {'key': 'a'},
+        '1690000003000-cccccccccccc': {'key': 'b'}
+    }
+
+    assert find_result(results, 'a') == '1690000002000-aaaaaaaaaaaa'
+    assert find_result(results, 'c') is None
+
+
+def test_dedup_claim_key_per_user(monkeypatch):
+    """
+    Test dedup: claim the same key in a shared demo dir for two users, then again for the first.
+    Should only attach the request to the running task of the same user
+    """
+
+    class Redis():
+        values = {}
+
+        def set(self, name, value, nx=False, ex=None):
+            if nx and name in self.values:
+                return False
+            self.values[name] = value.encode()
+            return True
+
+        def get(self, name):
+            return self.values.get(name)
+
+    monkeypatch.setattr(dedup, 'get_redis', lambda: Redis())
+    monkeypatch.setattr(dedup, 'get_task', lambda task_id: {'state': 'STARTED'})
+
+    assert dedup.claim_key('lse-demo/exp/clusters', 'a', 'key', 'task-a') is None
+    assert dedup.claim_key('lse-demo/exp/clusters', 'b', 'key', 'task-b') is None
+    assert dedup.claim_key('lse-demo/exp/clusters', 'a', 'key', 'task-c') == 'task-a'
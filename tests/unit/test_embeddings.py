@@ -0,0 +1,150 @@
+import io
+import json
+
+import numpy as np
+import structlog
+
+from utils.embeddings import EmbeddingsCache, decode_binary, decode_json, load_embeddings
+import utils.shared_embeddings as shared_embeddings
+from utils.shared_embeddings import SharedEmbeddings
+
+
+# binary
+
+def test_embeddings_decode_binary():
+    """
+    Test binary embeddings: give a .npy buffer.
+    Should return the same array without copying the payload
+    """
+
+    embeddings = np.arange(12, dtype=np.float32).reshape(4, 3)
+
+    buffer = io.BytesIO()
+    np.save(buffer, embeddings)
+    data = buffer.getvalue()
+
+    decoded = decode_binary(data)
+
+    assert decoded.dtype == np.float32
+    assert decoded.shape == (4, 3)
+    assert np.array_equal(decoded, embeddings)
+    assert not decoded.flags.writeable
+
+
+def test_embeddings_decode_binary_fortran_order():
+    """
+    Test binary embeddings: give a fortran ordered .npy buffer.
+    Should return the array with the original layout
+    """
+
+    embeddings = np.asfortranarray(np.arange(6, dtype=np.float64).reshape(2, 3))
+
+    buffer = io.BytesIO()
+    np.save(buffer, embeddings)
+
+    assert np.array_equal(decode_binary(buffer.getvalue()), embeddings)
+
+
+# json
+
+def test_embeddings_decode_json():
+    """
+    Test json embeddings: give a list of lists.
+    Should return a two dimensional array
+    """
+
+    embeddings = [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]]
+
+    decoded = decode_json(json.dumps(embeddings))
+
+    assert decoded.shape == (3, 2)
+    assert np.allclose(decoded, embeddings)
+
+
+# cache
+
+def test_embeddings_cache_etag():
+    """
+    Test embeddings cache: lookup with the stored and with a changed etag.
+    Should hit on the same etag and miss once the file changed
+    """
+
+    cache = EmbeddingsCache(max_bytes=1024)
+    embeddings = np.zeros((4, 4), dtype=np.float32)
+
+    cache.put('exp/embeddings.npy', 'etag-1', embeddings)
+
+    assert cache.get('exp/embeddings.npy', 'etag-1') is embeddings
+    assert cache.get('exp/embeddings.npy', 'etag-2') is None
+    assert cache.stats()['cache_hits'] == 1
+    assert cache.stats()['cache_misses'] == 1
+
+
+def test_embeddings_cache_eviction():
+    """
+    Test embeddings cache: insert more bytes than the budget.
+    Should evict the least recently used entry
+    """
+
+    cache = EmbeddingsCache(max_bytes=128)
+
+    cache.put('a', 'etag', np.zeros(8, dtype=np.float64))
+    cache.put('b', 'etag', np.zeros(8, dtype=np.float64))
+    cache.get('a', 'etag')
+    cache.put('c', 'etag', np.zeros(8, dtype=np.float64))
+
+    assert cache.get('a', 'etag') is not None
+    assert cache.get('b', 'etag') is None
+    assert cache.get('c', 'etag') is not None
+    assert cache.stats()['cache_bytes'] == 128
+
+
+def test_embeddings_cache_oversize():
+    """
+    Test embeddings cache: insert an array larger than the budget.
+    Should not keep it and release it through on_evict
+    """
+
+    released = []
+    cache = EmbeddingsCache(max_bytes=32, on_evict=lambda file_path, etag: released.append((file_path, etag)))
+
+    cache.put('a', 'etag', np.zeros(8, dtype=np.float64))
+
+    assert cache.get('a', 'etag') is None
+    assert released == [('a', 'etag')]
+
+
+def test_embeddings_cache_shared_oversize(tmp_path, monkeypatch):
+    """
+    Test embeddings cache: two worker processes load embeddings larger than the budget from shared memory.
+    Should keep the segment mapped, so the second process attaches instead of downloading and decoding again
+    """
+
+    class Storage():
+        downloads = 0
+
+        def get_etag(self, file_path):
+            return 'etag' if file_path.endswith('.npy') else None
+
+        def get_file(self, file_path, cache=True):
+            Storage.downloads += 1
+            stream = io.BytesIO()
+            np.save(stream, np.arange(64, dtype=np.float64))
+            return stream.getvalue()
+
+    monkeypatch.setattr(shared_embeddings, 'logger', structlog.wrap_logger(structlog.ReturnLogger(), wrapper_class=structlog.stdlib.BoundLogger))
+
+    processes = []
+    for _ in range(2):
+        shared = SharedEmbeddings(directory=str(tmp_path))
+        processes.append((shared, EmbeddingsCache(max_bytes=32, on_evict=shared.release)))
+
+    for shared, cache in processes:
+        embeddings = load_embeddings(Storage(), 'exp', cache=cache, shared=shared)
+
+        assert np.array_equal(embeddings, np.arange(64))
+        assert cache.get('exp/embeddings.npy', 'etag') is embeddings
+        assert cache.stats()['cache_bytes'] == 0
+        assert cache.stats()['cache_shared_bytes'] == 512
+
+    assert Storage.downloads == 1
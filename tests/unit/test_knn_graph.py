@@ -0,0 +1,74 @@
+import numpy as np
+import structlog
+from sklearn.datasets import make_blobs
+from sklearn.neighbors import NearestNeighbors
+
+from utils.knn_graph import encode_graph, decode_graph, to_sparse_graph
+
+
+def test_knn_graph_encode():
+    """
+    Test kNN graph: encode then decode a graph.
+    Should give back the neighbours and the embeddings etag
+    """
+
+    indices = np.array([[0, 1], [1, 0], [2, 1]])
+    distances = np.array([[0.0, 1.0], [0.0, 1.0], [0.0, 2.0]], dtype=np.float32)
+
+    decoded_indices, decoded_distances, etag = decode_graph(encode_graph(indices, distances, '"abc"'))
+
+    assert (decoded_indices == indices).all()
+    assert (decoded_distances == distances).all()
+    assert etag == '"abc"'
+
+
+def test_knn_graph_sparse():
+    """
+    Test kNN graph: turn neighbours into a sparse graph.
+    Should hold the distance of every sample to each of its neighbours
+    """
+
+    indices = np.array([[0, 2], [1, 0], [2, 1]])
+    distances = np.array([[0.0, 3.0], [0.0, 1.0], [0.0, 2.0]])
+
+    graph = to_sparse_graph(indices, distances).toarray()
+
+    assert graph.shape == (3, 3)
+    assert graph[0, 2] == 3.0 and graph[1, 0] == 1.0 and graph[2, 1] == 2.0
+    assert graph[0, 1] == 0.0
+
+
+def test_knn_graph_spectral_clustering(monkeypatch):
+    """
+    Test kNN graph: cluster with spectral clustering on a nearest neighbours affinity.
+    Should load the graph with the n_neighbors of the request and fit on it, then fit on the
+    embeddings when no graph is stored
+    """
+
+    monkeypatch.setenv('STORAGE_TYPE', 'Nextcloud')
+    monkeypatch.setenv('HOST', 'http://localhost')
+
+    # the worker configures logging on import, keep the configuration of the other tests
+    config = structlog.get_config()
+    from celery_app import tasks
+    structlog.configure(**config)
+
+    embeddings, labels = make_blobs(n_samples=90, centers=3, cluster_std=0.5, random_state=0)
+    params = {'n_clusters': 3, 'affinity': 'nearest_neighbors', 'n_neighbors': 10}
+    loaded = []
+
+    def load_knn_graph(storage, experiment_dir, embeddings, metric, n_neighbors, random_state=None, on_stage=None):
+        loaded.append(n_neighbors)
+        distances, indices = NearestNeighbors(n_neighbors=n_neighbors).fit(embeddings).kneighbors(embeddings)
+        return indices, distances
+
+    monkeypatch.setattr(tasks, 'load_knn_graph', load_knn_graph)
+    clusters, _, _ = tasks.compute_clusters('spectral_clustering', params, embeddings, 'exp', 0, lambda *args, **kwargs: None)
+
+    assert loaded == [10]
+    assert len(set(zip(clusters, labels))) == 3
+
+    monkeypatch.setattr(tasks, 'load_knn_graph', lambda *args, **kwargs: None)
+    clusters, _, _ = tasks.compute_clusters('spectral_clustering', params, embeddings, 'exp', 0, lambda *args, **kwargs: None)
+
+    assert len(set(zip(clusters, labels))) == 3
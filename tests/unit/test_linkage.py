@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from models.requests.cluster import AgglomerativeClustering
+from utils.linkage import compute_linkage, count_clusters, cut_linkage, summarize_linkage
+
+
+EMBEDDINGS = np.array([[0.0, 0.0], [0.0, 1.0], [10.0, 0.0], [10.0, 1.5], [30.0, 0.0]])
+
+
+def test_linkage_cut_threshold():
+    """
+    Test linkage: cut the tree of three groups of points at a distance threshold.
+    Should undo the merges at or above the threshold only
+    """
+
+    children, distances, _ = compute_linkage(EMBEDDINGS, 'euclidean', 'single')
+
+    groups = cut_linkage(children, count_clusters(distances, 5))
+
+    assert groups[0] == groups[1]
+    assert groups[2] == groups[3]
+    assert len(set(groups)) == 3
+    assert len(set(cut_linkage(children, count_clusters(distances, 1.5)))) == 4
+
+
+def test_linkage_cut_clusters():
+    """
+    Test linkage: cut the tree in one cluster and in as many clusters as samples.
+    Should give a single group and one group per sample
+    """
+
+    children, _, _ = compute_linkage(EMBEDDINGS, 'euclidean', 'average')
+
+    assert set(cut_linkage(children, 1)) == {0}
+    assert sorted(cut_linkage(children, 10)) == [0, 1, 2, 3, 4]
+
+
+def test_linkage_summarize():
+    """
+    Test linkage: summarize the tree with three leaves.
+    Should give the sizes of the leaves and the last two merges
+    """
+
+    summary = summarize_linkage(*compute_linkage(EMBEDDINGS, 'euclidean', 'single'), leaves=3)
+
+    assert summary['samples'] == 5
+    assert sorted(summary['leaves']) == [1, 2, 2]
+    assert [merge[3] for merge in summary['merges']] == [4, 5]
+
+
+def test_linkage_request_cut():
+    """
+    Test linkage: request a cut by threshold, by number of clusters, by both and by neither.
+    Should accept exactly one of them
+    """
+
+    params = {'affinity': 'euclidean', 'linkage': 'ward'}
+
+    assert AgglomerativeClustering(distance_threshold=2, **params).n_clusters is None
+    assert AgglomerativeClustering(n_clusters=3, **params).distance_threshold is None
+
+    with pytest.raises(ValidationError):
+        AgglomerativeClustering(distance_threshold=2, n_clusters=3, **params)
+
+    with pytest.raises(ValidationError):
+        AgglomerativeClustering(**params)
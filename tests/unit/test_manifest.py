@@ -0,0 +1,89 @@
+import json
+import time
+
+from owncloud import FileInfo
+
+import redis
+import structlog
+
+import utils.constants as constants
+import utils.manifest as manifest
+from utils.manifest import parse_manifest, index_results, register_results
+from utils.storage_cache import listing_entries
+
+
+def test_manifest_parse():
+    """
+    Test manifest: give a fresh manifest.
+    Should return the results it holds
+    """
+
+    manifest = {
+        'version': constants.MANIFEST_VERSION,
+        'updated': time.time(),
+        'results': {'1690000000': {'algorithm': 'kmeans'}}
+    }
+
+    assert parse_manifest(json.dumps(manifest)) == manifest['results']
+
+
+def test_manifest_parse_stale():
+    """
+    Test manifest: give an outdated, a different version and a corrupted manifest.
+    Should consider all of them stale
+    """
+
+    outdated = {'version': constants.MANIFEST_VERSION, 'updated': 0, 'results': {}}
+    version = {'version': -1, 'updated': time.time(), 'results': {}}
+
+    assert parse_manifest(json.dumps(outdated)) is None
+    assert parse_manifest(json.dumps(version)) is None
+    assert parse_manifest('{"version": ') is None
+
+
+def test_manifest_index_results_staging():
+    """
+    Test manifest: list a complete result and a result still staged by a running task.
+    Should only index the complete result
+    """
+
+    items = listing_entries([
+        FileInfo('/clusters/1690000000/', 'dir', {}),
+        FileInfo('/clusters/1690000000/' + constants.CLUSTER_BUNDLE_FILENAME, 'file', {}),
+        FileInfo('/clusters/' + constants.STAGING_DIR_PREFIX + 'task/', 'dir', {}),
+        FileInfo('/clusters/' + constants.STAGING_DIR_PREFIX + 'task/' + constants.CLUSTER_BUNDLE_FILENAME, 'file', {})
+    ])
+
+    result_ids, metadata_paths, bundle_paths = index_results(items)
+
+    assert result_ids == ['1690000000']
+    assert list(bundle_paths) == ['1690000000']
+
+
+def test_manifest_register_results_failure(monkeypatch):
+    """
+    Test manifest: register a published result while Redis is down.
+    Should not raise, and drop the manifest so the next reader rebuilds it
+    """
+
+    class Lock():
+        def acquire(self):
+            raise redis.ConnectionError()
+
+    class Storage():
+        deleted = []
+
+        def file_exist(self, file_path, cache=True):
+            return True
+
+        def delete(self, file_path):
+            self.deleted.append(file_path)
+
+    monkeypatch.setattr(manifest, 'logger', structlog.wrap_logger(structlog.ReturnLogger(), wrapper_class=structlog.stdlib.BoundLogger))
+    monkeypatch.setattr(manifest, 'MANIFEST_RETRIES', 0)
+    monkeypatch.setattr(manifest, 'manifest_lock', lambda results_dir: Lock())
+
+    storage = Storage()
+
+    assert register_results(storage, 'lse-user/exp/clusters', {'1690000000': {}}) is False
+    assert storage.deleted == ['lse-user/exp/clusters/' + constants.MANIFEST_FILENAME]
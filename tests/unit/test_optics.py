@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from sklearn.cluster import OPTICS
+from sklearn.datasets import make_blobs
+
+from models.requests.cluster import OPTICSExtract
+from utils.optics import reachability_plot, encode_reachability, decode_reachability, extract_clusters
+
+
+EMBEDDINGS, _ = make_blobs(n_samples=200, centers=3, random_state=0)
+
+
+def test_optics_extract_dbscan():
+    """
+    Test OPTICS: extract a DBSCAN clustering from a stored reachability plot.
+    Should give the labels of OPTICS fitted with the same eps
+    """
+
+    plot = decode_reachability(encode_reachability(reachability_plot(OPTICS(min_samples=10).fit(EMBEDDINGS))))
+    expected = OPTICS(min_samples=10, cluster_method='dbscan', eps=0.8, min_cluster_size=0.1).fit_predict(EMBEDDINGS)
+
+    assert (extract_clusters(plot, 'dbscan', eps=0.8) == expected).all()
+
+
+def test_optics_extract_xi():
+    """
+    Test OPTICS: extract a xi clustering from a stored reachability plot.
+    Should give the labels of OPTICS fitted with the same xi and min_cluster_size
+    """
+
+    plot = decode_reachability(encode_reachability(reachability_plot(OPTICS(min_samples=10).fit(EMBEDDINGS))))
+    expected = OPTICS(min_samples=10, xi=0.1, min_cluster_size=0.1).fit_predict(EMBEDDINGS)
+
+    assert (extract_clusters(plot, 'xi', xi=0.1, min_cluster_size=0.1) == expected).all()
+    assert np.array_equal(plot['ordering'], OPTICS(min_samples=10).fit(EMBEDDINGS).ordering_)
+
+
+def test_optics_extract_cluster_id():
+    """
+    Test OPTICS: validate the cluster result an extraction reads from.
+    Should accept both result id shapes and reject anything else, like paths
+    """
+
+    assert OPTICSExtract(cluster_id='1690000000', cluster_method='dbscan', eps=0.8, min_cluster_size=0.1).cluster_id == '1690000000'
+    assert OPTICSExtract(cluster_id='1792318780956-adb71f9447ba', cluster_method='dbscan', eps=0.8, min_cluster_size=0.1)
+
+    for cluster_id in ['../../lse-other/exp/clusters/1', '1/../2', '']:
+        with pytest.raises(ValidationError):
+            OPTICSExtract(cluster_id=cluster_id, cluster_method='dbscan', eps=0.8, min_cluster_size=0.1)
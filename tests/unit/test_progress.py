@@ -0,0 +1,22 @@
+from utils.progress import StageReporter
+
+
+def test_stage_reporter():
+    """
+    Test stage reporter: go through two stages, reporting progress within the second.
+    Should report every update and time each stage once it is left
+    """
+
+    reports = []
+    stage = StageReporter(reports.append)
+
+    stage('downloading')
+    stage('fitting', done=1, total=2)
+    stage('fitting', done=2, total=2)
+    stages = stage.finish()
+
+    assert [report['stage'] for report in reports] == ['downloading', 'fitting', 'fitting']
+    assert list(reports[0]['stages']) == []
+    assert list(reports[1]['stages']) == ['downloading']
+    assert reports[2]['progress'] == {'done': 2, 'total': 2}
+    assert list(stages) == ['downloading', 'fitting']
@@ -0,0 +1,62 @@
+import pickle
+
+import pytest
+
+from utils.redis_cache import RedisCache, escape
+
+
+def test_redis_cache_encode():
+    """
+    Test redis cache: encode a small and a large entry.
+    Should compress only the large one and decode both back
+    """
+
+    cache = RedisCache(compress_min_bytes=1024)
+    small = {'value': b'{}', 'etag': 'etag-1', 'expires': 0}
+    large = {'value': b'{"label": 0}' * 1000, 'etag': 'etag-2', 'expires': 0}
+
+    assert cache.encode(small)[:1] == b'\x00'
+    assert cache.encode(large)[:1] == b'\x01'
+    assert len(cache.encode(large)) < len(large['value'])
+    assert cache.decode(cache.encode(small)) == small
+    assert cache.decode(cache.encode(large)) == large
+
+
+def test_redis_cache_escape():
+    """
+    Test redis cache: escape a path holding glob characters.
+    Should match the path literally
+    """
+
+    assert escape('lse-user/exp[1]*') == 'lse-user/exp\\[1\\]\\*'
+
+
+def test_redis_cache_encode_json():
+    """
+    Test redis cache: encode a listing, a payload JSON cannot represent and a forged pickle.
+    Should store the listing as JSON, refuse the others
+    """
+
+    cache = RedisCache()
+    listing = {'value': [{'path': '/lse-user/exp/', 'file_type': 'dir'}], 'etag': None, 'expires': 0}
+
+    assert b'"file_type": "dir"' in cache.encode(listing)
+    assert cache.decode(cache.encode(listing)) == listing
+
+    with pytest.raises(TypeError):
+        cache.encode({'value': {1, 2}, 'etag': None, 'expires': 0})
+
+    with pytest.raises(ValueError):
+        cache.decode(b'\x00' + pickle.dumps({'value': b''}))
+
+
+def test_redis_cache_set_oversize(monkeypatch):
+    """
+    Test redis cache: set a file larger than the size limit.
+    Should drop it before encoding, without copying or compressing the payload
+    """
+
+    cache = RedisCache(max_value_bytes=1024)
+    monkeypatch.setattr(cache, 'encode', lambda entry: pytest.fail('oversize entry encoded'))
+
+    cache.set('key', 'lse-user/exp/embeddings.npy', {'value': b'\x00' * 2048, 'etag': 'etag', 'size': 2048, 'recursive': False, 'expires': 0})
@@ -0,0 +1,31 @@
+from utils.result_id import new_result_id, result_sort_key, sort_results
+
+
+def test_result_id_unique():
+    """
+    Test result id: generate many ids within the same millisecond.
+    Should never repeat an id
+    """
+
+    ids = [new_result_id(1690000000.123) for _ in range(1000)]
+
+    assert len(set(ids)) == len(ids)
+    assert all(result_id.startswith('1690000000123-') for result_id in ids)
+
+
+def test_result_id_sort():
+    """
+    Test result id: sort new ids together with ids of results stored by the epoch second.
+    Should sort them chronologically
+    """
+
+    results = {
+        new_result_id(1690000002.5): {},
+        '1690000001': {},
+        new_result_id(1690000000.5): {},
+        '1690000003': {}
+    }
+
+    timestamps = [result_sort_key(result_id)[0] for result_id, metadata in sort_results(results)]
+
+    assert timestamps == [1690000000500, 1690000001000, 1690000002500, 1690000003000]
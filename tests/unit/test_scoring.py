@@ -0,0 +1,61 @@
+import numpy as np
+from sklearn.datasets import make_blobs
+from sklearn.metrics import silhouette_samples
+
+import utils.scoring as scoring
+from utils.scoring import score_clusters, resolve_mode
+
+
+EMBEDDINGS, LABELS = make_blobs(n_samples=300, centers=4, random_state=0)
+
+
+def test_scoring_exact():
+    """
+    Test scoring: exact mode.
+    Should give the silhouettes of sklearn, chunked or not, and one aggregate per cluster
+    """
+
+    mode, silhouettes, cluster_silhouettes, scores = score_clusters(EMBEDDINGS, LABELS, 'exact')
+    expected = silhouette_samples(EMBEDDINGS, LABELS)
+
+    assert mode == 'exact'
+    assert np.allclose(silhouettes, expected)
+    assert np.isclose(scores['silhouette_score'], expected.mean())
+    assert [aggregate['cluster'] for aggregate in cluster_silhouettes] == [0, 1, 2, 3]
+    assert all(aggregate['samples'] == aggregate['size'] and aggregate['stderr'] == 0 for aggregate in cluster_silhouettes)
+    assert np.isclose(cluster_silhouettes[0]['mean'], expected[LABELS == 0].mean())
+
+
+def test_scoring_sampled(monkeypatch):
+    """
+    Test scoring: sampled mode.
+    Should score only the sampled rows, exactly, and estimate the mean with its standard error
+    """
+
+    monkeypatch.setattr(scoring, 'SCORING_SAMPLE_SIZE', 100)
+
+    mode, silhouettes, cluster_silhouettes, scores = score_clusters(EMBEDDINGS, LABELS, 'sampled', random_state=0)
+    expected = silhouette_samples(EMBEDDINGS, LABELS)
+    rows = [row for row, value in enumerate(silhouettes) if value is not None]
+
+    assert mode == 'sampled'
+    assert len(rows) == scores['silhouette_sample_size'] == 100
+    assert np.allclose([silhouettes[row] for row in rows], expected[rows])
+    assert scores['silhouette_stderr'] > 0
+    assert abs(scores['silhouette_score'] - expected.mean()) < 4 * scores['silhouette_stderr']
+    assert sum(aggregate['samples'] for aggregate in cluster_silhouettes) == 100
+
+
+def test_scoring_modes(monkeypatch):
+    """
+    Test scoring: auto and off modes.
+    Should pick exact up to the exact limit, and compute nothing when off
+    """
+
+    monkeypatch.setattr(scoring, 'SCORING_EXACT_MAX_SAMPLES', 200)
+    monkeypatch.setattr(scoring, 'SCORING_SAMPLE_SIZE', 100)
+
+    assert resolve_mode('auto', 200) == 'exact'
+    assert resolve_mode('auto', 300) == 'sampled'
+    assert resolve_mode('sampled', 50) == 'exact'
+    assert score_clusters(EMBEDDINGS, LABELS, 'off') == ('off', [], [], {})
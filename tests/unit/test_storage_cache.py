@@ -0,0 +1,49 @@
+from utils.storage_cache import StorageCache, parse_ttls
+
+
+def test_storage_cache_ttls():
+    """
+    Test storage cache: give ordered per-prefix ttl rules.
+    Should apply the first matching rule and the default otherwise
+    """
+
+    cache = StorageCache(max_bytes=1024, ttl=5, ttls=parse_ttls('lse-demo/*/data-*=0,lse-demo=300'))
+
+    assert cache.get_ttl('lse-demo/demo-exp/metadata.json') == 300
+    assert cache.get_ttl('lse-demo/demo-exp/data-user/clusters/index.json') == 0
+    assert cache.get_ttl('lse-user/exp/labels.json') == 5
+
+
+def test_storage_cache_conditional():
+    """
+    Test storage cache: read an expired file whose etag did not change.
+    Should revalidate and keep the cached data
+    """
+
+    cache = StorageCache(max_bytes=1024, ttl=0)
+    requests = []
+
+    def fetch(etag):
+        requests.append(etag)
+        return (None, etag) if etag == 'etag-1' else (b'data', 'etag-1')
+
+    assert cache.read_conditional(('get_file', 'a'), 'a', fetch) == b'data'
+    assert cache.read_conditional(('get_file', 'a'), 'a', fetch) == b'data'
+    assert requests == [None, 'etag-1']
+
+
+def test_storage_cache_invalidate():
+    """
+    Test storage cache: write a file below a cached listing.
+    Should drop the file entries and the listing of its ancestors only
+    """
+
+    cache = StorageCache(max_bytes=4096, ttl=60)
+
+    cache.read(('list', 'lse-user'), 'lse-user', lambda: ['exp'], recursive=True)
+    cache.read(('list', 'lse-other'), 'lse-other', lambda: ['exp'], recursive=True)
+    cache.read(('file_exist', 'lse-user/exp/labels.json'), 'lse-user/exp/labels.json', lambda: False)
+
+    cache.invalidate('/lse-user/exp/labels.json')
+
+    assert set(key[1] for key in cache.entries) == {'lse-other'}
@@ -0,0 +1,65 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from owncloud import FileInfo
+
+from utils.storage_owncloud import ClientPool, plan_stat_many, resolve_stat_many
+
+
+class CountingPool(ClientPool):
+    def _create(self):
+        return object()
+
+
+def test_client_pool_checkout():
+    """
+    Test client pool: run more concurrent operations than clients.
+    Should never create more clients than the pool size nor share a client between threads
+    """
+
+    pool = CountingPool('http://storage', size=3)
+    in_use = set()
+    lock = threading.Lock()
+    shared = []
+
+    def operation(_):
+        with pool.client() as oc:
+            with lock:
+                shared.append(id(oc) in in_use)
+                in_use.add(id(oc))
+
+            time.sleep(0.01)
+
+            with lock:
+                in_use.discard(id(oc))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(operation, range(32)))
+
+    assert pool.created == 3
+    assert not any(shared)
+
+
+def test_stat_many_plan():
+    """
+    Test stat many: plan the checks of a 404 diagnosis.
+    Should list each shared parent once and stat the remaining paths alone
+    """
+
+    paths, listings, singles = plan_stat_many([
+        'lse-user/exp',
+        'lse-user/exp/clusters/1',
+        'lse-user/exp/clusters/1/metadata.json',
+        'lse-user/exp/clusters/1/scores.json'
+    ])
+
+    assert listings == {'lse-user/exp/clusters/1'}
+    assert singles == ['lse-user/exp']
+
+    results = {
+        ('list', 'lse-user/exp/clusters/1'): [FileInfo('/lse-user/exp/clusters/1/metadata.json', 'file')],
+        ('stat', 'lse-user/exp'): [FileInfo('/lse-user/exp/', 'dir')]
+    }
+
+    assert resolve_stat_many(paths, listings, singles, results) == ['dir', 'dir', 'file', None]
@@ -0,0 +1,37 @@
+import pytest
+from pydantic import ValidationError
+
+from models.requests.cluster import KMeansModel
+from models.requests.reduction import UMAPModel
+from utils.sweep import count_points, expand_grid, parse_points
+
+
+def test_sweep_expand_grid():
+    """
+    Test sweep: expand a grid over a param and a top level field.
+    Should give one request per combination, keeping the other params
+    """
+
+    request = {'algorithm': 'umap', 'components': 2, 'params': {'neighbors': 15, 'min_distance': 0.1}}
+    grid = {'neighbors': [5, 50], 'components': [2, 3]}
+
+    points = expand_grid(request, grid, top_level=('components',))
+
+    assert count_points(grid) == len(points) == 4
+    assert {(point['components'], point['params']['neighbors']) for point in points} == {(2, 5), (2, 50), (3, 5), (3, 50)}
+    assert all(point['params']['min_distance'] == 0.1 for point in points)
+    assert request['params']['neighbors'] == 15
+
+
+def test_sweep_parse_points():
+    """
+    Test sweep: validate the points of a KMeans grid, then of a grid with an out of range value.
+    Should give a model per point, then raise a validation error
+    """
+
+    clusters = parse_points(KMeansModel, {'algorithm': 'kmeans', 'params': {}}, {'n_clusters': [2, 3, 4]})
+
+    assert [cluster.params.n_clusters for cluster in clusters] == [2, 3, 4]
+
+    with pytest.raises(ValidationError):
+        parse_points(UMAPModel, {'algorithm': 'umap', 'components': 2, 'params': {}}, {'neighbors': [1]})